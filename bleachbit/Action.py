@@ -100,6 +100,13 @@ class ActionProvider:
         """Return a dictionary used to construct a deep scan"""
         raise StopIteration
 
+    def get_directories(self):
+        """Return the directories this action looks in
+
+        Worker lists each of them once per run.  See
+        FileUtilities.ListingCache."""
+        return []
+
     def get_commands(self):
         """Yield each command (which can be previewed or executed)"""
         pass
@@ -137,10 +144,11 @@ class FileActionProvider(ActionProvider):
             if not len(self.paths) == 1:
                 logger.warning(
                     'deep scan does not support multi-value variables')
-        if not any([self.object_type, self.regex, self.nregex,
-                    self.wholeregex, self.nwholeregex]):
+        self.filtered = any([self.object_type, self.regex, self.nregex,
+                             self.wholeregex, self.nwholeregex])
+        if not self.filtered:
             # If the filter is not needed, bypass it for speed.
-            self.get_paths = self._get_paths
+            self.get_entries = self._get_entries
 
     def _set_paths(self, raw_path, path_vars):
         """Set the list of paths to work on"""
@@ -160,65 +168,104 @@ class FileActionProvider(ActionProvider):
             raise StopIteration
         yield self.ds
 
+    def get_directories(self):
+        if self.search not in ('file', 'glob', 'walk.all', 'walk.files'):
+            return []
+        dirnames = []
+        for path in self.paths:
+            # the part before the first wildcard
+            dirname = os.path.dirname(path)
+            while glob.has_magic(dirname):
+                dirname = os.path.dirname(dirname)
+            if dirname:
+                dirnames.append(dirname)
+        return dirnames
+
+    def get_walk_key(self):
+        """Return the key of the walks of this action in the journal
+
+        The walks of actions with the same filters finish the same
+        directories."""
+        return repr((self.action_key, self.search, self.object_type, self.regex,
+                     self.nregex, self.wholeregex, self.nwholeregex))
+
     def path_filter(self, path):
         """Process the filters: regex, nregex, type
 
         If a filter is defined and it fails to match, this function
         returns False. Otherwise, this function returns True."""
+        return self.entry_filter(FileUtilities.PathEntry(path))
+
+    def entry_filter(self, entry):
+        """Like path_filter() but for a directory entry
+
+        The entry knows its type, so the type filter usually
+        needs no system call."""
 
         if self.regex:
-            if not self.regex_c.search(os.path.basename(path)):
+            if not self.regex_c.search(entry.name):
                 return False
 
         if self.nregex:
-            if self.nregex_c.search(os.path.basename(path)):
+            if self.nregex_c.search(entry.name):
                 return False
 
         if self.wholeregex:
-            if not self.wholeregex_c.search(path):
+            if not self.wholeregex_c.search(entry.path):
                 return False
 
         if self.nwholeregex:
-            if self.nwholeregex_c.search(path):
+            if self.nwholeregex_c.search(entry.path):
                 return False
 
         if self.object_type:
-            if 'f' == self.object_type and not os.path.isfile(path):
+            if 'f' == self.object_type and not entry.is_file():
                 return False
-            elif 'd' == self.object_type and not os.path.isdir(path):
+            elif 'd' == self.object_type and not entry.is_dir():
                 return False
 
         return True
 
+    def get_entries(self):
+        """Yield a filtered list of directory entries"""
+        for entry in self._get_entries():
+            if self.entry_filter(entry):
+                yield entry
+
     def get_paths(self):
-        import itertools
-        for f in itertools.ifilter(self.path_filter, self._get_paths()):
-            yield f
+        """Yield a filtered list of paths"""
+        for entry in self.get_entries():
+            yield entry.path
 
-    def _get_paths(self):
-        """Return a filtered list of files"""
+    def _get_entries(self):
+        """Return an unfiltered list of directory entries"""
 
         def get_file(path):
-            if os.path.lexists(path):
-                yield path
+            if FileUtilities.lexists(path):
+                yield FileUtilities.PathEntry(path)
+
+        def get_glob(pathname):
+            for path in FileUtilities.iglob(pathname):
+                yield FileUtilities.PathEntry(path)
 
         def get_walk_all(top):
-            for expanded in glob.iglob(top):
-                for path in FileUtilities.children_in_directory(
-                        expanded, True):
-                    yield path
+            for expanded in FileUtilities.iglob(top):
+                for entry in FileUtilities.walk_entries(expanded, True, True, walk_key):
+                    yield entry
 
         def get_walk_files(top):
-            for expanded in glob.iglob(top):
-                for path in FileUtilities.children_in_directory(expanded, False):
-                    yield path
+            for expanded in FileUtilities.iglob(top):
+                for entry in FileUtilities.walk_entries(expanded, False, key=walk_key):
+                    yield entry
+
+        walk_key = self.get_walk_key()
 
         if 'deep' == self.search:
             raise StopIteration
         elif 'file' == self.search:
             func = get_file
         elif 'glob' == self.search:
-            func = glob.iglob
+            func = get_glob
         elif 'walk.all' == self.search:
             func = get_walk_all
         elif 'walk.files' == self.search:
@@ -239,8 +286,8 @@ class FileActionProvider(ActionProvider):
             self.nwholeregex_c = re.compile(self.nwholeregex, re_flags)
 
         for input_path in self.paths:
-            for path in func(input_path):
-                yield path
+            for entry in func(input_path):
+                yield entry
 
     def get_commands(self):
         raise NotImplementedError('not implemented')
@@ -370,8 +417,15 @@ class Delete(FileActionProvider):
     action_key = 'delete'
 
     def get_commands(self):
-        for path in self.get_paths():
-            yield Command.Delete(path)
+        if 'walk.all' == self.search and not self.filtered:
+            # everything under each directory goes, so delete it as a whole
+            walk_key = self.get_walk_key()
+            for input_path in self.paths:
+                for expanded in FileUtilities.iglob(input_path):
+                    yield Command.DeleteTree(expanded, walk_key)
+            return
+        for entry in self.get_entries():
+            yield Command.Delete(entry.path, entry)
 
 
 class Ini(FileActionProvider):
@@ -484,8 +538,8 @@ class Shred(FileActionProvider):
     action_key = 'shred'
 
     def get_commands(self):
-        for path in self.get_paths():
-            yield Command.Shred(path)
+        for entry in self.get_entries():
+            yield Command.Shred(entry.path, entry)
 
 
 class SqliteVacuum(FileActionProvider):
@@ -511,8 +565,8 @@ class Truncate(FileActionProvider):
     action_key = 'truncate'
 
     def get_commands(self):
-        for path in self.get_paths():
-            yield Command.Truncate(path)
+        for entry in self.get_entries():
+            yield Command.Truncate(entry.path, entry)
 
 
 class WinShellChangeNotify(ActionProvider):
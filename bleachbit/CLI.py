@@ -25,9 +25,10 @@ Command line interface
 from __future__ import absolute_import, print_function
 
 from bleachbit.Cleaner import backends, create_simple_cleaner, register_cleaners
-from bleachbit import _, APP_VERSION, encoding
-from bleachbit import Diagnostic, Options, Worker
+from bleachbit import _, APP_VERSION, encoding, options_dir
+from bleachbit import Diagnostic, FileUtilities, Journal, Options, Plan, Purge, Worker
 
+import json
 import logging
 import optparse
 import os
@@ -67,6 +68,47 @@ class CliCallback:
         pass
 
 
+class NdjsonCallback(CliCallback):
+
+    """Write the events of Worker as JSON, one record per line
+
+    Each command result, error, cleaner option total and the final
+    totals is a record with a 'type', and it is written as soon as it
+    is known, so a reader does not need to wait for the end of the run
+    or parse the text log."""
+
+    def __init__(self, stream=None):
+        CliCallback.__init__(self)
+        self.stream = stream or sys.stdout
+
+    def append_event(self, event):
+        """Write a record"""
+        self.stream.write(json.dumps(event, sort_keys=True) + '\n')
+        self.stream.flush()
+
+    def append_text(self, msg, tag=None):
+        """Write a message, such as an error or the final totals"""
+        msg = msg.strip('\n')
+        if msg:
+            self.append_event({'type': 'message', 'tag': tag, 'text': msg})
+
+    def update_item_size(self, op, opid, size):
+        """Write the total of a cleaner option (or of a cleaner when opid is -1)"""
+        if -1 == opid:
+            self.append_event({'type': 'cleaner', 'cleaner': op, 'size': size})
+        else:
+            self.append_event({'type': 'option', 'option': '%s.%s' % (op, opid),
+                               'size': size})
+
+    def worker_done(self, worker, really_delete):
+        """Write the totals of the run"""
+        self.append_event({'type': 'done', 'really_delete': really_delete,
+                           'size': worker.total_bytes,
+                           'n_deleted': worker.total_deleted,
+                           'n_special': worker.total_special,
+                           'n_errors': worker.total_errors})
+
+
 def cleaners_list():
     """Yield each cleaner-option pair"""
     register_cleaners()
@@ -82,12 +124,68 @@ def list_cleaners():
         print (cleaner)
 
 
-def preview_or_clean(operations, really_clean):
-    """Preview deletes and other changes"""
-    cb = CliCallback()
-    worker = Worker.Worker(cb, really_clean, operations).run()
-    while worker.next():
-        pass
+def preview_or_clean(operations, really_clean, jobs=1, summary=False, output_format='text',
+                     plan=None, save_plan=None, journal=None, queue_depth=0,
+                     purge_manifest=None):
+    """Preview deletes and other changes
+
+    plan: a Plan.Plan to run instead of scanning the cleaners
+    save_plan: pathname to save the commands to, for --execute-plan
+    journal: a Journal.Journal for --resume
+    queue_depth: threads for each device (see Worker.DeviceScheduler)
+    purge_manifest: a Purge.Manifest for --background-purge"""
+    if 'ndjson' == output_format:
+        cb = NdjsonCallback()
+    else:
+        cb = CliCallback()
+    plan_writer = None
+    if save_plan:
+        plan_writer = Plan.PlanWriter(save_plan, operations)
+    worker = Worker.Worker(cb, really_clean, operations, jobs, summary,
+                           plan=plan, plan_writer=plan_writer, journal=journal,
+                           queue_depth=queue_depth, purge_manifest=purge_manifest)
+    try:
+        worker.run_headless()
+    finally:
+        if plan_writer is not None:
+            plan_writer.close()
+    if plan is not None and plan.n_changed:
+        logger.warning(_("Skipped %d items which changed after the preview"), plan.n_changed)
+
+
+def open_journal(resume):
+    """Return the journal for --journal, or None if it cannot be written
+
+    With resume, load the journal of the interrupted clean, which goes
+    on recording to it."""
+    journal = Journal.Journal(os.path.join(options_dir, 'clean.journal'))
+    if resume:
+        journal.load()
+        return journal
+    if not os.path.isdir(options_dir):
+        logger.debug('not keeping a journal, because %s does not exist', options_dir)
+        return None
+    return journal
+
+
+def open_purge_manifest(background_purge):
+    """Return the manifest for --background-purge, or None
+
+    Without background_purge, this still starts the purger if an
+    earlier run left staged directories."""
+    if 'posix' != os.name:
+        if background_purge:
+            logger.warning(_("--background-purge is not supported on this operating system"))
+        return None
+    pathname = os.path.join(options_dir, 'purge.manifest')
+    if not background_purge:
+        Purge.resume(pathname)
+        return None
+    if not os.path.isdir(options_dir):
+        logger.debug('not staging, because %s does not exist', options_dir)
+        Purge.resume(pathname)
+        return None
+    return Purge.Manifest(pathname)
 
 
 def args_to_operations(args, preset):
@@ -146,6 +244,30 @@ def process_cmd_line():
                       help=_("show system information"))
     parser.add_option("--gui", action="store_true",
                       help=_("launch the graphical interface"))
+    parser.add_option("-j", "--jobs", type="int", default=1, metavar="N",
+                      help=_("run up to N cleaner options at the same time, and deep scan with N threads"))
+    parser.add_option("--queue-depth", type="int", default=0, metavar="N",
+                      help=_("run the commands with a queue for each disk, and up to N at the same time on each disk which is not a spinning disk"))
+    parser.add_option("--max-write-rate", metavar="RATE",
+                      help=_("overwrite at most RATE bytes per second, such as 10MB"))
+    parser.add_option("--max-unlink-rate", type="float", metavar="N",
+                      help=_("delete at most N files per second"))
+    parser.add_option("--nice", action="store_true",
+                      help=_("run with the lowest CPU and disk priority"))
+    parser.add_option("--summary", action="store_true",
+                      help=_("show totals by cleaner option and folder and the largest items instead of each file"))
+    parser.add_option("--format", type="choice", choices=['text', 'ndjson'], default='text',
+                      help=_("output format: text, or ndjson for one JSON record per line"))
+    parser.add_option("--save-plan", metavar="FILE",
+                      help=_("with --preview, save the files to delete to FILE"))
+    parser.add_option("--execute-plan", metavar="FILE",
+                      help=_("with --clean, delete the files saved in FILE instead of scanning again"))
+    parser.add_option("--journal", action="store_true",
+                      help=_("with --clean, record the progress so an interrupted clean can be resumed"))
+    parser.add_option("--resume", action="store_true",
+                      help=_("with --clean, continue the clean which was interrupted"))
+    parser.add_option("--background-purge", action="store_true",
+                      help=_("with --clean, move folders aside at once and delete them in the background"))
     parser.add_option('--exit', action='store_true',
                       help=optparse.SUPPRESS_HELP)
     if 'nt' == os.name:
@@ -195,20 +317,80 @@ There is NO WARRANTY, to the extent permitted by law.""" % APP_VERSION)
         from bleachbit.CleanerML import create_pot
         create_pot()
         sys.exit(0)
-    if options.preview or options.clean:
+    if options.save_plan and not options.preview:
+        parser.error(_("--save-plan requires --preview"))
+    if options.execute_plan and not options.clean:
+        parser.error(_("--execute-plan requires --clean"))
+    if options.journal and not options.clean:
+        parser.error(_("--journal requires --clean"))
+    if options.resume and not options.clean:
+        parser.error(_("--resume requires --clean"))
+    if options.resume and options.execute_plan:
+        parser.error(_("--resume cannot be used with --execute-plan"))
+    if options.background_purge and not options.clean:
+        parser.error(_("--background-purge requires --clean"))
+    plan = None
+    journal = None
+    if options.resume:
+        register_cleaners()
+        try:
+            journal = open_journal(True)
+        except IOError:
+            logger.error(_("There is no interrupted clean to resume."))
+            sys.exit(1)
+        except ValueError as e:
+            logger.error(_("Cannot read the journal: %s"), e)
+            sys.exit(1)
+        operations = journal.operations
+    elif options.execute_plan:
+        register_cleaners()
+        try:
+            plan = Plan.Plan(options.execute_plan)
+        except (IOError, ValueError) as e:
+            logger.error(_("Cannot read the plan: %s"), e)
+            sys.exit(1)
+        operations = plan.operations
+    elif options.preview or options.clean:
         operations = args_to_operations(args, options.preset)
         if not operations:
             logger.error('No work to do. Specify options.')
             sys.exit(1)
+    if options.jobs < 1:
+        parser.error(_("--jobs must be at least 1"))
+    if options.queue_depth < 0:
+        parser.error(_("--queue-depth must not be negative"))
+    if options.max_write_rate or options.max_unlink_rate:
+        bytes_per_second = None
+        if options.max_write_rate:
+            try:
+                bytes_per_second = FileUtilities.human_to_bytes(options.max_write_rate)
+            except ValueError:
+                parser.error(_("--max-write-rate must be a size such as 10MB"))
+        if options.max_unlink_rate is not None and options.max_unlink_rate <= 0:
+            parser.error(_("--max-unlink-rate must be positive"))
+        FileUtilities.throttle.configure(bytes_per_second, options.max_unlink_rate)
+    if options.nice:
+        if 'posix' == os.name:
+            from bleachbit import Unix
+            if not Unix.set_low_priority():
+                logger.warning(_("Could not lower the disk priority"))
+        else:
+            logger.warning(_("--nice is not supported on this operating system"))
     if options.preview:
-        preview_or_clean(operations, False)
+        preview_or_clean(operations, False, options.jobs, options.summary, options.format,
+                         save_plan=options.save_plan, queue_depth=options.queue_depth)
         sys.exit(0)
     if options.overwrite:
         if not options.clean or options.shred:
             logger.warning('--overwrite is intended only for use with --clean')
         Options.options.set('shred', True, commit=False)
     if options.clean:
-        preview_or_clean(operations, True)
+        if journal is None and options.journal:
+            journal = open_journal(False)
+        purge_manifest = open_purge_manifest(options.background_purge)
+        preview_or_clean(operations, True, options.jobs, options.summary, options.format,
+                         plan=plan, journal=journal, queue_depth=options.queue_depth,
+                         purge_manifest=purge_manifest)
         sys.exit(0)
     if options.gui:
         import gtk
@@ -226,7 +408,7 @@ There is NO WARRANTY, to the extent permitted by law.""" % APP_VERSION)
         # create a temporary cleaner object
         backends['_gui'] = create_simple_cleaner(args)
         operations = {'_gui': ['files']}
-        preview_or_clean(operations, True)
+        preview_or_clean(operations, True, queue_depth=options.queue_depth)
         sys.exit(0)
     if options.sysinfo:
         print(Diagnostic.diagnostic_info())
@@ -72,6 +72,7 @@ class Cleaner:
  
     def __init__(self):                      # 생성자
         self.actions = []                    # 메서드들을 초기화 및 생성
+        self.option_actions = {}             # index of actions by option_id
         self.id = None
         self.description = None
         self.name = None
@@ -85,6 +86,7 @@ class Cleaner:
         for ''option_id'.  The actions must implement list_files and
         other_cleanup()"""  
         self.actions += ((option_id, action), )                          # cleaner의 action 메서드에 option_id와 action 추가
+        self.option_actions.setdefault(option_id, []).append(action)
 
     def add_option(self, option_id, name, description):        
         """Register option (such as 'cache')"""              # cache와 같은 option을 등록하는 함수
@@ -113,21 +115,18 @@ class Cleaner:
 
     def get_commands(self, option_id):
         """Get list of Command instances for option 'option_id'""" # 옵션option_id 에대한 명령 인스턴스 목록을 가져오는 함수.
-        for action in self.actions: # actions리스트에 있는 값 반복
-            if option_id == action[0]: # option_id의 값이 actions리스트의 있는 값의 첫번째요소 일경우
-                for cmd in action[1].get_commands(): 
-                    yield cmd                         # action[1]의 command를 추출해서 반복하고 return
+        for action in self.option_actions.get(option_id, ()): # option_id의 action 반복
+            for cmd in action.get_commands():
+                yield cmd                         # action의 command를 추출해서 반복하고 return
         if option_id not in self.options:             # options 딕셔너리에 option_id가 없을경우
             raise RuntimeError("Unknown option '%s'" % option_id)  # 알수없는 option이라는 에러를 발생시킴
 
     def get_deep_scan(self, option_id):
         """Get dictionary used to build a deep scan"""  # 딥스캔을 빌드하기위해 사용된 딕셔너리를 가져오는 함수.
-        for action in self.actions:  # actions의 리스트값 반복
-            if option_id == action[0]: # 반복하는 값이 option_id와 일치하면 
-                for ds in action[1].get_deep_scan(): # action[1]에서 딥스캔을 빌드하기위해 사용된 딕셔너리를 반복하고 return
-                    yield ds 
-                                                # add_action 함수에 의해 actions는 (option_id, action) 으로 구성된다.
-                                                # 따라서 action[0] 는 add_action에 의해 추가된 option_id를 나타내고 action[1] = action
+        for action in self.option_actions.get(option_id, ()):  # option_id의 action 반복
+            for ds in action.get_deep_scan(): # action에서 딥스캔을 빌드하기위해 사용된 딕셔너리를 반복하고 return
+                yield ds 
+                                                # add_action 함수에 의해 option_actions는 option_id별 action의 목록으로 구성된다.
         if option_id not in self.options: # opntions 딕셔너리에 option_id가 없으면 
             raise RuntimeError("Unknown option '%s'" % option_id)   # 런타임에러 발생
  
@@ -182,8 +181,13 @@ class Cleaner:
             elif 'pathname' == test:                # test 
                 expanded = expanduser(expandvars(pathname)) # pathname 안에 환경변수가 있으면 확장하고 현재 사용자 디렉토리의 절대경로로 대체
                                                             # ex) C:\\Documents and Settings\\Administrator\\pathname 
-                for globbed in glob.iglob(expanded):  # iglob() : expanded의 모든 값을 실제로 동시에 저장하지 않고
-                                                      #  glob()값과 동일한 값을 산출하는 반복기를 반환함
+                if 'posix' == os.name:
+                    # 프로세스 스냅샷에 함께 저장된 결과를 재사용함
+                    globbed_paths = Unix.process_snapshot.glob(expanded)
+                else:
+                    globbed_paths = glob.iglob(expanded)  # iglob() : expanded의 모든 값을 실제로 동시에 저장하지 않고
+                                                          #  glob()값과 동일한 값을 산출하는 반복기를 반환함
+                for globbed in globbed_paths:
                     if os.path.exists(globbed): # globbed로 저장한 경로에 특정파일이 존재하는지 확인
                         logger.debug(
                             "file '%s' exists indicating '%s' is running", globbed, self.name)
@@ -405,8 +409,8 @@ class System(Cleaner):
                     yield Command.Delete(c_path) # file타입일 경우 삭제
                 elif 'folder' == c_type:
                     yield Command.Delete(c_path) # folder타입일 경우 삭제
-                    for path in children_in_directory(c_path, True):  # c_path(사용자 정의 경로)의 파일 및 선택적으로 하위 디렉토리 반복
-                        yield Command.Delete(path) # 반복되는 파일 및 하위 디렉토리 삭제
+                    for entry in FileUtilities.walk_entries(c_path, True, True):  # c_path(사용자 정의 경로)의 파일 및 선택적으로 하위 디렉토리 반복
+                        yield Command.Delete(entry.path, entry) # 반복되는 파일 및 하위 디렉토리 삭제 (부모 디렉토리 기준으로 삭제)
                 else:
                     raise RuntimeError(    # 파일도 폴더도 아닐경우 런타임에러 발생
                         'custom folder has invalid type %s' % c_type)
@@ -536,14 +540,17 @@ class System(Cleaner):
         if 'posix' == os.name and 'tmp' == option_id: # 운영체제가 posix이고 option_id가 tmp ( 임시파일) 일때
             dirnames = ['/tmp', '/var/tmp'] # 경로 저장
             for dirname in dirnames: # 임시파일의 경로 반복
-                for path in children_in_directory(dirname, True): # 경로의 파일 및 하위 디렉토리 반복
+                for entry in FileUtilities.walk_entries(dirname, True): # 경로의 파일 및 하위 디렉토리 반복
+                    path = entry.path
+                    FileUtilities.stat_cache.prime_entry(entry)
                     is_open = FileUtilities.openfiles.is_open(path)  # path의 파일이 열려있는지 여부 
-                    ok = not is_open and os.path.isfile(path) and # path의 파일이 열려있지 않고 path가 존재하며
-                        not os.path.islink(path) and \ # path가 link파일 혹은 폴더가 아니고
-                        FileUtilities.ego_owner(path) and \ # 현재 사용자가 파일을 소유하고 있고
-                        not self.whitelisted(path) # path가 화이트리스트인지 확인 
+                    ok = not is_open and \
+                        entry.is_file(follow_symlinks=False) and \
+                        FileUtilities.ego_owner(path) and \
+                        not self.whitelisted(path)
+                    # path가 열려있지 않고, link가 아닌 일반 파일이며, 현재 사용자가 소유하고, 화이트리스트가 아닌지 확인
                     if ok:
-                        yield Command.Delete(path) # path 삭제
+                        yield Command.Delete(path, entry) # path 삭제
 
         # temporary files
         if 'nt' == os.name and 'tmp' == option_id:         # os가 윈도우일때 임시파일 삭제
@@ -570,25 +577,25 @@ class System(Cleaner):
         # trash
         if 'posix' == os.name and 'trash' == option_id:     # posix에서 option_id가 trash일때 
             dirname = expanduser("~/.Trash") # ~/.Trash에서 "~"을 사용자 디렉토리로 대체 
-            for filename in children_in_directory(dirname, False): # 사용자 디렉토리/.Trash 의 파일및 하위디렉토리 삭제
-                yield Command.Delete(filename)
+            for entry in FileUtilities.walk_entries(dirname, False): # 사용자 디렉토리/.Trash 의 파일및 하위디렉토리 삭제
+                yield Command.Delete(entry.path, entry)
             # fixme http://www.ramendik.ru/docs/trashspec.html
             # http://standards.freedesktop.org/basedir-spec/basedir-spec-0.6.html
             # ~/.local/share/Trash
             # * GNOME 2.22, Fedora 9
             # * KDE 4.1.3, Ubuntu 8.10
             dirname = expanduser("~/.local/share/Trash/files") # 경로 확장
-            for filename in children_in_directory(dirname, True): # 경로의 파일 및 하위 디렉토리 삭제
-                yield Command.Delete(filename)
+            for entry in FileUtilities.walk_entries(dirname, True): # 경로의 파일 및 하위 디렉토리 삭제
+                yield Command.Delete(entry.path, entry)
             dirname = expanduser("~/.local/share/Trash/info") # 경로 확장
-            for filename in children_in_directory(dirname, True): # 경로의 파일 및 하위 디렉토리 삭제
-                yield Command.Delete(filename)
+            for entry in FileUtilities.walk_entries(dirname, True): # 경로의 파일 및 하위 디렉토리 삭제
+                yield Command.Delete(entry.path, entry)
             dirname = expanduser("~/.local/share/Trash/expunged")
             # desrt@irc.gimpnet.org tells me that the trash
             # backend puts files in here temporary, but in some situations
             # the files are stuck.
-            for filename in children_in_directory(dirname, True):
-                yield Command.Delete(filename)
+            for entry in FileUtilities.walk_entries(dirname, True):
+                yield Command.Delete(entry.path, entry)
 
         # clipboard
         if HAVE_GTK and 'clipboard' == option_id:   # GTK모듈을 불러오고 option_id가 클립보드이면 
@@ -756,8 +763,8 @@ def create_simple_cleaner(paths):
                 if not os.path.isabs(path): # 만약 path가 절대경로가 아니면 
                     path = os.path.abspath(path) # path를 절대경로로 바꾼다.
                 if os.path.isdir(path): # 만약 path가 디렉토리이면 
-                    for child in children_in_directory(path, True): 
-                        yield Command.Shred(child) # path의 파일 및 하위 디렉토리를 잘라낸다.
+                    for child in FileUtilities.walk_entries(path, True, True):
+                        yield Command.Shred(child.path, child) # path의 파일 및 하위 디렉토리를 잘라낸다.
                     yield Command.Shred(path) # path를 잘라낸다      -> 디렉토리와 디렉토리의 내용까지 다 잘라내는 코드
                 else:
                     yield Command.Shred(path) # path가 디렉토리가 아니면 path를 잘라냄   -> 파일일 경우 파일만 잘라내는 코드
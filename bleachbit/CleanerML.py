@@ -32,8 +32,10 @@ from bleachbit.FileUtilities import expand_glob_join, listdir
 from bleachbit import Cleaner
 
 import logging
+import marshal
 import os
 import sys
+import xml.dom
 import xml.dom.minidom
 #모듈을 불러온다.
 
@@ -41,15 +43,74 @@ logger = logging.getLogger(__name__)
 #logging모듈의 getLogger함수를 써서 __name__의 로거 추출
 
 
+class CachedText:
+
+    """A text node rehydrated from the cache"""
+
+    nodeType = xml.dom.Node.TEXT_NODE
+    TEXT_NODE = xml.dom.Node.TEXT_NODE
+
+    def __init__(self, data):
+        self.data = data
+
+
+class CachedElement:
+
+    """An element rehydrated from the cache
+
+    It has the parts of the xml.dom.minidom interface which CleanerML
+    and the action providers use."""
+
+    nodeType = xml.dom.Node.ELEMENT_NODE
+    TEXT_NODE = xml.dom.Node.TEXT_NODE
+    ELEMENT_NODE = xml.dom.Node.ELEMENT_NODE
+
+    def __init__(self, tree, parentNode=None):
+        """Create from a tree made by compile_element()"""
+        self.tagName, self.attrs, children = tree
+        self.nodeName = self.tagName
+        self.parentNode = parentNode
+        self.childNodes = []
+        for child in children:
+            if isinstance(child, tuple):
+                self.childNodes.append(CachedElement(child, self))
+            else:
+                self.childNodes.append(CachedText(child))
+
+    def getAttribute(self, name):
+        return self.attrs.get(name, u'')
+
+    def getElementsByTagName(self, name):
+        """Return the descendants with the tag name in document order"""
+        ret = []
+        for child in self.childNodes:
+            if child.nodeType == self.ELEMENT_NODE:
+                if child.tagName == name:
+                    ret.append(child)
+                ret += child.getElementsByTagName(name)
+        return ret
+
+    def toxml(self):
+        attrs = ''.join(' %s="%s"' % item for item in sorted(self.attrs.items()))
+        inner = ''.join(child.toxml() if child.nodeType == self.ELEMENT_NODE
+                        else child.data for child in self.childNodes)
+        return '<%s%s>%s</%s>' % (self.tagName, attrs, inner, self.tagName)
+
+
 class CleanerML:
 
     """Create a cleaner from CleanerML"""
 
-    def __init__(self, pathname, xlate_cb=None):
+    def __init__(self, pathname, xlate_cb=None, tree=None):
         """Create cleaner from XML in pathname.
 
         If xlate_cb is set, use it as a callback for each
         translate-able string.
+
+        If tree is set, it is the cached tree of pathname from
+        compile_element(), and the XML is not parsed.  After creating
+        the cleaner from XML, self.tree is the tree to cache, or None
+        if the file cannot be cached.
         """
 
         self.action = None
@@ -68,11 +129,35 @@ class CleanerML:
         else:
             self.xlate_mode = True
             #xlate_cb가 None이 아니면 xlate_mode는 True가 된다.
-        dom = xml.dom.minidom.parse(pathname)
-        #xml형식으로된 pathname을 xml파싱이 가능한 형식으로 변형해서 dom에 저장
-        self.handle_cleaner(dom.getElementsByTagName('cleaner')[0])
+        self.tree = tree
+        if tree is not None:
+            cleaner = CachedElement(tree)
+        else:
+            dom = xml.dom.minidom.parse(pathname)
+            #xml형식으로된 pathname을 xml파싱이 가능한 형식으로 변형해서 dom에 저장
+            cleaner = dom.getElementsByTagName('cleaner')[0]
+            # cleaner태그의 첫번째 요소
+            if not self.xlate_mode and not cleaner.getElementsByTagName('localizations'):
+                # Unix.locales needs the full DOM of <localizations>
+                self.tree = self.compile_element(cleaner)
+        self.handle_cleaner(cleaner)
         # handle_cleaner함수에 cleaner태그의 첫번째 요소를 변수로 사용
 
+    def compile_element(self, element):
+        """Return an element as nested tuples for the cache
+
+        Children for other operating systems are left out, and so are
+        comments."""
+        children = []
+        for child in element.childNodes:
+            if child.nodeType == child.TEXT_NODE:
+                children.append(child.data)
+            elif child.nodeType == child.ELEMENT_NODE:
+                if self.os_match(child.getAttribute('os')):
+                    children.append(self.compile_element(child))
+        attrs = dict((name, value) for name, value in element.attributes.items())
+        return (element.tagName, attrs, tuple(children))
+
     def get_cleaner(self):
         """Return the created cleaner"""
         return self.cleaner
@@ -339,11 +424,90 @@ def list_cleanerml_files(local_only=False):
         yield pathname # 경로 반환
 
 
+class CleanerMLCache:
+
+    """Cache of parsed CleanerML files
+
+    The cache holds the tree of each file from
+    CleanerML.compile_element(), so the XML is parsed again only after
+    the file changes.  A file is identified by its path, modification
+    time and size, and the whole cache by the application version,
+    the platform and the Python version."""
+
+    def __init__(self, pathname):
+        self.pathname = pathname
+        self.key = (bleachbit.APP_VERSION, sys.platform,
+                    tuple(sys.version_info[:2]))
+        self.files = {}
+        self.seen = set()
+        self.dirty = False
+
+    def load(self):
+        """Read the cache file, if it is valid"""
+        try:
+            with open(self.pathname, 'rb') as f:
+                key, files = marshal.load(f)
+        except (IOError, OSError, EOFError, ValueError, TypeError):
+            return
+        if tuple(key) == self.key:
+            self.files = files
+        else:
+            logger.debug('ignoring CleanerML cache from another version: %s', self.pathname)
+
+    def save(self):
+        """Write the cache file, if it changed"""
+        if set(self.files) != self.seen:
+            # forget files which were removed
+            self.files = dict((pathname, self.files[pathname]) for pathname in self.seen
+                              if pathname in self.files)
+            self.dirty = True
+        if not self.dirty:
+            return
+        tmp_pathname = self.pathname + '.tmp'
+        try:
+            with open(tmp_pathname, 'wb') as f:
+                marshal.dump((self.key, self.files), f)
+            if os.path.exists(self.pathname):
+                # Windows cannot rename over a file
+                os.remove(self.pathname)
+            os.rename(tmp_pathname, self.pathname)
+        except (IOError, OSError, ValueError):
+            logger.debug('error writing CleanerML cache: %s', self.pathname, exc_info=True)
+        self.dirty = False
+
+    def _stat(self, pathname):
+        st = os.stat(pathname)
+        return (st.st_mtime, st.st_size)
+
+    def get(self, pathname):
+        """Return the tree of pathname, or None if it is not cached"""
+        self.seen.add(pathname)
+        entry = self.files.get(pathname)
+        if entry is None:
+            return None
+        if entry[0] != self._stat(pathname):
+            return None
+        return entry[1]
+
+    def put(self, pathname, tree):
+        """Remember the tree of pathname"""
+        self.seen.add(pathname)
+        if tree is None:
+            return
+        self.files[pathname] = (self._stat(pathname), tree)
+        self.dirty = True
+
+
 def load_cleaners():
     """Scan for CleanerML and load them"""
+    cache = CleanerMLCache(os.path.join(bleachbit.options_dir, 'cleanerml.cache'))
+    cache.load()
     for pathname in list_cleanerml_files(): # 클리너ML 파일들의 리스트요소 반복
         try: # 예외처리-
-            xmlcleaner = CleanerML(pathname) # 클리너ML 파일들의 리스트로 CleanerML클래스 객체 생성
+            tree = cache.get(pathname)
+            xmlcleaner = CleanerML(pathname, tree=tree) # 클리너ML 파일들의 리스트로 CleanerML클래스 객체 생성
+            if tree is None:
+                cache.put(pathname, xmlcleaner.tree)
         except:
             logger.exception('error reading cleaner: %s', pathname) # 오류메세지와함께 스택추적 
             continue
@@ -352,6 +516,7 @@ def load_cleaners():
             Cleaner.backends[cleaner.id] = cleaner
         else:
             logger.debug('cleaner is not usable on this OS because it has no actions: %s', pathname)
+    cache.save()
 
 
 def pot_fragment(msgid, pathname, translators=None):
@@ -24,9 +24,10 @@ Command design pattern implementation for cleaning
 
 from __future__ import absolute_import, print_function
 
-from bleachbit import _
-from bleachbit import FileUtilities
+from bleachbit import _, FSE
+from bleachbit import FileUtilities, Purge
 
+import errno
 import logging
 import os
 import types
@@ -38,6 +39,8 @@ if 'nt' == os.name:
 else:
     from bleachbit.General import WindowsError
 
+logger = logging.getLogger(__name__)
+
 
 def whitelist(path):
     """Return information that this file was whitelisted"""
@@ -57,10 +60,16 @@ class Delete:
     """Delete a single file or directory.  Obey the user
     preference regarding shredding."""
 
-    def __init__(self, path):
-        """Create a Delete instance to delete 'path'"""
+    def __init__(self, path, entry=None):
+        """Create a Delete instance to delete 'path'
+
+        entry is an optional directory entry for the path (for example,
+        from FileUtilities.walk_entries()), which saves a stat."""
         self.path = path
+        self.entry = entry
         self.shred = False
+        # False for another name of a file which was shredded already
+        self.allow_shred = True
 
     def __str__(self):
         return 'Command to %s %s' % \
@@ -68,6 +77,8 @@ class Delete:
 
     def execute(self, really_delete):
         """Make changes and return results"""
+        if self.entry is not None:
+            FileUtilities.stat_cache.prime_entry(self.entry)
         if FileUtilities.whitelisted(self.path):
             yield whitelist(self.path)
             return
@@ -80,29 +91,154 @@ class Delete:
             'path': self.path,
             'size': FileUtilities.getsize(self.path)}
         if really_delete:
-            try:
-                FileUtilities.delete(self.path, self.shred)
-            except WindowsError as e:
-                # WindowsError: [Error 32] The process cannot access the file because it is being
-                # used by another process: u'C:\\Documents and
-                # Settings\\username\\Cookies\\index.dat'
-                if 32 != e.winerror and 5 != e.winerror:
-                    raise
-                try:
-                    bleachbit.Windows.delete_locked_file(self.path)
-                except:
-                    raise
-                else:
-                    if self.shred:
-                        import warnings
-                        warnings.warn(
-                            _('At least one file was locked by another process, so its contents could not be overwritten. It will be marked for deletion upon system reboot.'))
-                    # TRANSLATORS: The file will be deleted when the
-                    # system reboots
-                    ret['label'] = _('Mark for deletion')
+            label = delete_path(self.path, self.shred,
+                                getattr(self.entry, 'dir_fd', None), self.allow_shred)
+            if label:
+                ret['label'] = label
         yield ret
 
 
+class DeleteTree:
+
+    """Delete everything under a directory, but not the directory itself
+
+    This does what a search="walk.all" delete action does, but it is one
+    command, and it reports one result with the total size and number of
+    files instead of one result for each file.  Each file is listed in
+    the debug log."""
+
+    def __init__(self, path, walk_key=None):
+        """Create a DeleteTree instance to delete under 'path'
+
+        walk_key identifies the walk in the journal of a clean (see
+        FileUtilities.WalkJournal), so a resumed clean skips the
+        directories which it emptied before."""
+        self.path = path
+        self.walk_key = walk_key
+        self.shred = False
+        # the folders under path which other commands delete as a whole
+        self.inner_trees = ()
+        # a function which a preview passes the path and lstat() result
+        # of each file it would delete, such as for a plan (see
+        # Plan.PlanWriter.add_tree_file())
+        self.on_preview = None
+
+    def __str__(self):
+        return 'Command to %s under %s' % \
+            ('shred' if self.shred else 'delete', self.path)
+
+    def execute(self, really_delete):
+        """Make changes and return results
+
+        With the background purge (see Purge.Stager), the files are
+        moved aside at once, without walking the tree to count them
+        first, so the result has no size: the preview reports it.  If
+        anything under the directory is whitelisted, the files are
+        deleted here.  The files which were not moved aside are deleted
+        here too."""
+        totals = {'n_deleted': 0, 'n_errors': 0, 'n_skipped': 0, 'size': 0}
+        n_staged = 0
+        if really_delete and Purge.stager.enabled:
+            from bleachbit.Options import options
+            if not options.get_whitelist().match_under(self.path):
+                shred = self.shred or options.get('shred')
+                n_staged = Purge.stager.stage(self.path, shred)
+        for ret in self.walk(really_delete, totals):
+            yield ret
+        if 0 == totals['n_deleted'] and 0 == totals['n_errors'] and 0 == n_staged:
+            return
+        yield {
+            'label': _('Delete'),
+            'n_deleted': totals['n_deleted'],
+            'n_errors': totals['n_errors'],
+            'n_special': 0,
+            'path': self.path,
+            'size': None if n_staged else totals['size'],
+            'tree': True}
+
+    def walk(self, really_delete, totals):
+        """Delete or count the files under the directory, and add them
+        to totals
+
+        Only a walk which deletes is journaled, because counting does
+        not finish a directory."""
+        verbose = logger.isEnabledFor(logging.DEBUG)
+        count = 0
+        overlap = FileUtilities.overlap
+        inner_prefixes = tuple(os.path.join(tree, '') for tree in self.inner_trees)
+        walk_key = self.walk_key if really_delete else None
+        for entry in FileUtilities.walk_entries(self.path, True, True, walk_key):
+            count += 1
+            if 0 == count % 1000:
+                # let the GUI respond
+                yield True
+            path = entry.path
+            FileUtilities.stat_cache.prime_entry(entry)
+            if FileUtilities.whitelisted(path):
+                if verbose:
+                    logger.debug('%s %s', _('Skip'), path)
+                totals['n_skipped'] += 1
+                continue
+            label = None
+            try:
+                if overlap.enabled and (path.startswith(inner_prefixes) or
+                                        overlap.is_claimed(entry.stat(follow_symlinks=False))):
+                    # another command of the run deletes it
+                    overlap.add_redundant()
+                    continue
+                size = FileUtilities.getsize(path)
+                if really_delete:
+                    label = delete_path(path, self.shred, getattr(entry, 'dir_fd', None))
+            except OSError as e:
+                # like Worker.report_error(), but go on with the other
+                # files: a traceback, except for a missing file or
+                # access denied
+                logger.error('%s: %s', str(e).decode(FSE, 'replace'), self,
+                             exc_info=e.errno not in (errno.ENOENT, errno.EACCES))
+                totals['n_errors'] += 1
+                continue
+            totals['n_deleted'] += 1
+            totals['size'] += size
+            if not really_delete and self.on_preview is not None:
+                self.on_preview(path, entry.stat(follow_symlinks=False))
+            if verbose:
+                logger.debug('%s %s %s', label or _('Delete'),
+                             FileUtilities.bytes_to_human(size), path)
+
+
+def delete_path(path, shred, dir_fd=None, allow_shred=True):
+    """Delete path using FileUtilities.delete()
+
+    On Windows, a file locked by another process is marked for deletion
+    upon reboot, and then this returns the label for that."""
+    kwargs = {}
+    if dir_fd is not None:
+        kwargs['dir_fd'] = dir_fd
+    if not allow_shred:
+        kwargs['allow_shred'] = False
+    try:
+        FileUtilities.delete(path, shred, **kwargs)
+    except WindowsError as e:
+        # WindowsError: [Error 32] The process cannot access the file because it is being
+        # used by another process: u'C:\\Documents and
+        # Settings\\username\\Cookies\\index.dat'
+        if 32 != e.winerror and 5 != e.winerror:
+            raise
+        try:
+            bleachbit.Windows.delete_locked_file(path)
+        except:
+            raise
+        else:
+            if shred:
+                import warnings
+                warnings.warn(
+                    _('At least one file was locked by another process, so its contents could not be overwritten. It will be marked for deletion upon system reboot.'))
+            # TRANSLATORS: The file will be deleted when the
+            # system reboots
+            return _('Mark for deletion')
+    return None
+
+
 class Function:
 
     """Execute a simple Python function"""
@@ -153,7 +289,7 @@ class Function:
                 assert isinstance(func_ret, (int, long))
                 ret['size'] = func_ret
             else:
-                if os.path.isdir(self.path):
+                if FileUtilities.isdir(self.path):
                     raise RuntimeError('Attempting to run file function %s on directory %s' %
                                        (self.func.func_name, self.path))
                 # Function takes a path.  We check the size.
@@ -166,6 +302,10 @@ class Function:
                         raise
                     logging.getLogger(__name__).exception(e.message)
                     return
+                finally:
+                    # the function may have changed the file
+                    FileUtilities.stat_cache.invalidate(self.path)
+                    FileUtilities.listing_cache.invalidate(self.path)
                 try:
                     newsize = FileUtilities.getsize(self.path)
                 except OSError as e:
@@ -253,9 +393,9 @@ class Shred(Delete):
 
     """Shred a single file"""
 
-    def __init__(self, path):
+    def __init__(self, path, entry=None):
         """Create an instance to shred 'path'"""
-        Delete.__init__(self, path)
+        Delete.__init__(self, path, entry)
         self.shred = True
 
     def __str__(self):
@@ -272,6 +412,8 @@ class Truncate(Delete):
     def execute(self, really_delete):
         """Make changes and return results"""
 
+        if self.entry is not None:
+            FileUtilities.stat_cache.prime_entry(self.entry)
         if FileUtilities.whitelisted(self.path):
             yield whitelist(self.path)
             return
@@ -286,6 +428,7 @@ class Truncate(Delete):
         if really_delete:
             f = open(self.path, 'wb')
             f.truncate(0)
+            FileUtilities.stat_cache.invalidate(self.path)
         yield ret
 
 
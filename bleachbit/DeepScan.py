@@ -25,13 +25,24 @@ Scan directory tree for files to delete
 
 from __future__ import absolute_import, print_function
 
+import collections
 import logging
+import marshal
 import os
 import platform
 import re
+import sys
+import threading
+import time
 import unicodedata
 
 import bleachbit
+from bleachbit.FileUtilities import scandir
+
+if sys.version_info >= (3, 0):
+    import queue
+else:
+    import Queue as queue
 
 UTF8 = 'utf-8'
 
@@ -44,67 +55,428 @@ def to_unicode(s):
     return s if isinstance(s, unicode) else unicode(s, UTF8)
 
 
-def normalized_walk(top, **kwargs):
+def normalized_walk(top, index=None, threads=1, **kwargs):
     """
     macOS uses decomposed UTF-8 to store filenames. This functions
     is like `os.walk` but recomposes those decomposed filenames on
     macOS
+
+    If index is set, it is a DirectoryIndex to walk with.  If threads
+    is more than one, directories are listed by parallel_walk(), which
+    yields None while it waits.
     """
+    if index is not None:
+        def walk(top, **kwargs):
+            return index.walk(top, threads)
+    elif threads > 1:
+        def walk(top, **kwargs):
+            return parallel_walk(top, threads)
+    else:
+        walk = os.walk
     if 'Darwin' == platform.system():
-        for dirpath, dirnames, filenames in os.walk(top, **kwargs):
+        for result in walk(top, **kwargs):
+            if result is None:
+                yield None
+                continue
+            dirpath, dirnames, filenames = result
             yield dirpath, dirnames, [
                 unicodedata.normalize('NFC', to_unicode(fn)).encode(UTF8)
                 for fn in filenames
             ]
     else:
-        if os.name == 'nt':
-            # NTFS stores files as Unicode, and this makes os.walk() return
-            # Unicode.
-            top2 = unicode(top)
-        else:
-            # On Linux the file system encoding may be UTF-8, but deal with
-            # bytestrings to avoid potential UnicodeDecodeError in
-            # posixpath.join()
-            top2 = str(top)
-        for result in os.walk(top2, **kwargs):
+        for result in walk(walk_path(top), **kwargs):
             yield result
 
 
+def walk_path(path):
+    """Return path in the type which normalized_walk() yields"""
+    if 'Darwin' == platform.system():
+        return path
+    if os.name == 'nt':
+        # NTFS stores files as Unicode, and this makes os.walk() return
+        # Unicode.
+        return unicode(path)
+    # On Linux the file system encoding may be UTF-8, but deal with
+    # bytestrings to avoid potential UnicodeDecodeError in
+    # posixpath.join()
+    return str(path)
+
+
+# A backreference or an inline flag changes meaning in an alternation.
+_unshareable_re = re.compile(r'\\[1-9]|\(\?P=|\(\?[aiLmsux]+\)')
+
+
+def compile_regexes(regexes):
+    """Compile regexes into as few patterns as possible
+
+    The regexes which can share a pattern are joined into a single
+    alternation, so each name is matched once instead of once per
+    regex."""
+    shared = []
+    patterns = []
+    for regex in regexes:
+        if regex in shared:
+            continue
+        if _unshareable_re.search(regex):
+            patterns.append(re.compile(regex))
+        else:
+            shared.append(regex)
+    if len(shared) > 1:
+        try:
+            patterns.insert(0, re.compile('|'.join('(?:%s)' % regex for regex in shared)))
+        except re.error:
+            # for example, the same group name in two regexes
+            patterns = [re.compile(regex) for regex in shared] + patterns
+    elif shared:
+        patterns.insert(0, re.compile(shared[0]))
+    return patterns
+
+
+def is_subdirectory(parent, child):
+    """Return whether walking parent reaches child (or they are the same)
+
+    A child under a symlink is not reached, because the walk does not
+    follow symlinks."""
+    parent = os.path.normcase(os.path.normpath(parent))
+    child = os.path.normcase(os.path.normpath(child))
+    if child == parent:
+        return True
+    if not child.startswith(os.path.join(parent, '')):
+        return False
+    return os.path.realpath(child) == \
+        os.path.join(os.path.realpath(parent), os.path.relpath(child, parent))
+
+
+def list_directory(dirpath):
+    """Return (dirnames, filenames, dirnames to descend) for dirpath
+
+    Like os.walk(), symlinks to directories are among the dirnames but
+    not among those to descend.  Return None if dirpath cannot be
+    listed."""
+    dirnames = []
+    filenames = []
+    descend = []
+    try:
+        if scandir is not None:
+            for entry in scandir(dirpath):
+                if entry.is_dir():
+                    dirnames.append(entry.name)
+                    if not entry.is_symlink():
+                        descend.append(entry.name)
+                else:
+                    filenames.append(entry.name)
+        else:
+            for name in os.listdir(dirpath):
+                path = os.path.join(dirpath, name)
+                if os.path.isdir(path):
+                    dirnames.append(name)
+                    if not os.path.islink(path):
+                        descend.append(name)
+                else:
+                    filenames.append(name)
+    except OSError:
+        return None
+    return dirnames, filenames, descend
+
+
+def parallel_walk(top, threads, listdir=list_directory, queue_size=64):
+    """Like os.walk(top) but listing directories on several threads
+
+    Each thread keeps a deque of directories to list.  It takes the
+    newest directory from its own deque, and when that is empty, it
+    steals the oldest directory from another thread, so all threads
+    stay busy on a lopsided tree.  Results stream through a queue of
+    queue_size, so memory stays flat even when the consumer is slow.
+
+    The order of directories is not that of os.walk().  Every 0.25
+    seconds without a result, this yields None, so the caller can
+    yield to the GTK+ idle loop.  listdir is a function like
+    list_directory()."""
+    results = queue.Queue(queue_size)
+    deques = [collections.deque() for _i in range(threads)]
+    deques[0].append(top)
+    cond = threading.Condition()
+    # directories in the deques or being listed
+    pending = [1]
+    stop = threading.Event()
+
+    def take(i):
+        with cond:
+            while pending[0] > 0 and not stop.is_set():
+                if deques[i]:
+                    return deques[i].pop()
+                for j in range(1, threads):
+                    victim = deques[(i + j) % threads]
+                    if victim:
+                        return victim.popleft()
+                cond.wait(0.25)
+        return None
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                results.put(item, timeout=0.25)
+                return
+            except queue.Full:
+                pass
+
+    def work(i):
+        try:
+            while True:
+                dirpath = take(i)
+                if dirpath is None:
+                    break
+                try:
+                    listing = listdir(dirpath)
+                    if listing is not None:
+                        dirnames, filenames, descend = listing
+                        with cond:
+                            deques[i].extend(os.path.join(dirpath, name)
+                                             for name in descend)
+                            pending[0] += len(descend)
+                            cond.notify_all()
+                        put((dirpath, list(dirnames), list(filenames)))
+                except:
+                    logging.getLogger(__name__).exception(
+                        'error listing directory: %s', dirpath)
+                finally:
+                    with cond:
+                        pending[0] -= 1
+                        if 0 == pending[0]:
+                            cond.notify_all()
+        finally:
+            put(None)
+
+    workers = [threading.Thread(target=work, args=(i,)) for i in range(threads)]
+    for worker in workers:
+        worker.daemon = True
+        worker.start()
+    try:
+        finished = 0
+        while finished < threads:
+            try:
+                result = results.get(timeout=0.25)
+            except queue.Empty:
+                yield None
+                continue
+            if result is None:
+                finished += 1
+            else:
+                yield result
+    finally:
+        stop.set()
+        for worker in workers:
+            worker.join()
+
+
+class DirectoryIndex:
+
+    """Persistent index of the names in directories
+
+    For each directory, the index keeps its mtime and the names in it,
+    so a directory which did not change since the last scan is not
+    listed again.  Adding, removing or renaming a name updates the
+    mtime of its directory."""
+
+    # File systems such as FAT store the mtime in 2-second steps, so do
+    # not trust the mtime of a directory changed this recently.
+    racy_seconds = 2
+
+    def __init__(self, pathname):
+        self.pathname = pathname
+        self.key = (1, tuple(sys.version_info[:2]))
+        self.dirs = {}
+        self.hits = 0
+        self.misses = 0
+        self.dirty = False
+        # listdir() may run on several threads
+        self.lock = threading.Lock()
+
+    def load(self):
+        """Read the index file, if it is valid"""
+        try:
+            with open(self.pathname, 'rb') as f:
+                key, dirs = marshal.load(f)
+        except (IOError, OSError, EOFError, ValueError, TypeError):
+            return
+        if tuple(key) == self.key:
+            self.dirs = dirs
+
+    def save(self):
+        """Write the index file, if it changed"""
+        logging.getLogger(__name__).debug('deep scan index: %d hits, %d listings',
+                                          self.hits, self.misses)
+        if not self.dirty:
+            return
+        tmp_pathname = self.pathname + '.tmp'
+        try:
+            with open(tmp_pathname, 'wb') as f:
+                marshal.dump((self.key, self.dirs), f)
+            if os.path.exists(self.pathname):
+                # Windows cannot rename over a file
+                os.remove(self.pathname)
+            os.rename(tmp_pathname, self.pathname)
+        except (IOError, OSError, ValueError):
+            logging.getLogger(__name__).debug(
+                'error writing deep scan index: %s', self.pathname, exc_info=True)
+        self.dirty = False
+
+    def listdir(self, dirpath):
+        """Return (dirnames, filenames, dirnames to descend) for dirpath
+
+        Return None if dirpath cannot be listed."""
+        try:
+            mtime = os.stat(dirpath).st_mtime
+        except OSError:
+            return None
+        entry = self.dirs.get(dirpath)
+        if entry is not None and entry[0] == mtime:
+            with self.lock:
+                self.hits += 1
+            return entry[1:]
+        with self.lock:
+            self.misses += 1
+        listing = list_directory(dirpath)
+        if listing is None:
+            return None
+        dirnames, filenames, descend = listing
+        if time.time() - mtime > self.racy_seconds:
+            self.dirs[dirpath] = (mtime, dirnames, filenames, descend)
+            self.dirty = True
+        elif self.dirs.pop(dirpath, None) is not None:
+            self.dirty = True
+        return dirnames, filenames, descend
+
+    def walk(self, top, threads=1):
+        """Like os.walk(top) but using the index
+
+        With more than one thread, this is like parallel_walk().  After
+        a complete walk, directories under top which no longer exist
+        are removed from the index."""
+        visited = set()
+        if threads > 1:
+            for result in parallel_walk(top, threads, self.listdir):
+                if result is not None:
+                    visited.add(result[0])
+                yield result
+        else:
+            pending = [top]
+            while pending:
+                dirpath = pending.pop()
+                listing = self.listdir(dirpath)
+                if listing is None:
+                    continue
+                visited.add(dirpath)
+                dirnames, filenames, descend = listing
+                yield dirpath, list(dirnames), list(filenames)
+                for name in reversed(descend):
+                    pending.append(os.path.join(dirpath, name))
+        prefix = os.path.join(top, '')
+        for dirpath in list(self.dirs):
+            if dirpath not in visited and (dirpath == top or dirpath.startswith(prefix)):
+                del self.dirs[dirpath]
+                self.dirty = True
+
+
 class DeepScan:
 
     """Advanced directory tree scan"""
 
-    def __init__(self):
+    def __init__(self, index_pathname=None, threads=1):
+        """Create a DeepScan
+
+        index_pathname is the file for the DirectoryIndex of the
+        searches which allow caching.  threads is the number of threads
+        to list directories with."""
+        self.threads = threads
         self.roots = []
         self.searches = {}
+        self.cached_roots = set()
+        if index_pathname is None:
+            index_pathname = os.path.join(bleachbit.options_dir, 'deepscan.index')
+        self.index_pathname = index_pathname
+        self.index = None
+
+    def add_search(self, dirname, regex, cache=False):
+        """Starting in dirname, look for files matching regex
 
-    def add_search(self, dirname, regex):
-        """Starting in dirname, look for files matching regex"""
+        If cache is True, the names under dirname may come from the
+        index of an earlier scan."""
         if dirname not in self.searches:
             self.searches[dirname] = [regex]
         else:
             self.searches[dirname].append(regex)
+        if cache:
+            self.cached_roots.add(dirname)
+
+    def merge_roots(self):
+        """Return the walks to make as a list of (top, [(root, regexes)])
+
+        A root under another root with the same cache setting is
+        merged into its walk, so no directory is walked twice."""
+        walks = []
+        for dirname in sorted(self.searches, key=lambda d: len(os.path.normpath(d))):
+            cache = dirname in self.cached_roots
+            for (top, roots) in walks:
+                if cache == (top in self.cached_roots) and is_subdirectory(top, dirname):
+                    roots.append((dirname, self.searches[dirname]))
+                    break
+            else:
+                walks.append((dirname, [(dirname, self.searches[dirname])]))
+        return walks
 
     def scan(self):
         """Perform requested searches and yield each match"""
         logging.getLogger(__name__).debug('DeepScan.scan: searches=%s', str(self.searches))
-        import time
         yield_time = time.time()
 
-        for (top, regexes) in self.searches.items():
-            for (dirpath, dirnames, filenames) in normalized_walk(top):
-                for regex in regexes:
-                    # fixme, don't match filename twice
-                    r = re.compile(regex)
+        if self.cached_roots:
+            self.index = DirectoryIndex(self.index_pathname)
+            self.index.load()
+        try:
+            for (top, roots) in self.merge_roots():
+                index = self.index if top in self.cached_roots else None
+                # the directories under each root, as the walk yields them
+                top2 = walk_path(top)
+                prefixes = [(top2, None)]
+                for (root, regexes) in roots[1:]:
+                    relpath = os.path.relpath(root, top)
+                    if os.curdir == relpath:
+                        prefixes.append((top2, None))
+                    else:
+                        prefix = os.path.join(top2, walk_path(relpath))
+                        prefixes.append((prefix, os.path.join(prefix, '')))
+                # compiled patterns by the roots which apply
+                patterns_by_roots = {}
+                for result in normalized_walk(top, index, self.threads):
+                    if result is None:
+                        # waiting for the threads
+                        yield True
+                        yield_time = time.time()
+                        continue
+                    (dirpath, dirnames, filenames) = result
+                    applied = tuple(i for i, (prefix, prefix_sep) in enumerate(prefixes)
+                                    if prefix_sep is None or dirpath == prefix
+                                    or dirpath.startswith(prefix_sep))
+                    patterns = patterns_by_roots.get(applied)
+                    if patterns is None:
+                        patterns = compile_regexes(
+                            [regex for i in applied for regex in roots[i][1]])
+                        patterns_by_roots[applied] = patterns
                     for filename in filenames:
-                        if r.search(filename):
-                            full_path = os.path.join(dirpath, filename)
-                            if isinstance(full_path, str):
-                                # Convert path to Unicode.
-                                full_path = full_path.decode(bleachbit.FSE)
-                            yield full_path
-
-                if time.time() - yield_time > 0.25:
-                    # allow GTK+ to process the idle loop
-                    yield True
-                    yield_time = time.time()
+                        for pattern in patterns:
+                            if pattern.search(filename):
+                                full_path = os.path.join(dirpath, filename)
+                                if isinstance(full_path, str):
+                                    # Convert path to Unicode.
+                                    full_path = full_path.decode(bleachbit.FSE)
+                                yield full_path
+                                break
+
+                    if time.time() - yield_time > 0.25:
+                        # allow GTK+ to process the idle loop
+                        yield True
+                        yield_time = time.time()
+        finally:
+            if self.index is not None:
+                self.index.save()
@@ -30,6 +30,7 @@ from bleachbit import expanduser
 import atexit
 import codecs
 import errno
+import fnmatch
 import glob
 import locale
 import logging
@@ -41,6 +42,7 @@ import string
 import sys
 import subprocess
 import tempfile
+import threading
 import time
 
 logger = logging.getLogger(__name__)
@@ -53,6 +55,38 @@ if 'posix' == os.name:
     from bleachbit.General import WindowsError
     pywinerror = WindowsError
 
+# os.scandir() is new in Python 3.5, and it is available as the module
+# scandir for older versions.
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
+
+# openat() and unlinkat() resolve a name relative to an open directory.
+# Python 3.3 has them as the dir_fd parameter, and for Python 2 on Linux
+# they come from the C library.
+# A directory is listed, and a name in it stat'ed, through its descriptor
+# too: Python 3 takes the descriptor, and on Linux the path of the
+# descriptor in /proc resolves to the open directory.
+AT_REMOVEDIR = 0x200
+_libc = None
+if 'posix' == os.name and sys.version_info >= (3, 3):
+    dir_fd_supported = os.unlink in os.supports_dir_fd and \
+        os.open in os.supports_dir_fd and os.stat in os.supports_dir_fd and \
+        os.listdir in os.supports_fd
+elif sys.platform.startswith('linux'):
+    try:
+        import ctypes
+        _libc = ctypes.CDLL('libc.so.6', use_errno=True)
+        dir_fd_supported = hasattr(_libc, 'openat') and hasattr(_libc, 'unlinkat') and \
+            os.path.isdir('/proc/self/fd')
+    except (ImportError, OSError):
+        dir_fd_supported = False
+else:
+    dir_fd_supported = False
 
 
 def open_files_linux():
@@ -86,13 +120,65 @@ def open_files():
             yield target
 
 
+def open_inodes_linux(pid, proc='/proc'):
+    """Return the set of (st_dev, st_ino) of the files open by a process"""
+    fd_dir = os.path.join(proc, pid, 'fd')
+    inodes = set()
+    try:
+        fds = os.listdir(fd_dir)
+    except OSError:
+        # 13 = permission denied, or the process ended
+        return inodes
+    for fd in fds:
+        try:
+            st = os.stat(os.path.join(fd_dir, fd))
+        except OSError:
+            continue
+        inodes.add((st.st_dev, st.st_ino))
+    return inodes
+
+
+def is_rotational(st_dev, sys_dev_block='/sys/dev/block'):
+    """Return whether the device is a spinning disk
+
+    Return None if it is not known, for example, for tmpfs or on an
+    operating system other than Linux."""
+    if not sys.platform.startswith('linux'):
+        return None
+    block = os.path.join(sys_dev_block, '%d:%d' % (os.major(st_dev), os.minor(st_dev)))
+    if not os.path.exists(block):
+        # not a block device
+        return None
+    block = os.path.realpath(block)
+    # a partition has the queue of its disk
+    for dirname in (block, os.path.dirname(block)):
+        try:
+            with open(os.path.join(dirname, 'queue', 'rotational')) as f:
+                return '1' == f.read().strip()
+        except IOError:
+            continue
+    return None
+
+
 class OpenFiles:
 
-    """Cached way to determine whether a file is open by active process"""
+    """Cached way to determine whether a file is open by active process
+
+    Open files are remembered by (st_dev, st_ino), so a query is one set
+    lookup instead of a realpath() and a search through a list.  On Linux,
+    the inodes are kept by pid, and a rescan reads /proc/<pid>/fd only for
+    the processes which started since the previous scan.  Every
+    full_scan_interval seconds, all processes are read again."""
+
+    rescan_interval = 10
+    full_scan_interval = 60
 
     def __init__(self):
         self.last_scan_time = None
-        self.files = []
+        self.last_full_scan_time = None
+        self.files = set()
+        self.pids = {}
+        self.lock = threading.Lock()
 
     def file_qualifies(self, filename):
         """Return boolean whether filename qualifies to enter cache (check \
@@ -100,19 +186,964 @@ class OpenFiles:
         return not filename.startswith("/dev") and \
             not filename.startswith("/proc")
 
+    def _inode(self, filename):
+        """Return (st_dev, st_ino) of filename following symlinks, or None"""
+        try:
+            st = stat_cache.lstat(filename)
+            if stat.S_ISLNK(st.st_mode):
+                st = os.stat(filename)
+        except OSError:
+            return None
+        return (st.st_dev, st.st_ino)
+
     def scan(self):
         """Update cache"""
-        self.last_scan_time = time.time()
-        self.files = []
-        for filename in open_files():
-            if self.file_qualifies(filename):
-                self.files.append(filename)
+        with self.lock:
+            self._scan(True)
+
+    def rescan(self):
+        """Update cache with the processes started since the last scan"""
+        with self.lock:
+            self._scan(False)
+
+    def _scan(self, full):
+        now = time.time()
+        self.last_scan_time = now
+        if not sys.platform.startswith('linux'):
+            self.last_full_scan_time = now
+            files = set()
+            for filename in open_files():
+                if self.file_qualifies(filename):
+                    inode = self._inode(filename)
+                    if inode:
+                        files.add(inode)
+            self.files = files
+            return
+        if full:
+            self.last_full_scan_time = now
+            self.pids = {}
+        pids = {}
+        for pid in os.listdir('/proc'):
+            if not pid.isdigit():
+                continue
+            inodes = self.pids.get(pid)
+            if inodes is None:
+                inodes = open_inodes_linux(pid)
+            pids[pid] = inodes
+        self.pids = pids
+        self.files = set().union(*pids.values())
+
+    def refresh(self):
+        """Scan again if the cache is old"""
+        now = time.time()
+        with self.lock:
+            if self.last_scan_time is None or \
+                    not 0 <= now - self.last_full_scan_time <= self.full_scan_interval:
+                self._scan(True)
+            elif not 0 <= now - self.last_scan_time <= self.rescan_interval:
+                self._scan(False)
 
     def is_open(self, filename):
         """Return boolean whether filename is open by running process"""
-        if self.last_scan_time is None or (time.time() - self.last_scan_time) > 10:
-            self.scan()
-        return os.path.realpath(filename) in self.files
+        self.refresh()
+        return self._inode(filename) in self.files
+
+    def filter_open(self, paths):
+        """Yield the paths which are not open by any running process
+
+        The cache is refreshed once for all the paths."""
+        self.refresh()
+        files = self.files
+        for path in paths:
+            if self._inode(path) not in files:
+                yield path
+
+
+class StatCache:
+
+    """Run-scoped cache of lstat() results
+
+    Worker enables the cache for the duration of a run, so the same file
+    is not stat'ed again by path_filter(), getsize(), whitelisted() and
+    delete().  Functions in this module which delete, rename or truncate
+    a path invalidate it.  When the cache is not enabled, every call goes
+    straight to the operating system."""
+
+    def __init__(self):
+        self.enabled = False
+        self.hits = 0
+        self.misses = 0
+        self.stats = {}
+        self.lock = threading.Lock()
+
+    def start(self):
+        """Empty the cache and begin caching"""
+        with self.lock:
+            self.stats = {}
+            self.hits = 0
+            self.misses = 0
+            self.enabled = True
+
+    def stop(self):
+        """Stop caching and forget everything"""
+        with self.lock:
+            self.enabled = False
+            self.stats = {}
+        logger.debug('stat cache: %d hits, %d misses', self.hits, self.misses)
+
+    def lstat(self, path):
+        """Return os.lstat(path), possibly from the cache
+
+        A missing path is cached too, and it raises OSError."""
+        if not self.enabled:
+            return os.lstat(path)
+        with self.lock:
+            st = self.stats.get(path, _UNCACHED)
+            if st is not _UNCACHED:
+                self.hits += 1
+        if st is _UNCACHED:
+            try:
+                st = os.lstat(path)
+            except OSError as e:
+                if e.errno not in (errno.ENOENT, errno.ENOTDIR):
+                    raise
+                st = None
+            with self.lock:
+                self.misses += 1
+                if self.enabled:
+                    self.stats[path] = st
+        if st is None:
+            raise OSError(errno.ENOENT, 'No such file or directory', path)
+        return st
+
+    def prime(self, path, st):
+        """Remember a stat result obtained elsewhere"""
+        with self.lock:
+            if self.enabled:
+                self.stats[path] = st
+
+    def prime_entry(self, entry):
+        """Remember the lstat() of an entry from walk_entries()"""
+        if not self.enabled:
+            return
+        try:
+            st = entry.stat(follow_symlinks=False)
+        except OSError:
+            return
+        with self.lock:
+            if self.enabled and entry.path not in self.stats:
+                self.stats[entry.path] = st
+
+    def invalidate(self, path):
+        """Forget path because it was deleted, renamed or changed"""
+        with self.lock:
+            self.stats.pop(path, None)
+
+
+# the value of StatCache.stats for a path which is not in the cache
+_UNCACHED = object()
+
+
+class PathEntry:
+
+    """A directory entry made from a path, similar to os.DirEntry
+
+    This is used when os.scandir() is not available and for paths found
+    another way, such as glob.  The lstat() result is filled lazily
+    through the stat cache."""
+
+    def __init__(self, path, name=None):
+        self.path = path
+        self.name = os.path.basename(path) if name is None else name
+        self._lstat = None
+
+    def __repr__(self):
+        return '<PathEntry %r>' % self.path
+
+    def stat(self, follow_symlinks=True):
+        """Return the stat result, by default following symlinks"""
+        if self._lstat is None:
+            self._lstat = stat_cache.lstat(self.path)
+        if follow_symlinks and stat.S_ISLNK(self._lstat.st_mode):
+            return os.stat(self.path)
+        return self._lstat
+
+    def is_dir(self, follow_symlinks=True):
+        """Return whether the entry is a directory"""
+        try:
+            return stat.S_ISDIR(self.stat(follow_symlinks).st_mode)
+        except OSError:
+            return False
+
+    def is_file(self, follow_symlinks=True):
+        """Return whether the entry is a regular file"""
+        try:
+            return stat.S_ISREG(self.stat(follow_symlinks).st_mode)
+        except OSError:
+            return False
+
+    def is_symlink(self):
+        """Return whether the entry is a symbolic link"""
+        try:
+            return stat.S_ISLNK(self.stat(False).st_mode)
+        except OSError:
+            return False
+
+
+class _ListingNode:
+
+    """A directory in the trie of ListingCache"""
+
+    __slots__ = ('children', 'path', 'names')
+
+    def __init__(self):
+        self.children = {}
+        # the directory to list, if it is planned
+        self.path = None
+        # _UNLISTED, None if the directory does not exist, False if it
+        # cannot be listed, or else a dictionary of its names
+        self.names = _UNLISTED
+
+
+_UNLISTED = object()
+
+
+class WalkJournal:
+
+    """Run-scoped link between walk_entries() and the journal of a clean
+
+    When Worker enables it with a Journal.Journal, each walk with a key
+    records the directories it finished, and it does not descend into
+    a directory which it finished before an interruption.
+
+    A walk which yields commands finishes a directory before its
+    commands run, and Worker may hold them in a batch or a queue.  So
+    while a thread holds (see hold()), the directories it finishes are
+    recorded only by commit(), which Worker calls when the commands
+    have run."""
+
+    def __init__(self):
+        self.journal = None
+        self.local = threading.local()
+
+    def start(self, journal):
+        """Begin recording to journal"""
+        self.journal = journal
+
+    def stop(self):
+        """Stop recording"""
+        self.journal = None
+
+    def is_finished(self, key, path, mtime):
+        """Return whether the walk finished the directory before"""
+        journal = self.journal
+        return journal is not None and journal.is_finished_walk(key, path, mtime)
+
+    def finish(self, key, path):
+        """Record that the walk finished the directory, or keep it for
+        commit() while this thread holds"""
+        if self.journal is None:
+            return
+        pending = getattr(self.local, 'pending', None)
+        if pending is not None:
+            pending.append((key, path))
+            return
+        self._record(key, path)
+
+    def _record(self, key, path):
+        """Write a finished directory with its modification time"""
+        journal = self.journal
+        if journal is None:
+            return
+        try:
+            mtime = os.lstat(path).st_mtime
+        except OSError:
+            # deleted
+            return
+        journal.add_finished_walk(key, path, mtime)
+
+    def hold(self):
+        """Keep the directories which walks on this thread finish until
+        commit()"""
+        self.local.pending = []
+
+    def commit(self):
+        """Record the directories held on this thread
+
+        The modification time is taken now, after the commands ran."""
+        pending = getattr(self.local, 'pending', None)
+        if not pending:
+            return
+        self.local.pending = []
+        for (key, path) in pending:
+            self._record(key, path)
+
+    def release(self):
+        """Stop holding, and drop the directories which were not committed"""
+        self.local.pending = None
+
+
+class TokenBucket:
+
+    """Limit the rate of something, such as bytes written per second
+
+    The bucket holds up to burst tokens and fills at rate tokens per
+    second.  Taking more tokens than the bucket holds makes the caller
+    sleep until the debt is paid, so large requests are allowed but the
+    average rate still holds."""
+
+    def __init__(self, rate, burst=None, clock=time.time, sleep=time.sleep):
+        self.rate = float(rate)
+        self.burst = float(burst or rate)
+        self.tokens = self.burst
+        self.clock = clock
+        self.sleep = sleep
+        self.time = clock()
+        self.lock = threading.Lock()
+
+    def take(self, n=1):
+        """Take n tokens, and return the seconds it waited for them"""
+        with self.lock:
+            now = self.clock()
+            self.tokens = min(self.burst, self.tokens + (now - self.time) * self.rate)
+            self.time = now
+            self.tokens -= n
+            if self.tokens >= 0:
+                return 0
+            wait = -self.tokens / self.rate
+        self.sleep(wait)
+        return wait
+
+
+class Throttle:
+
+    """Budget of bytes written and paths removed per second
+
+    delete(), wipe_contents() and wipe_path() take from the budget, so
+    cleaning on a busy host does not compete with its other I/O.  Each
+    limit is None (no limit) or a TokenBucket.  The time spent waiting
+    is added up for the report."""
+
+    def __init__(self):
+        self.write_bucket = None
+        self.unlink_bucket = None
+        self.seconds = 0.0
+        self.lock = threading.Lock()
+
+    def configure(self, bytes_per_second=None, unlinks_per_second=None):
+        """Set the limits, and reset the time spent waiting"""
+        self.write_bucket = TokenBucket(bytes_per_second) if bytes_per_second else None
+        self.unlink_bucket = TokenBucket(unlinks_per_second) if unlinks_per_second else None
+        self.seconds = 0.0
+
+    def _add(self, seconds):
+        if seconds:
+            with self.lock:
+                self.seconds += seconds
+
+    def write(self, n_bytes):
+        """Wait to write n_bytes"""
+        bucket = self.write_bucket
+        if bucket is not None:
+            self._add(bucket.take(n_bytes))
+
+    def unlink(self):
+        """Wait to remove a path"""
+        bucket = self.unlink_bucket
+        if bucket is not None:
+            self._add(bucket.take())
+
+
+class Overlap:
+
+    """Run-scoped record of what the commands of a run already cover
+
+    Several cleaner options can match the same files, for example a
+    folder which one option deletes as a whole and another option
+    cleans in part, or a path which is reached through a symlink too.
+    Worker.optimize() asks this before it runs each command, so a path
+    is not deleted twice, and a file is not shredded twice.  The count
+    of operations avoided goes in the report."""
+
+    def __init__(self):
+        self.enabled = False
+        self.trees = set()
+        self.inodes = set()
+        self.links = set()
+        self.hard_links = {}
+        self.n_redundant = 0
+        self.lock = threading.Lock()
+
+    def start(self):
+        """Forget everything and begin recording"""
+        with self.lock:
+            self.trees = set()
+            self.inodes = set()
+            self.links = set()
+            self.hard_links = {}
+            self.n_redundant = 0
+            self.enabled = True
+
+    def stop(self):
+        """Stop recording"""
+        with self.lock:
+            self.enabled = False
+            self.trees = set()
+            self.inodes = set()
+            self.links = set()
+            self.hard_links = {}
+        logger.debug('overlap: %d redundant operations', self.n_redundant)
+
+    def add_redundant(self, n=1):
+        """Count operations avoided"""
+        with self.lock:
+            self.n_redundant += n
+
+    def in_tree(self, path):
+        """Return whether a folder deleted as a whole has path under it"""
+        with self.lock:
+            return self._in_tree(path)
+
+    def _in_tree(self, path):
+        """Like in_tree(), with the lock held"""
+        if not self.trees:
+            return False
+        parent = os.path.dirname(path)
+        while True:
+            if parent in self.trees:
+                return True
+            grandparent = os.path.dirname(parent)
+            if grandparent == parent:
+                return False
+            parent = grandparent
+
+    def add_tree(self, path):
+        """Record a folder deleted as a whole
+
+        Return None if it is redundant, because it is in a folder which
+        is deleted as a whole already, or else a list of the folders
+        recorded before which are in it."""
+        paths = set([os.path.normpath(path), os.path.realpath(path)])
+        with self.lock:
+            for path in paths:
+                if path in self.trees or self._in_tree(path):
+                    return None
+            inner = [tree for tree in self.trees
+                     if any(tree.startswith(os.path.join(path, '')) for path in paths)]
+            self.trees.update(paths)
+        return inner
+
+    def claim(self, path, st):
+        """Record a command for the file, and return whether it is the
+        first for the file (True), the first for another name of a file
+        with hard links (None), or redundant (False)
+
+        A file with one link, or a directory, has one name, so another
+        path to the same inode is the same file reached through a
+        symlink.  A file with hard links keeps count of its names which
+        are left, because deleting one name leaves one link fewer."""
+        key = (st.st_dev, st.st_ino)
+        if st.st_nlink > 1 and not stat.S_ISDIR(st.st_mode):
+            try:
+                # the real parent, if path is through a symlink
+                parent = os.stat(os.path.dirname(path))
+            except OSError:
+                return True
+            link = (parent.st_dev, parent.st_ino, os.path.basename(path))
+            with self.lock:
+                if link in self.links:
+                    return False
+                self.links.add(link)
+                if self.hard_links.get(key):
+                    self.hard_links[key] -= 1
+                    return None
+                self.hard_links[key] = st.st_nlink - 1
+                return True
+        with self.lock:
+            if self.hard_links.get(key):
+                # the last name of a file with hard links
+                self.hard_links[key] -= 1
+                return None
+            inode_key = self.inode_key(st)
+            if inode_key in self.inodes:
+                return False
+            self.inodes.add(inode_key)
+            return True
+
+    @staticmethod
+    def inode_key(st):
+        """Return the key of a file with one name
+
+        After the file is deleted, a new file may get its inode number,
+        but not its ctime too."""
+        return (st.st_dev, st.st_ino, st.st_ctime)
+
+    def is_claimed(self, st):
+        """Return whether a command claimed the file, unless it has other
+        hard links"""
+        if st.st_nlink > 1 and not stat.S_ISDIR(st.st_mode):
+            return False
+        with self.lock:
+            return self.inode_key(st) in self.inodes
+
+
+class ListingCache:
+
+    """Run-scoped cache of directory listings
+
+    Before a run, Worker plans the directories which the selected file
+    actions look in (see FileActionProvider.get_directories()).  Each
+    directory is then listed at most once per run: lexists() is answered
+    from the listing of the parent, and iglob() matches against it.  The
+    directories are kept in a trie of path components, so the listing of
+    a missing directory also answers for everything below it.
+
+    Only text paths are cached.  Paths are compared without case on
+    Windows and macOS."""
+
+    def __init__(self):
+        self.enabled = False
+        self.hits = 0
+        self.misses = 0
+        self.root = _ListingNode()
+        self.lock = threading.RLock()
+        self.fold_case = 'nt' == os.name or 'darwin' == sys.platform
+
+    def start(self):
+        """Empty the cache and begin caching"""
+        with self.lock:
+            self.root = _ListingNode()
+            self.hits = 0
+            self.misses = 0
+            self.enabled = True
+
+    def stop(self):
+        """Stop caching and forget everything"""
+        with self.lock:
+            self.enabled = False
+            self.root = _ListingNode()
+        logger.debug('listing cache: %d hits, %d listings', self.hits, self.misses)
+
+    def _key(self, name):
+        return name.lower() if self.fold_case else name
+
+    def _split(self, path):
+        """Split path into its root and components, or return None"""
+        if not isinstance(path, type(u'')):
+            return None
+        drive, rest = os.path.splitdrive(path)
+        if os.altsep:
+            rest = rest.replace(os.altsep, os.sep)
+        parts = [self._key(drive + os.sep if rest.startswith(os.sep) else drive)]
+        for part in rest.split(os.sep):
+            if '..' == part:
+                # a symlink may be in the way
+                return None
+            if part and '.' != part:
+                parts.append(self._key(part))
+        return parts
+
+    def _find(self, parts, create=False):
+        node = self.root
+        for part in parts:
+            child = node.children.get(part)
+            if child is None:
+                if not create:
+                    return None
+                child = node.children[part] = _ListingNode()
+            node = child
+        return node
+
+    def _names(self, node):
+        """Return the names in a planned directory, listing it once"""
+        if node.names is _UNLISTED:
+            self.misses += 1
+            try:
+                node.names = dict((self._key(name), name)
+                                  for name in os.listdir(node.path))
+            except OSError as e:
+                if e.errno in (errno.ENOENT, errno.ENOTDIR):
+                    node.names = None
+                else:
+                    node.names = False
+        else:
+            self.hits += 1
+        return node.names
+
+    def add(self, dirname):
+        """Plan to list dirname"""
+        parts = self._split(dirname)
+        if parts is None:
+            return
+        with self.lock:
+            node = self._find(parts, True)
+            if node.path is None:
+                node.path = dirname
+
+    def listdir(self, dirname):
+        """Return the names in dirname, or None if it cannot be listed
+
+        The listing is cached even if dirname was not planned."""
+        parts = self._split(dirname)
+        if not self.enabled or parts is None:
+            return None
+        with self.lock:
+            node = self._find(parts, True)
+            if node.path is None:
+                node.path = dirname
+            names = self._names(node)
+        if names is None:
+            return []
+        if names is False:
+            return None
+        return list(names.values())
+
+    def lookup(self, path):
+        """Return whether path exists, or None if the listings cannot tell"""
+        parts = self._split(path)
+        if not self.enabled or parts is None or len(parts) < 2:
+            return None
+        last = len(parts) - 1
+        with self.lock:
+            node = self.root
+            for i, part in enumerate(parts):
+                # node is the directory of parts[:i]
+                if node.path is not None:
+                    names = self._names(node)
+                    if names is None:
+                        return False
+                    if names is not False:
+                        if part not in names:
+                            return False
+                        if i == last:
+                            return True
+                node = node.children.get(part)
+                if node is None:
+                    return None
+        return None
+
+    def remove(self, path):
+        """Forget path because it was deleted or renamed"""
+        parts = self._split(path)
+        if not self.enabled or parts is None or len(parts) < 2:
+            return
+        with self.lock:
+            parent = self._find(parts[:-1])
+            if parent is None:
+                return
+            if isinstance(parent.names, dict):
+                parent.names.pop(parts[-1], None)
+            pending = [parent.children.get(parts[-1])]
+            while pending:
+                node = pending.pop()
+                if node is not None:
+                    if node.path is not None:
+                        node.names = None
+                    pending.extend(node.children.values())
+
+    def invalidate(self, path):
+        """List path and its parent again because they may have changed"""
+        parts = self._split(path)
+        if not self.enabled or parts is None:
+            return
+        with self.lock:
+            parent = self._find(parts[:-1])
+            if parent is None:
+                return
+            parent.names = _UNLISTED
+            pending = [parent.children.get(parts[-1])]
+            while pending:
+                node = pending.pop()
+                if node is not None:
+                    node.names = _UNLISTED
+                    pending.extend(node.children.values())
+
+
+class Whitelist:
+
+    """Compiled whitelist of paths
+
+    The paths are kept in a trie of path components, so matching a path
+    costs one dictionary lookup per component instead of a comparison
+    with every whitelisted path.  Options compiles it once, when the
+    whitelist changes.  When case_sensitive is False, the paths are
+    case-folded once here and each query is folded before matching."""
+
+    def __init__(self, paths, case_sensitive=True, sep=os.sep):
+        self.case_sensitive = case_sensitive
+        self.sep = sep
+        self.root = {}
+        # folders of three characters, such as C:\, match as a prefix
+        self.prefixes = set()
+        for (p_type, p_path) in paths:
+            if not case_sensitive:
+                p_path = p_path.lower()
+                if 'folder' == p_type and 3 == len(p_path):
+                    self.prefixes.add(p_path)
+            node = self.root
+            for part in p_path.split(sep):
+                node = node.setdefault(part, {})
+            # None holds the type, and a folder includes the file
+            if 'folder' == p_type or ('file' == p_type and None not in node):
+                node[None] = p_type
+
+    def match(self, path):
+        """Return whether path is whitelisted"""
+        if not self.case_sensitive:
+            path = path.lower()
+            if path[:3] in self.prefixes:
+                return True
+        node = self.root
+        for part in path.split(self.sep):
+            node = node.get(part)
+            if node is None:
+                return False
+            if 'folder' == node.get(None):
+                return True
+        return 'file' == node.get(None)
+
+    def match_under(self, path):
+        """Return whether path, or any path under it, is whitelisted"""
+        if self.match(path):
+            return True
+        if not self.case_sensitive:
+            path = path.lower()
+        node = self.root
+        for part in path.rstrip(self.sep).split(self.sep):
+            node = node.get(part)
+            if node is None:
+                return False
+        return any(key is not None for key in node)
+
+
+def scan_directory(dirname):
+    """Return the entries of a directory like os.scandir()
+
+    The entries carry the file type (d_type) when the platform gives it."""
+    if scandir is not None:
+        return list(scandir(dirname))
+    return [PathEntry(os.path.join(dirname, name), name)
+            for name in os.listdir(dirname)]
+
+
+def _encode_name(name):
+    """Return a name as bytes for the C library"""
+    if isinstance(name, unicode):
+        return name.encode(sys.getfilesystemencoding() or 'utf-8')
+    return name
+
+
+def _libc_error(name):
+    """Return OSError for the errno of the last C library call"""
+    import ctypes
+    err = ctypes.get_errno()
+    return OSError(err, os.strerror(err), name)
+
+
+def open_directory(name, dir_fd=None):
+    """Open a directory for use as dir_fd, without following a symlink
+
+    name is relative to the open directory dir_fd, when it is given."""
+    flags = os.O_RDONLY | os.O_DIRECTORY | os.O_NOFOLLOW
+    if dir_fd is None:
+        return os.open(name, flags)
+    if _libc is None:
+        return os.open(name, flags, dir_fd=dir_fd)
+    fd = _libc.openat(dir_fd, _encode_name(name), flags)
+    if fd < 0:
+        raise _libc_error(name)
+    return fd
+
+
+def remove_at(dir_fd, name, rmdir=False):
+    """Remove the file or empty directory name in the open directory dir_fd"""
+    if _libc is None:
+        if rmdir:
+            os.rmdir(name, dir_fd=dir_fd)
+        else:
+            os.unlink(name, dir_fd=dir_fd)
+        return
+    if 0 != _libc.unlinkat(dir_fd, _encode_name(name), AT_REMOVEDIR if rmdir else 0):
+        raise _libc_error(name)
+
+
+class DirFd(object):
+
+    """An open directory, which is closed when nothing refers to it
+
+    walk_entries() opens each directory as a DirFd.  Its entries, and
+    the commands made from them, refer to it, so the descriptor stays
+    open while a command may still remove a name in the directory, even
+    after the walk moved on or ended.  At most max_open directories are
+    open at once, so collecting the commands of a large walk does not
+    run out of descriptors: the rest of the walk falls back to paths."""
+
+    __slots__ = ('fd',)
+
+    max_open = 256
+    n_open = 0
+    lock = threading.Lock()
+
+    def __init__(self, fd):
+        self.fd = fd
+
+    def __del__(self):
+        os.close(self.fd)
+        with DirFd.lock:
+            DirFd.n_open -= 1
+
+    @classmethod
+    def open(cls, name, parent=None):
+        """Open a directory, relative to the DirFd parent if it is given
+
+        Return None if it cannot be opened (for example, because it is
+        a symlink), or if too many directories are open."""
+        with cls.lock:
+            if cls.n_open >= cls.max_open:
+                return None
+            cls.n_open += 1
+        try:
+            fd = open_directory(name, None if parent is None else parent.fd)
+        except OSError:
+            with cls.lock:
+                cls.n_open -= 1
+            return None
+        return cls(fd)
+
+    def _fd_path(self, like):
+        """Return the path of the descriptor in /proc, as the same type
+        as the path like"""
+        path = '/proc/self/fd/%d' % self.fd
+        if isinstance(like, unicode):
+            return path.decode('ascii')
+        return path
+
+    def scan(self, dirname):
+        """Return the entries of the directory, which is at dirname
+
+        The names are read through the descriptor, so this lists the
+        directory which was opened, even if another one took its place
+        at dirname."""
+        if _libc is None:
+            names = os.listdir(self.fd)
+        else:
+            names = os.listdir(self._fd_path(dirname))
+        return [DirFdEntry(os.path.join(dirname, name), name, self) for name in names]
+
+    def lstat(self, name):
+        """Return the lstat() of the name in the directory"""
+        if _libc is None:
+            return os.stat(name, dir_fd=self.fd, follow_symlinks=False)
+        return os.lstat(os.path.join(self._fd_path(name), name))
+
+
+class DirFdEntry(PathEntry):
+
+    """A directory entry in an open directory (a DirFd)
+
+    walk_entries() makes these when asked for dir_fds.  The entry is
+    stat'ed by its name relative to the directory, and delete() removes
+    it the same way, as unlinkat() does, so a directory which is swapped
+    for a symlink during the walk does not redirect either outside the
+    tree."""
+
+    def __init__(self, path, name, dir_fd):
+        PathEntry.__init__(self, path, name)
+        self.dir_fd = dir_fd
+
+    def __repr__(self):
+        return '<DirFdEntry %r>' % self.path
+
+    def stat(self, follow_symlinks=True):
+        """Return the stat result, by default following symlinks"""
+        if self._lstat is None:
+            self._lstat = self.dir_fd.lstat(self.name)
+        if follow_symlinks and stat.S_ISLNK(self._lstat.st_mode):
+            return os.stat(self.path)
+        return self._lstat
+
+
+def lexists(path):
+    """Like os.path.lexists() but using the listing and stat caches"""
+    found = listing_cache.lookup(path)
+    if found is not None:
+        return found
+    try:
+        stat_cache.lstat(path)
+    except OSError:
+        return False
+    return True
+
+
+def iglob(pathname):
+    """Like glob.iglob() but using the listing cache"""
+    if not listing_cache.enabled or not isinstance(pathname, type(u'')):
+        for path in glob.iglob(pathname):
+            yield path
+        return
+    if not glob.has_magic(pathname):
+        if lexists(pathname):
+            yield pathname
+        return
+    dirname, basename = os.path.split(pathname)
+    if not dirname:
+        for path in glob.iglob(pathname):
+            yield path
+        return
+    if dirname != pathname and glob.has_magic(dirname):
+        dirnames = iglob(dirname)
+    else:
+        dirnames = [dirname]
+    for dirname in dirnames:
+        if glob.has_magic(basename):
+            names = listing_cache.listdir(dirname)
+            if names is None:
+                names = glob.glob1(dirname, basename)
+            else:
+                if not basename.startswith('.'):
+                    # like glob, hide hidden files
+                    names = [name for name in names if not name.startswith('.')]
+                names = fnmatch.filter(names, basename)
+        elif not basename:
+            names = [basename] if isdir(dirname) else []
+        elif lexists(os.path.join(dirname, basename)):
+            names = [basename]
+        else:
+            names = []
+        for name in names:
+            yield os.path.join(dirname, name)
+
+
+def islink(path):
+    """Like os.path.islink() but using the stat cache"""
+    try:
+        return stat.S_ISLNK(stat_cache.lstat(path).st_mode)
+    except OSError:
+        return False
+
+
+def isdir(path):
+    """Like os.path.isdir() but using the stat cache"""
+    try:
+        mode = stat_cache.lstat(path).st_mode
+    except OSError:
+        return False
+    if stat.S_ISLNK(mode):
+        # follow the link like os.path.isdir()
+        return os.path.isdir(path)
+    return stat.S_ISDIR(mode)
+
+
+def isfile(path):
+    """Like os.path.isfile() but using the stat cache"""
+    try:
+        mode = stat_cache.lstat(path).st_mode
+    except OSError:
+        return False
+    if stat.S_ISLNK(mode):
+        # follow the link like os.path.isfile()
+        return os.path.isfile(path)
+    return stat.S_ISREG(mode)
 
 
 def __random_string(length):
@@ -160,17 +1191,95 @@ def bytes_to_human(bytes_i):
 
 def children_in_directory(top, list_directories=False):
     """Iterate files and, optionally, subdirectories in directory"""
+    for entry in walk_entries(top, list_directories):
+        yield entry.path
+
+
+def walk_entries(top, list_directories=False, dir_fds=False, key=None):
+    """Iterate entries of files and, optionally, subdirectories in directory
+
+    This is like children_in_directory(), but it yields entries similar
+    to os.DirEntry, which know their file type without another system
+    call and remember their lstat() result.  The order is the same as
+    os.walk(topdown=False): the children come before their parent, and
+    symlinks to directories are listed but not followed.
+
+    With dir_fds, where the platform supports it, each directory is
+    opened once as a DirFd, relative to its parent and without following
+    symlinks, and listed through it, and the entries are DirFdEntry.
+
+    key identifies the walk in the journal of a clean (see WalkJournal),
+    for example, by the filters of the action."""
     if type(top) is tuple:
         for top_ in top:
-            for pathname in children_in_directory(top_, list_directories):
-                yield pathname
+            for entry in walk_entries(top_, list_directories, dir_fds, key):
+                yield entry
         return
-    for (dirpath, dirnames, filenames) in os.walk(top, topdown=False):
+    dir_fds = dir_fds and dir_fd_supported
+    if key is not None and walk_journal.journal is None:
+        key = None
+    if key is not None:
+        try:
+            if walk_journal.is_finished(key, top, os.lstat(top).st_mtime):
+                return
+        except OSError:
+            pass
+    # Each frame is [path, subdirectories, files, DirFd, name, parent
+    # DirFd].  A directory is opened only when it is listed.  Use a stack
+    # instead of recursion to support deep trees.
+    pending = [[top, None, None, None, top, None]]
+    while pending:
+        frame = pending[-1]
+        if frame[1] is None:
+            if dir_fds:
+                frame[3] = DirFd.open(frame[4], frame[5])
+            try:
+                if frame[3] is None:
+                    entries = scan_directory(frame[0])
+                else:
+                    entries = frame[3].scan(frame[0])
+            except OSError:
+                # like os.walk(), ignore directories which cannot be listed
+                pending.pop()
+                continue
+            frame[1] = []
+            frame[2] = []
+            for entry in entries:
+                try:
+                    is_dir = entry.is_dir()
+                except OSError:
+                    is_dir = False
+                if is_dir:
+                    frame[1].append(entry)
+                else:
+                    frame[2].append(entry)
+            for entry in reversed(frame[1]):
+                if entry.is_symlink():
+                    continue
+                if key is not None and _is_finished_walk(key, entry):
+                    continue
+                if frame[3] is None:
+                    pending.append([entry.path, None, None, None, entry.path, None])
+                else:
+                    pending.append([entry.path, None, None, None, entry.name, frame[3]])
+            continue
         if list_directories:
-            for dirname in dirnames:
-                yield os.path.join(dirpath, dirname)
-        for filename in filenames:
-            yield os.path.join(dirpath, filename)
+            for entry in frame[1]:
+                yield entry
+        for entry in frame[2]:
+            yield entry
+        pending.pop()
+        if key is not None:
+            walk_journal.finish(key, frame[0])
+
+
+def _is_finished_walk(key, entry):
+    """Return whether the walk finished the directory entry before"""
+    try:
+        mtime = entry.stat().st_mtime
+    except OSError:
+        return False
+    return walk_journal.is_finished(key, entry.path, mtime)
 
 
 def clean_ini(path, section, parameter):
@@ -199,6 +1308,8 @@ def clean_ini(path, section, parameter):
             delete(path, True)
         fp = codecs.open(path, 'wb', encoding='utf_8')
         config.write(fp)
+        fp.close()
+        stat_cache.invalidate(path)
 
 
 def clean_json(path, target):
@@ -235,35 +1346,55 @@ def clean_json(path, target):
         if options.get('shred'):
             delete(path, True)
         # write file
-        json.dump(js, open(path, 'w'))
+        with open(path, 'w') as f:
+            json.dump(js, f)
+        stat_cache.invalidate(path)
 
 
-def delete(path, shred=False, ignore_missing=False, allow_shred=True):
+def delete(path, shred=False, ignore_missing=False, allow_shred=True, dir_fd=None):
     """Delete path that is either file, directory, link or FIFO.
 
        If shred is enabled as a function parameter or the BleachBit global
        parameter, the path will be shredded unless allow_shred = False.
+
+       dir_fd is the DirFd of the parent directory (for example, from a
+       DirFdEntry), and then the path is stat'ed and removed by its name
+       relative to the parent.  Shredding still works by path.
     """
+    def remove(path, rmdir=False):
+        throttle.unlink()
+        if rmdir:
+            os.rmdir(path)
+        else:
+            os.remove(path)
+
     from bleachbit.Options import options
+    if dir_fd is not None and not (allow_shred and (shred or options.get('shred'))):
+        _delete_at(path, dir_fd, ignore_missing)
+        return
     is_special = False
     path = extended_path(path)
-    if not os.path.lexists(path):
+    if not lexists(path):
         if ignore_missing:
             return
         raise OSError(2, 'No such file or directory', path)
     if 'posix' == os.name:
         # With certain (relatively rare) files on Windows os.lstat()
         # may return Access Denied
-        mode = os.lstat(path)[stat.ST_MODE]
+        mode = stat_cache.lstat(path)[stat.ST_MODE]
         is_special = stat.S_ISFIFO(mode) or stat.S_ISLNK(mode)
     if is_special:
-        os.remove(path)
-    elif os.path.isdir(path):
+        remove(path)
+        stat_cache.invalidate(path)
+        listing_cache.remove(extended_path_undo(path))
+    elif isdir(path):
         delpath = path
         if allow_shred and (shred or options.get('shred')):
             delpath = wipe_name(path)
         try:
-            os.rmdir(delpath)
+            remove(delpath, True)
+            stat_cache.invalidate(path)
+            listing_cache.remove(extended_path_undo(path))
         except OSError as e:
             # [Errno 39] Directory not empty
             # https://bugs.launchpad.net/bleachbit/+bug/1012930
@@ -280,7 +1411,7 @@ def delete(path, shred=False, ignore_missing=False, allow_shred=True):
                 logger.info("directory is not empty: %s", path)
             else:
                 raise
-    elif os.path.isfile(path):
+    elif isfile(path):
         # wipe contents
         if allow_shred and (shred or options.get('shred')):
             try:
@@ -296,17 +1427,49 @@ def delete(path, shred=False, ignore_missing=False, allow_shred=True):
                 # permission denied (13) happens shredding MSIE 8 on Windows 7
                 logger.debug("IOError #%s shredding '%s'", e.errno, path, exc_info=True)
             # wipe name
-            os.remove(wipe_name(path))
+            remove(wipe_name(path))
         else:
             # unlink
-            os.remove(path)
+            remove(path)
+            stat_cache.invalidate(path)
+        listing_cache.remove(extended_path_undo(path))
     else:
         logger.info("special file type cannot be deleted: %s", path)
 
 
+def _delete_at(path, dir_fd, ignore_missing):
+    """Like delete() without shredding, but by the name of path in the
+    open parent directory dir_fd (a DirFd)"""
+    name = os.path.basename(path)
+    try:
+        mode = dir_fd.lstat(name).st_mode
+    except OSError as e:
+        if ignore_missing and errno.ENOENT == e.errno:
+            return
+        raise
+    if stat.S_ISDIR(mode):
+        throttle.unlink()
+        try:
+            remove_at(dir_fd.fd, name, True)
+        except OSError as e:
+            # [Errno 39] Directory not empty
+            if errno.ENOTEMPTY == e.errno:
+                logger.info("directory is not empty: %s", path)
+                return
+            raise
+    elif stat.S_ISREG(mode) or stat.S_ISLNK(mode) or stat.S_ISFIFO(mode):
+        throttle.unlink()
+        remove_at(dir_fd.fd, name)
+    else:
+        logger.info("special file type cannot be deleted: %s", path)
+        return
+    stat_cache.invalidate(path)
+    listing_cache.remove(path)
+
+
 def ego_owner(filename):
     """Return whether current user owns the file"""
-    return os.lstat(filename).st_uid == os.getuid()
+    return stat_cache.lstat(filename).st_uid == os.getuid()
 
 
 def exists_in_path(filename):
@@ -357,6 +1520,7 @@ def execute_sqlite3(path, cmds):
     cursor.close()
     conn.commit()
     conn.close()
+    stat_cache.invalidate(path)
 
 
 def expand_glob_join(pathname1, pathname2):
@@ -415,7 +1579,7 @@ def getsize(path):
        and symlinks"""
     if 'posix' == os.name:
         try:
-            __stat = os.lstat(path)
+            __stat = stat_cache.lstat(path)
         except OSError as e:
             # OSError: [Errno 13] Permission denied
             # can happen when a regular user is trying to find the size of /var/log/hp/tmp
@@ -443,8 +1607,16 @@ def getsize(path):
 def getsizedir(path):
     """Return the size of the contents of a directory"""
     total_bytes = 0
-    for node in children_in_directory(path, list_directories=False):
-        total_bytes += getsize(node)
+    for entry in walk_entries(path, list_directories=False):
+        if 'posix' == os.name:
+            try:
+                total_bytes += entry.stat(follow_symlinks=False).st_blocks * 512
+            except OSError as e:
+                # see getsize()
+                if errno.EACCES != e.errno:
+                    raise
+        else:
+            total_bytes += getsize(entry.path)
     return total_bytes
 
 
@@ -594,39 +1766,20 @@ def uris_to_paths(file_uris):
 def whitelisted_posix(path, check_realpath=True):
     """Check whether this POSIX path is whitelisted"""
     from bleachbit.Options import options
-    if check_realpath and os.path.islink(path):
+    if check_realpath and islink(path):
         # also check the link name
         if whitelisted_posix(path, False):
             return True
         # resolve symlink
         path = os.path.realpath(path)
-    for pathname in options.get_whitelist_paths():
-        if pathname[0] == 'file' and path == pathname[1]:
-            return True
-        if pathname[0] == 'folder':
-            if path == pathname[1]:
-                return True
-            if path.startswith(pathname[1] + os.sep):
-                return True
-    return False
+    return options.get_whitelist().match(path)
 
 
 def whitelisted_windows(path):
     """Check whether this Windows path is whitelisted"""
     from bleachbit.Options import options
-    for pathname in options.get_whitelist_paths():
-        # Windows is case insensitive
-        if pathname[0] == 'file' and path.lower() == pathname[1].lower():
-            return True
-        if pathname[0] == 'folder':
-            if path.lower() == pathname[1].lower():
-                return True
-            if path.lower().startswith(pathname[1].lower() + os.sep):
-                return True
-            # Simple drive letter like C:\ matches everything below
-            if len(pathname[1]) == 3 and path.lower().startswith(pathname[1].lower()):
-                return True
-    return False
+    # Windows is case insensitive
+    return options.get_whitelist().match(path)
 
 if 'nt' == os.name:
     whitelisted = whitelisted_windows
@@ -655,6 +1808,7 @@ def wipe_contents(path, truncate=True):
                 raise
         blanks = chr(0) * 4096
         while size > 0:
+            throttle.write(4096)
             f.write(blanks)
             size -= 4096
         f.flush()  # flush to OS buffer
@@ -701,10 +1855,14 @@ def wipe_contents(path, truncate=True):
     if truncate:
         truncate_f(f)
     f.close()
+    stat_cache.invalidate(path)
 
 
 def wipe_name(pathname1):
     """Wipe the original filename and return the new pathname"""
+    # The children of a directory are deleted before the directory,
+    # so only this path needs to leave the stat cache.
+    stat_cache.invalidate(pathname1)
     (head, _) = os.path.split(pathname1)
     # reference http://en.wikipedia.org/wiki/Comparison_of_file_systems#Limits
     maxlen = 226
@@ -808,6 +1966,7 @@ def wipe_path(pathname, idle=False):
         # Write large blocks to quickly fill the disk.
         blanks = chr(0) * 65535
         while True:
+            throttle.write(len(blanks))
             try:
                 f.write(blanks)
             except IOError as e:
@@ -879,3 +2038,8 @@ def vacuum_sqlite3(path):
 
 
 openfiles = OpenFiles()
+stat_cache = StatCache()
+listing_cache = ListingCache()
+walk_journal = WalkJournal()
+throttle = Throttle()
+overlap = Overlap()
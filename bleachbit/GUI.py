@@ -227,6 +227,7 @@ class GtkLoggerHandler(logging.Handler):
     def __init__(self, append_text):
         logging.Handler.__init__(self)
         self.append_text = append_text
+        self.gui_thread = threading.current_thread()
         self.min_level = logging.WARNING
         if '--debug-log' in sys.argv:
             self.min_level = logging.DEBUG
@@ -238,7 +239,11 @@ class GtkLoggerHandler(logging.Handler):
         msg = record.getMessage()
         if record.exc_text:
             msg = msg + '\n' + record.exc_text
-        self.append_text(msg + '\n', tag)
+        if threading.current_thread() is self.gui_thread:
+            self.append_text(msg + '\n', tag)
+        else:
+            # Worker threads (see preference 'jobs') must not touch GTK.
+            gobject.idle_add(self.append_text, msg + '\n', tag)
 
 
 class GUI:
@@ -377,7 +382,8 @@ class GUI:
             self.set_sensitive(False)
             self.textbuffer.set_text("")
             self.progressbar.show()
-            self.worker = Worker.Worker(self, really_delete, operations)
+            self.worker = Worker.Worker(self, really_delete, operations,
+                                        options.get('jobs'))
         except Exception:
             logger.exception('Error in Worker()')
         else:
@@ -187,8 +187,25 @@ class PreferencesDialog:
         cb_units_iec.set_active(options.get("units_iec"))
         cb_units_iec.connect('toggled', self.__toggle_callback, 'units_iec')
         vbox.pack_start(cb_units_iec, False)
+
+        # Run several cleaner options at the same time.
+        hbox_jobs = gtk.HBox()
+        # TRANSLATORS: The number of cleaner options which run at the
+        # same time.  More can be faster on slow or networked disks.
+        label_jobs = gtk.Label(_("Parallel cleaning jobs:"))
+        hbox_jobs.pack_start(label_jobs, False)
+        adjustment_jobs = gtk.Adjustment(value=options.get('jobs'), lower=1,
+                                         upper=32, step_incr=1)
+        spin_jobs = gtk.SpinButton(adjustment_jobs)
+        spin_jobs.connect('value-changed', self.__jobs_callback)
+        hbox_jobs.pack_start(spin_jobs, False)
+        vbox.pack_start(hbox_jobs, False)
         return vbox
 
+    def __jobs_callback(self, spinbutton):
+        """Callback for changing the number of parallel jobs"""
+        options.set('jobs', spinbutton.get_value_as_int())
+
     def __drives_page(self):
         """Return widget containing the drives page"""
 
@@ -0,0 +1,146 @@
+# vim: ts=4:sw=4:expandtab
+
+# BleachBit
+# Copyright (C) 2008-2018 Andrew Ziem
+# https://www.bleachbit.org
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""
+Journal of the progress of a clean, to resume it after an interruption
+"""
+
+from __future__ import absolute_import, print_function
+
+from bleachbit import FSE
+
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+VERSION = 1
+
+
+class Journal:
+
+    """Append-only journal of the progress of a clean
+
+    The file has one JSON record per line: first the operations of the
+    run, then a record for each cleaner option (or 'deepscan') which
+    finished, and a record for each directory which a walk finished,
+    with the key of the walk and the mtime of the directory.  A finished
+    run removes its journal.
+
+    To resume, load() the journal and run its operations again: the
+    finished options are skipped, and a walk skips the directories it
+    finished if their mtime did not change."""
+
+    # Seconds between writes of walk records to the disk.  Finished
+    # options are written at once.
+    flush_interval = 1.0
+
+    def __init__(self, pathname):
+        self.pathname = pathname
+        self.operations = None
+        self.done = set()
+        self.walks = {}
+        self.f = None
+        self.flush_time = 0
+        self.lock = threading.Lock()
+
+    def load(self):
+        """Read the journal of an interrupted run
+
+        This raises IOError if there is no journal and ValueError if
+        it is not valid."""
+        with open(self.pathname) as f:
+            header = json.loads(f.readline() or '{}')
+            if not isinstance(header, dict) or 'journal' != header.get('type') \
+                    or VERSION != header.get('version'):
+                raise ValueError('Not a journal: %s' % self.pathname)
+            self.operations = dict((str(operation), [str(option_id) for option_id in option_ids])
+                                   for (operation, option_ids) in header['operations'].items())
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # the last line may be cut short by the interruption
+                    break
+                if 'done' == record['type']:
+                    self.done.add(str(record['option']))
+                elif 'walk' == record['type']:
+                    dirs = self.walks.setdefault(record['key'], {})
+                    dirs[record['path'].encode(FSE)] = record['mtime']
+
+    def open(self, operations):
+        """Begin writing, after the loaded records if resuming"""
+        if self.operations is None:
+            self.f = open(self.pathname, 'w')
+            self.write({'type': 'journal', 'version': VERSION,
+                        'operations': operations}, True)
+        else:
+            self.f = open(self.pathname, 'a')
+
+    def write(self, record, flush=False):
+        """Append one record"""
+        with self.lock:
+            self.f.write(json.dumps(record, sort_keys=True) + '\n')
+            now = time.time()
+            if flush or now - self.flush_time > self.flush_interval:
+                self.f.flush()
+                self.flush_time = now
+
+    def close(self, finished=True):
+        """Close the journal, and remove it if the run finished"""
+        if self.f is None:
+            # not opened
+            return
+        self.f.close()
+        self.f = None
+        if finished:
+            os.remove(self.pathname)
+
+    def is_done(self, operation_option):
+        """Return whether the option finished before the interruption"""
+        return operation_option in self.done
+
+    def add_done(self, operation_option):
+        """Record a finished option"""
+        self.write({'type': 'done', 'option': operation_option}, True)
+
+    def is_finished_walk(self, key, path, mtime):
+        """Return whether a walk finished the unchanged directory"""
+        if isinstance(path, unicode):
+            # the loaded paths are str
+            try:
+                path = path.encode(FSE)
+            except UnicodeEncodeError:
+                return False
+        return self.walks.get(key, {}).get(path) == mtime
+
+    def add_finished_walk(self, key, path, mtime):
+        """Record a directory which a walk finished"""
+        if isinstance(path, unicode):
+            upath = path
+        else:
+            try:
+                upath = path.decode(FSE)
+            except UnicodeDecodeError:
+                return
+        self.write({'type': 'walk', 'key': key, 'path': upath, 'mtime': mtime})
@@ -42,6 +42,7 @@ boolean_keys = ['auto_hide', 'auto_start', 'check_beta',
                 'check_online_updates', 'first_start', 'shred', 'exit_done', 'delete_confirmation', 'units_iec']
 if 'nt' == os.name:
     boolean_keys.append('update_winapp2')
+int_keys = ['jobs']
 
 
 def path_to_option(pathname):
@@ -62,6 +63,7 @@ class Options:
 
     def __init__(self):
         self.purged = False
+        self.whitelist = None
         self.config = bleachbit.RawConfigParser()
         self.config.optionxform = str  # make keys case sensitive for hashpath purging
         self.config._boolean_states['t'] = True
@@ -124,6 +126,8 @@ class Options:
             option = option[0] + option[2:]
         if option in boolean_keys:
             return self.config.getboolean(section, option)
+        if option in int_keys:
+            return self.config.getint(section, option)
         return self.config.get(section, option.encode('utf-8'))
 
     def get_hashpath(self, pathname):
@@ -173,6 +177,16 @@ class Options:
         """Return the whitelist of paths"""
         return self.get_paths("whitelist/paths")
 
+    def get_whitelist(self):
+        """Return the whitelist compiled for matching
+
+        It is compiled on first use and kept until the whitelist changes."""
+        if self.whitelist is None:
+            from bleachbit.FileUtilities import Whitelist
+            self.whitelist = Whitelist(self.get_whitelist_paths(),
+                                       case_sensitive='nt' != os.name)
+        return self.whitelist
+
     def get_custom_paths(self):
         """Return list of custom paths"""
         return self.get_paths("custom/paths")
@@ -193,6 +207,7 @@ class Options:
 
     def restore(self):
         """Restore saved options from disk"""
+        self.whitelist = None
         try:
             self.config.read(bleachbit.options_file)
         except:
@@ -218,6 +233,7 @@ class Options:
         self.__set_default("exit_done", False)
         self.__set_default("delete_confirmation", True)
         self.__set_default("units_iec", False)
+        self.__set_default("jobs", 1)
 
         if 'nt' == os.name:
             self.__set_default("update_winapp2", False)
@@ -272,6 +288,7 @@ class Options:
             self.config.set(section, str(counter) + '_type', value[0])
             self.config.set(section, str(counter) + '_path', value[1])
             counter += 1
+        self.whitelist = None
         self.__flush()
 
     def set_custom_paths(self, values):
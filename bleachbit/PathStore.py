@@ -0,0 +1,157 @@
+# vim: ts=4:sw=4:expandtab
+
+# BleachBit
+# Copyright (C) 2008-2018 Andrew Ziem
+# https://www.bleachbit.org
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""
+Compact storage for many paths
+"""
+
+from __future__ import absolute_import, print_function
+
+from bleachbit import FSE
+
+import array
+import os
+import sys
+
+
+class PathStore:
+
+    """A list of paths which keeps each folder once
+
+    Each folder is a node of a trie, with the number of its parent
+    folder and its own name, so the common prefixes of the paths are
+    stored once.  A path is the number of its folder and its name, and
+    the names are packed in one buffer.  For millions of paths under a
+    few folders, this takes a fraction of the memory of a list of
+    strings.
+
+    Paths come back as they were added, as str or unicode, except that
+    repeated separators are collapsed, like os.path.split() does."""
+
+    def __init__(self):
+        # the folders: parent number (-1 for a root) and name
+        self.dir_parents = array.array('i')
+        self.dir_names = []
+        self.dir_numbers = {}
+        # the paths: folder number, end of the name, and whether unicode
+        self.path_dirs = array.array('i')
+        self.name_ends = array.array('L')
+        self.names = bytearray()
+        self.unicode_flags = bytearray()
+        # paths are often added and read folder by folder
+        self.last_add = (None, None)
+        self.last_get = (None, None)
+
+    def __len__(self):
+        return len(self.path_dirs)
+
+    def __iter__(self):
+        """Yield the paths in the order they were added"""
+        for i in range(len(self.path_dirs)):
+            yield self[i]
+
+    def __getitem__(self, i):
+        """Return path number i"""
+        dir_number = self.path_dirs[i]
+        if dir_number == self.last_get[0]:
+            dirname = self.last_get[1]
+        else:
+            dirname = self.get_dir(dir_number)
+            self.last_get = (dir_number, dirname)
+        path = os.path.join(dirname, self.get_name(i))
+        if self.unicode_flags[i]:
+            return path.decode(FSE)
+        return path
+
+    def add(self, path):
+        """Add a path, and return its number"""
+        is_unicode = isinstance(path, unicode)
+        if is_unicode:
+            path = path.encode(FSE)
+        (dirname, name) = os.path.split(path)
+        if dirname == self.last_add[0]:
+            dir_number = self.last_add[1]
+        else:
+            dir_number = self.add_dir(dirname)
+            self.last_add = (dirname, dir_number)
+        self.path_dirs.append(dir_number)
+        self.names.extend(name)
+        self.name_ends.append(len(self.names))
+        self.unicode_flags.append(is_unicode)
+        return len(self.path_dirs) - 1
+
+    def add_dir(self, dirname):
+        """Return the number of a folder, and add it if it is new"""
+        (parent, name) = os.path.split(dirname)
+        if parent == dirname or not name:
+            # a root, such as / or C:\ or the empty folder of a
+            # relative path
+            key = (-1, dirname)
+        else:
+            key = (self.add_dir(parent), name)
+        dir_number = self.dir_numbers.get(key)
+        if dir_number is None:
+            dir_number = len(self.dir_names)
+            self.dir_numbers[key] = dir_number
+            self.dir_parents.append(key[0])
+            self.dir_names.append(key[1])
+        return dir_number
+
+    def get_dir(self, dir_number):
+        """Return the path of a folder"""
+        return os.path.join(*self.get_dir_names(dir_number))
+
+    def get_dir_names(self, dir_number):
+        """Return the names from the root down to a folder"""
+        names = []
+        while dir_number >= 0:
+            names.append(self.dir_names[dir_number])
+            dir_number = self.dir_parents[dir_number]
+        names.reverse()
+        return names
+
+    def get_name(self, i):
+        """Return the name of path number i, as str"""
+        start = self.name_ends[i - 1] if i > 0 else 0
+        return str(self.names[start:self.name_ends[i]])
+
+    def iter_sorted(self):
+        """Yield the paths sorted by folder, and then by name
+
+        This is the order of a walk from the top down, with each
+        directory listing sorted.  Only the names of one folder are
+        sorted at a time."""
+        by_dir = {}
+        for (i, dir_number) in enumerate(self.path_dirs):
+            by_dir.setdefault(dir_number, array.array('L')).append(i)
+        for dir_number in sorted(by_dir, key=self.get_dir_names):
+            for i in sorted(by_dir[dir_number], key=self.get_name):
+                yield self[i]
+
+    def sizeof(self):
+        """Return the memory footprint, in bytes"""
+        size = sys.getsizeof(self.dir_parents) + sys.getsizeof(self.dir_names) + \
+            sys.getsizeof(self.dir_numbers) + sys.getsizeof(self.path_dirs) + \
+            sys.getsizeof(self.name_ends) + sys.getsizeof(self.names) + \
+            sys.getsizeof(self.unicode_flags)
+        for key in self.dir_numbers:
+            # the name is in dir_names too
+            size += sys.getsizeof(key) + sys.getsizeof(key[1])
+        return size
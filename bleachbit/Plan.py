@@ -0,0 +1,212 @@
+# vim: ts=4:sw=4:expandtab
+
+# BleachBit
+# Copyright (C) 2008-2018 Andrew Ziem
+# https://www.bleachbit.org
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""
+Save the commands of a preview, and run them later without scanning again
+"""
+
+from __future__ import absolute_import, print_function
+
+from bleachbit import Command, FileUtilities, FSE
+from bleachbit.Cleaner import backends
+from bleachbit.PathStore import PathStore
+
+import array
+import json
+import logging
+import stat
+import threading
+
+logger = logging.getLogger(__name__)
+
+# The commands which act on one path, by their name in a plan file.
+# A Command.DeleteTree is saved as the files it would delete.
+COMMANDS = {'delete': Command.Delete,
+            'shred': Command.Shred,
+            'truncate': Command.Truncate}
+
+COMMAND_NAMES = dict((cls, name) for (name, cls) in COMMANDS.items())
+
+# the order of the commands, by their number in a loaded Plan
+COMMAND_ORDER = sorted(COMMANDS)
+
+# device, inode and size: unsigned 64-bit, except on Windows, where a
+# float holds them
+STAT_TYPECODE = 'L' if array.array('L').itemsize >= 8 else 'd'
+
+VERSION = 2
+
+
+class PlanWriter:
+
+    """Write the commands of a preview to a plan file
+
+    The file has one JSON record per line.  The first line is the
+    header with the operations, and each other line is a command with
+    the path and its device, inode, size and mtime at the time of the
+    preview.  Other commands, such as vacuuming a database, cannot be
+    saved, so their cleaner option is marked to be scanned again.
+
+    A directory tree is saved as a command for each file and folder
+    which the preview listed in it (see add_tree_file()), so a clean
+    from the plan does not delete files added to the tree later."""
+
+    def __init__(self, pathname, operations):
+        self.f = open(pathname, 'w')
+        self.lock = threading.Lock()
+        self.rescan = set()
+        self.write({'type': 'plan', 'version': VERSION,
+                    'operations': operations})
+
+    def write(self, record):
+        """Write one record"""
+        self.f.write(json.dumps(record, sort_keys=True) + '\n')
+
+    def add(self, cmd, operation_option, ret):
+        """Add the result of a command from the preview"""
+        if 0 == ret['n_deleted'] and 0 == ret['n_special']:
+            # whitelisted
+            return
+        if isinstance(cmd, Command.DeleteTree):
+            # its files are added already
+            return
+        name = COMMAND_NAMES.get(cmd.__class__)
+        with self.lock:
+            if name is None:
+                if operation_option not in self.rescan:
+                    self.rescan.add(operation_option)
+                    self.write({'option': operation_option, 'command': 'rescan'})
+                return
+            try:
+                st = FileUtilities.stat_cache.lstat(cmd.path)
+            except OSError:
+                logger.warning('cannot add to the plan: %s', cmd.path, exc_info=True)
+                return
+            self.write_path(operation_option, name, cmd.path, st)
+
+    def add_tree_file(self, cmd, operation_option, path, st):
+        """Add a file which a Command.DeleteTree of the preview would
+        delete, with its lstat() result"""
+        name = 'shred' if cmd.shred else 'delete'
+        with self.lock:
+            self.write_path(operation_option, name, path, st)
+
+    def write_path(self, operation_option, name, path, st):
+        """Write the record of a command for a path"""
+        if not isinstance(path, unicode):
+            try:
+                path = path.decode(FSE)
+            except UnicodeDecodeError:
+                logger.warning('cannot add to the plan: %s', path, exc_info=True)
+                return
+        self.write({'option': operation_option, 'command': name,
+                    'path': path, 'dev': st.st_dev, 'ino': st.st_ino,
+                    'size': st.st_size, 'mtime': st.st_mtime})
+
+    def close(self):
+        """Finish the plan file"""
+        self.f.close()
+
+
+class Plan:
+
+    """The commands of a plan file, to run without scanning again
+
+    Before it runs a command, the plan checks with one lstat() that the
+    path is still the same file, so a file which was replaced or changed
+    after the preview is not deleted.
+
+    A plan may have millions of commands, so the records are kept in
+    arrays, and the paths in a PathStore, instead of a dictionary for
+    each.  options has the numbers of the records of each option."""
+
+    def __init__(self, pathname):
+        self.options = {}
+        self.rescan = set()
+        self.n_changed = 0
+        self.paths = PathStore()
+        self.commands = array.array('B')
+        self.stats = array.array(STAT_TYPECODE)
+        self.mtimes = array.array('d')
+        with open(pathname) as f:
+            header = json.loads(f.readline() or '{}')
+            if not isinstance(header, dict) or 'plan' != header.get('type') \
+                    or VERSION != header.get('version'):
+                raise ValueError('Not a plan file: %s' % pathname)
+            self.operations = dict((str(operation), [str(option_id) for option_id in option_ids])
+                                   for (operation, option_ids) in header['operations'].items())
+            for line in f:
+                record = json.loads(line)
+                operation_option = str(record['option'])
+                if 'rescan' == record['command']:
+                    self.rescan.add(operation_option)
+                    continue
+                n = self.paths.add(record['path'].encode(FSE))
+                self.commands.append(COMMAND_ORDER.index(record['command']))
+                self.stats.extend((record['dev'], record['ino'], record['size']))
+                self.mtimes.append(record['mtime'])
+                self.options.setdefault(operation_option, array.array('L')).append(n)
+
+    def get_record(self, n):
+        """Return record number n as a dictionary"""
+        (dev, ino, size) = self.stats[3 * n:3 * n + 3]
+        return {'command': COMMAND_ORDER[self.commands[n]], 'path': self.paths[n],
+                'dev': dev, 'ino': ino, 'size': size, 'mtime': self.mtimes[n]}
+
+    def get_records(self, operation_option):
+        """Yield the records of an option as dictionaries"""
+        for n in self.options.get(operation_option, ()):
+            yield self.get_record(n)
+
+    def has_option(self, operation_option):
+        """Return whether the plan has commands for the option"""
+        return operation_option in self.options or operation_option in self.rescan
+
+    def is_unchanged(self, record):
+        """Return whether the path is the same as in the preview"""
+        try:
+            st = FileUtilities.stat_cache.lstat(record['path'])
+        except OSError:
+            return False
+        if (st.st_dev, st.st_ino) != (record['dev'], record['ino']):
+            return False
+        if stat.S_ISDIR(st.st_mode):
+            # Deleting the files in a directory changes its mtime.  It
+            # is deleted only if it is empty.
+            return True
+        return (st.st_size, st.st_mtime) == (record['size'], record['mtime'])
+
+    def get_commands(self, operation_option):
+        """Yield the commands of a cleaner option
+
+        A cleaner option with commands which cannot be saved is scanned
+        again for those commands."""
+        for record in self.get_records(operation_option):
+            if not self.is_unchanged(record):
+                logger.warning('skipping a path which changed after the preview: %s',
+                               record['path'])
+                self.n_changed += 1
+                continue
+            yield COMMANDS[record['command']](record['path'])
+        if operation_option in self.rescan:
+            (operation, option_id) = operation_option.split('.', 1)
+            for cmd in backends[operation].get_commands(option_id):
+                if cmd.__class__ not in COMMAND_NAMES:
+                    yield cmd
@@ -0,0 +1,309 @@
+# vim: ts=4:sw=4:expandtab
+
+# BleachBit
+# Copyright (C) 2008-2018 Andrew Ziem
+# https://www.bleachbit.org
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""
+Move directory trees aside at once, and delete them in the background
+"""
+
+from __future__ import absolute_import, print_function
+
+from bleachbit import FileUtilities, FSE, options_dir
+
+import errno
+import json
+import logging
+import os
+import stat
+import subprocess
+import sys
+import tempfile
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class Manifest:
+
+    """The staged directories which are waiting for the purger
+
+    The file has one JSON record per line: a 'staged' record is written
+    to the disk before the files are moved into the staged directory,
+    and a 'purged' record after the purger deleted it.  So if the purge
+    is interrupted, the next one finds the directories which are left.
+
+    The cleaner and the purger are two processes, so each change locks
+    the file."""
+
+    def __init__(self, pathname):
+        self.pathname = pathname
+
+    def _open(self):
+        """Open and lock the manifest"""
+        import fcntl
+        f = open(self.pathname, 'a+')
+        fcntl.flock(f, fcntl.LOCK_EX)
+        return f
+
+    @staticmethod
+    def _pending(f):
+        """Return the staged directories which are not purged"""
+        f.seek(0)
+        pending = []
+        purged = set()
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # the last line may be cut short by a crash
+                continue
+            path = record['path'].encode(FSE)
+            if 'staged' == record['type']:
+                pending.append((path, record['shred']))
+            elif 'purged' == record['type']:
+                purged.add(path)
+        return [(path, shred) for (path, shred) in pending if path not in purged]
+
+    @staticmethod
+    def _write(f, record):
+        """Append one record, and wait until it is on the disk"""
+        f.seek(0, os.SEEK_END)
+        f.write(json.dumps(record, sort_keys=True) + '\n')
+        f.flush()
+        os.fsync(f.fileno())
+
+    def pending(self):
+        """Return a list of (path, shred) of directories to purge"""
+        if not os.path.exists(self.pathname):
+            return []
+        with self._open() as f:
+            return self._pending(f)
+
+    def add_staged(self, path, shred):
+        """Record a staged directory before files are moved into it"""
+        with self._open() as f:
+            self._write(f, {'type': 'staged', 'path': path.decode(FSE), 'shred': shred})
+
+    def add_purged(self, path):
+        """Record a purged directory, and empty the manifest when no
+        directory is left"""
+        with self._open() as f:
+            self._write(f, {'type': 'purged', 'path': path.decode(FSE)})
+            if not self._pending(f):
+                f.truncate(0)
+
+
+class Stager:
+
+    """Move the files of a directory into a staging directory
+
+    A rename within a file system takes the same time for a large
+    directory tree as for one file, so the cleaner can go on at once
+    while the purger deletes the staged files in the background.  The
+    staging directory must be on the same file system as the files,
+    and the staging area is in the BleachBit configuration directory,
+    so only the file system of that directory has one.  Elsewhere, the
+    files are deleted in place.  An area next to the files would be in
+    directories which other cleaner options walk.
+
+    Like FileUtilities.stat_cache, this is used for the length of a
+    run: start() and stop() are called by Worker.run()."""
+
+    def __init__(self):
+        self.manifest = None
+        self.areas = {}
+        self.n_staged = 0
+        self.lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        """Return whether directories are staged in this run"""
+        return self.manifest is not None
+
+    def start(self, manifest):
+        """Begin staging, and purge what an earlier run left"""
+        self.manifest = manifest
+        self.areas = {}
+        self.n_staged = 0
+        if manifest.pending():
+            start_purger(manifest.pathname)
+
+    def stop(self):
+        """Stop staging, and start the purger for the staged files"""
+        if self.n_staged:
+            start_purger(self.manifest.pathname)
+        self.manifest = None
+
+    def get_area(self, path, st_dev):
+        """Return the staging area for path on the device, or None
+
+        The area must be a real directory which only this user can
+        use, because the purger deletes everything in it."""
+        with self.lock:
+            if st_dev in self.areas:
+                return self.areas[st_dev]
+            area = os.path.join(options_dir, 'staging')
+            if area.startswith(os.path.join(os.path.normpath(path), '')):
+                # it would be moved into itself
+                return None
+            try:
+                try:
+                    os.mkdir(area, 0o700)
+                except OSError as e:
+                    if errno.EEXIST != e.errno:
+                        raise
+                st = os.lstat(area)
+                if not is_private_directory(st):
+                    logger.warning('not a private directory: %s', area)
+                    area = None
+                elif st.st_dev != st_dev:
+                    # another file system
+                    area = None
+            except OSError as e:
+                logger.debug('cannot use staging area %s: %s', area, e)
+                area = None
+            self.areas[st_dev] = area
+            return area
+
+    def stage(self, path, shred):
+        """Move the files under directory path to a staging directory
+
+        This returns the number of names moved.  Files which could not
+        be moved, such as a mount point, stay in place."""
+        try:
+            st_dev = os.lstat(path).st_dev
+            names = os.listdir(path)
+        except OSError:
+            return 0
+        if not names:
+            return 0
+        area = self.get_area(path, st_dev)
+        if area is None:
+            return 0
+        staged = tempfile.mkdtemp(prefix='purge-', dir=area)
+        self.manifest.add_staged(staged, shred)
+        with self.lock:
+            self.n_staged += 1
+        n_moved = 0
+        for name in names:
+            try:
+                os.rename(os.path.join(path, name), os.path.join(staged, name))
+            except OSError as e:
+                logger.debug('cannot stage %s: %s', os.path.join(path, name), e)
+                continue
+            n_moved += 1
+        logger.debug('staged %s in %s', path, staged)
+        return n_moved
+
+
+stager = Stager()
+
+
+def is_private_directory(st):
+    """Return whether the lstat() result is a directory owned by this
+    user and closed to the others"""
+    return stat.S_ISDIR(st.st_mode) and st.st_uid == os.geteuid() and \
+        0o700 == stat.S_IMODE(st.st_mode)
+
+
+def purge_directory(path, shred):
+    """Delete a staged directory and everything under it
+
+    The purger does not follow a symlink, nor delete anything else
+    which is not a directory.  Return whether the manifest can forget
+    the path: it is gone, or it is not a directory."""
+    try:
+        st = os.lstat(path)
+    except OSError as e:
+        if errno.ENOENT == e.errno:
+            return True
+        logger.error('cannot purge %s: %s', path, e)
+        return False
+    if not stat.S_ISDIR(st.st_mode):
+        logger.error('cannot purge %s: not a directory', path)
+        return True
+    for entry in FileUtilities.walk_entries(path, True, True):
+        try:
+            FileUtilities.delete(entry.path, shred, ignore_missing=True,
+                                 dir_fd=getattr(entry, 'dir_fd', None))
+        except OSError as e:
+            logger.error('cannot purge %s: %s', entry.path, e)
+    try:
+        os.rmdir(path)
+    except OSError as e:
+        if errno.ENOENT != e.errno:
+            logger.error('cannot purge %s: %s', path, e)
+            return False
+    return True
+
+
+def purge(manifest):
+    """Delete the staged directories until none is left
+
+    Only one purger runs at a time: if another one holds the lock, this
+    returns at once.  A directory is marked purged only when it is
+    gone (see purge_directory()).  Return the number of directories purged."""
+    import fcntl
+    n_purged = 0
+    with open(manifest.pathname + '.lock', 'w') as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except IOError as e:
+            if e.errno not in (errno.EAGAIN, errno.EACCES):
+                raise
+            logger.debug('another purger is running')
+            return 0
+        # directories which could not be deleted stay in the manifest
+        # for the next purge, but are not tried again here
+        failed = set()
+        while True:
+            # the cleaner may stage more directories meanwhile
+            pending = [(path, shred) for (path, shred) in manifest.pending()
+                       if path not in failed]
+            if not pending:
+                return n_purged
+            for (path, shred) in pending:
+                if not purge_directory(path, shred):
+                    failed.add(path)
+                    continue
+                manifest.add_purged(path)
+                n_purged += 1
+
+
+def start_purger(manifest_pathname):
+    """Start the purger in a process of its own, which goes on after
+    BleachBit exits"""
+    logger.debug('starting the purger for %s', manifest_pathname)
+    with open(os.devnull, 'r+') as devnull:
+        subprocess.Popen([sys.executable, '-m', 'bleachbit.Purge', manifest_pathname],
+                         cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                         stdin=devnull, stdout=devnull, stderr=devnull,
+                         close_fds=True, preexec_fn=os.setsid)
+
+
+def resume(manifest_pathname):
+    """Start the purger if an earlier run left staged directories"""
+    if Manifest(manifest_pathname).pending():
+        start_purger(manifest_pathname)
+
+
+if __name__ == '__main__':
+    from bleachbit import Unix
+    Unix.set_low_priority(Unix.IOPRIO_CLASS_IDLE)
+    purge(Manifest(sys.argv[1]))
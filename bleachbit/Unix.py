@@ -36,6 +36,8 @@ import re
 import shlex
 import subprocess
 import sys
+import threading
+import time
 
 logger = logging.getLogger(__name__)
 
@@ -463,37 +465,136 @@ def is_broken_xdg_desktop(pathname):
     return False
 
 
-def is_running_darwin(exename, run_ps=None):
+def running_processes_darwin(run_ps=None):
+    """Return a dictionary of process name to the set of its pids"""
     if run_ps is None:
         def run_ps():
             return subprocess.check_output(["ps", "aux", "-c"])
+    rows = [re.split(r"\s+", p, 10) for p in run_ps().split("\n") if p != ""]
+    if not rows or len(rows.pop(0)) <= 10:  # drop the header
+        raise RuntimeError("Unexpected output from ps")
+    processes = {}
     try:
-        processess = (re.split(r"\s+", p, 10)[10] for p in run_ps().split("\n") if p != "")
-        next(processess)  # drop the header
-        return exename in processess
-    except IndexError:
+        for fields in rows:
+            processes.setdefault(fields[10], set()).add(int(fields[1]))
+    except (IndexError, ValueError):
         raise RuntimeError("Unexpected output from ps")
+    return processes
 
 
-def is_running_linux(exename):
-    """Check whether exename is running"""
-    for filename in glob.iglob("/proc/*/exe"):
-        try:
-            target = os.path.realpath(filename)
-        except TypeError:
-            # happens, for example, when link points to
-            # '/etc/password\x00 (deleted)'
+def running_processes_linux(proc='/proc'):
+    """Return a dictionary of executable basename to the set of its pids"""
+    processes = {}
+    for pid in os.listdir(proc):
+        if not pid.isdigit():
             continue
+        try:
+            # The kernel already resolves the symlinks, so one
+            # readlink() is enough.
+            target = os.readlink(os.path.join(proc, pid, 'exe'))
         except OSError:
-            # 13 = permission denied
+            # 13 = permission denied, or the process ended
             continue
-        if exename == os.path.basename(target):
-            return True
-    return False
+        processes.setdefault(os.path.basename(target), set()).add(int(pid))
+    return processes
+
+
+def running_processes():
+    """Return a dictionary of executable basename to the set of its pids"""
+    if sys.platform.startswith('linux'):
+        return running_processes_linux()
+    elif ('darwin' == sys.platform or
+          sys.platform.startswith('openbsd') or
+          sys.platform.startswith('freebsd')):
+        return running_processes_darwin()
+    else:
+        raise RuntimeError('unsupported platform for running_processes()')
+
+
+class ProcessSnapshot:
+
+    """Run-scoped snapshot of the process table
+
+    Worker enables the snapshot for the duration of a run, so checking
+    whether dozens of cleaners are running lists the processes once
+    instead of once per <running> element.  The existing files matching
+    a <running type="pathname"> glob are remembered the same way.  Both
+    are taken again once they are older than ttl seconds, so a program
+    which starts or stops during a long run is noticed."""
+
+    ttl = 10
+
+    def __init__(self, list_processes=None):
+        self.enabled = False
+        self.list_processes = list_processes or running_processes
+        self.lock = threading.Lock()
+        self.processes = None
+        self.pathnames = {}
+        self.taken = 0
+        self.snapshots = 0
+
+    def start(self):
+        """Forget any earlier snapshot and begin reusing snapshots"""
+        with self.lock:
+            self.processes = None
+            self.pathnames = {}
+            self.snapshots = 0
+            self.enabled = True
+
+    def stop(self):
+        """Stop reusing snapshots and forget everything"""
+        with self.lock:
+            self.enabled = False
+            self.processes = None
+            self.pathnames = {}
+        logger.debug('process snapshot: taken %d times', self.snapshots)
+
+    def refresh(self):
+        """Take a new snapshot if the current one has expired"""
+        now = time.time()
+        if self.processes is not None and \
+                0 <= now - self.taken < self.ttl:
+            return
+        self.processes = self.list_processes()
+        self.pathnames = {}
+        self.taken = now
+        self.snapshots += 1
+
+    def is_running(self, exename):
+        """Check whether exename is running"""
+        if not self.enabled:
+            return exename in self.list_processes()
+        with self.lock:
+            self.refresh()
+            return exename in self.processes
+
+    def glob(self, pathname):
+        """Return the existing paths matching the pattern pathname"""
+        if not self.enabled:
+            return [p for p in glob.iglob(pathname) if os.path.exists(p)]
+        with self.lock:
+            self.refresh()
+            try:
+                return self.pathnames[pathname]
+            except KeyError:
+                paths = [p for p in glob.iglob(pathname) if os.path.exists(p)]
+                self.pathnames[pathname] = paths
+                return paths
+
+
+def is_running_darwin(exename, run_ps=None):
+    return exename in running_processes_darwin(run_ps)
+
+
+def is_running_linux(exename):
+    """Check whether exename is running"""
+    return exename in running_processes_linux()
 
 
 def is_running(exename):
     """Check whether exename is running"""
+    if process_snapshot.enabled:
+        return process_snapshot.is_running(exename)
     if sys.platform.startswith('linux'):
         return is_running_linux(exename)
     elif ('darwin' == sys.platform or
@@ -504,6 +605,37 @@ def is_running(exename):
         raise RuntimeError('unsupported platform for physical_free()')
 
 
+# ioprio_set() by machine, for Linux
+IOPRIO_SET_SYSCALLS = {'x86_64': 251, 'i386': 289, 'i686': 289,
+                       'aarch64': 30, 'armv7l': 314, 'ppc64le': 273}
+IOPRIO_CLASS_BE = 2
+IOPRIO_CLASS_IDLE = 3
+
+
+def set_low_priority(io_class=IOPRIO_CLASS_BE, level=7):
+    """Run this process at the lowest CPU and I/O priority
+
+    The CPU niceness becomes 19.  On Linux, the I/O class becomes
+    best-effort at its lowest level, or idle, which waits until the
+    disk has nothing else to do.  Return whether the I/O priority was
+    set."""
+    os.nice(19 - os.nice(0))
+    if not sys.platform.startswith('linux'):
+        return False
+    import ctypes
+    import platform
+    nr = IOPRIO_SET_SYSCALLS.get(platform.machine())
+    if nr is None:
+        logger.debug('ioprio_set() is not known on %s', platform.machine())
+        return False
+    libc = ctypes.CDLL('libc.so.6', use_errno=True)
+    # IOPRIO_WHO_PROCESS, this process
+    if 0 != libc.syscall(nr, 1, 0, (io_class << 13) | level):
+        logger.debug('ioprio_set() failed: %s', os.strerror(ctypes.get_errno()))
+        return False
+    return True
+
+
 def rotated_logs():
     """Yield a list of rotated (i.e., old) logs in /var/log/"""
     # Ubuntu 9.04
@@ -665,3 +797,4 @@ def yum_clean():
 
 
 locales = Locales()
+process_snapshot = ProcessSnapshot()
@@ -24,22 +24,360 @@ Perform the preview or delete operations
 
 from __future__ import absolute_import, print_function
 
-from bleachbit import DeepScan, FileUtilities
+from bleachbit import DeepScan, FileUtilities, Purge
 from bleachbit.Cleaner import backends
 from bleachbit import _, ungettext, expanduser, FSE
 
+import bisect
+import collections
+import functools
+import heapq
 import logging
 import math
+import os
+import stat
 import sys
+import threading
+
+if sys.version_info >= (3, 0):
+    import queue
+else:
+    import Queue as queue
+
+if 'posix' == os.name:
+    from bleachbit import Unix
 
 logger = logging.getLogger(__name__)
 
 
+class BufferedCallback:
+
+    """Hold the log lines of a cleaner option run on a worker thread
+
+    The lines are replayed by the main thread, so the output keeps the
+    order of the operations, and the real ui is touched only by the
+    thread which owns it."""
+
+    def __init__(self, events=False):
+        """Create a BufferedCallback
+
+        events: (boolean) also queue events, for a ui which has
+            append_event()"""
+        self.lines = collections.deque()
+        if events:
+            self.append_event = self._append_event
+
+    def append_text(self, msg, tag=None):
+        """Queue a line of text"""
+        self.lines.append((msg, tag))
+
+    def _append_event(self, event):
+        """Queue an event"""
+        self.lines.append((event, None))
+
+    def log_error(self, msg, *args, **kwargs):
+        """Queue an error for the log, like logger.error()"""
+        if not logger.isEnabledFor(logging.ERROR):
+            return
+        exc_info = kwargs.get('exc_info')
+        if exc_info and not isinstance(exc_info, tuple):
+            exc_info = sys.exc_info()
+        record = logger.makeRecord(logger.name, logging.ERROR, '(unknown file)', 0,
+                                   msg, args, exc_info or None)
+        self.lines.append((record, None))
+
+    def flush(self, ui):
+        """Pass the queued lines, events and errors to the real ui
+        and the log"""
+        while self.lines:
+            (msg, tag) = self.lines.popleft()
+            if isinstance(msg, logging.LogRecord):
+                logger.handle(msg)
+            elif isinstance(msg, dict):
+                ui.append_event(msg)
+            elif tag:
+                ui.append_text(msg, tag)
+            else:
+                ui.append_text(msg)
+
+    def update_progress_bar(self, status):
+        """Not used"""
+        pass
+
+    def update_total_size(self, size):
+        """Not used"""
+        pass
+
+    def update_item_size(self, op, opid, size):
+        """Not used: the main thread reports the sizes"""
+        pass
+
+    def worker_done(self, worker, really_delete):
+        """Not used"""
+        pass
+
+
+def decode_path(path):
+    """Return a path as unicode, decoding only str"""
+    if isinstance(path, unicode):
+        return path
+    return path.decode('utf8', 'replace')
+
+
+class Summary:
+
+    """Totals of a run by cleaner option and by top-level directory
+
+    In summary mode, Worker adds each result here instead of formatting
+    a line for it.  Only the largest top_n items are kept, in a heap of
+    (size, number, path): the number breaks ties, so paths are never
+    compared.  The top-level directory of a path is its first depth
+    components, such as /home/user/.cache.  Paths are kept as unicode."""
+
+    def __init__(self, top_n=10, depth=3):
+        self.top_n = top_n
+        self.depth = depth
+        self.options = {}
+        self.directories = {}
+        self.largest = []
+        self.n_added = 0
+
+    def top_directory(self, path):
+        """Return the top-level directory of a path"""
+        parts = path.split(os.sep)
+        if len(parts) <= self.depth + 1:
+            # a file directly in a top-level directory
+            return os.path.dirname(path)
+        return os.sep.join(parts[:self.depth + 1])
+
+    def add(self, operation_option, path, size, n_deleted):
+        """Count one result"""
+        totals = self.options.setdefault(decode_path(operation_option), [0, 0])
+        totals[0] += n_deleted
+        totals[1] += size
+        if not path:
+            return
+        path = decode_path(path)
+        totals = self.directories.setdefault(self.top_directory(path), [0, 0])
+        totals[0] += n_deleted
+        totals[1] += size
+        self.add_largest(size, path)
+
+    def add_largest(self, size, path):
+        """Keep the item if it is one of the largest"""
+        self.n_added += 1
+        if len(self.largest) < self.top_n:
+            heapq.heappush(self.largest, (size, self.n_added, path))
+        elif size > self.largest[0][0]:
+            heapq.heapreplace(self.largest, (size, self.n_added, path))
+
+    def merge(self, other):
+        """Add the totals of another Summary"""
+        for (mine, theirs) in ((self.options, other.options),
+                               (self.directories, other.directories)):
+            for (key, (count, size)) in theirs.items():
+                totals = mine.setdefault(key, [0, 0])
+                totals[0] += count
+                totals[1] += size
+        for (size, dummy, path) in other.largest:
+            self.add_largest(size, path)
+
+    def lines(self):
+        """Return the summary as lines of text"""
+        def table(totals):
+            return [u"%s %s (%d)" % (FileUtilities.bytes_to_human(size), key, count)
+                    for (key, (count, size)) in
+                    sorted(totals.items(), key=lambda item: -item[1][1])]
+        lines = [_("By option:")] + table(self.options)
+        lines += ["", _("By folder:")] + table(self.directories)
+        lines += ["", _("Largest items:")]
+        for (size, dummy, path) in sorted(self.largest, key=lambda item: (-item[0], item[2])):
+            lines.append(u"%s %s" % (FileUtilities.bytes_to_human(size), path))
+        return lines
+
+
+class OptionTask:
+
+    """Run one cleaner option on a thread of the worker pool"""
+
+    def __init__(self, worker, operation, option_id):
+        self.operation = operation
+        self.option_id = option_id
+        self.ui = BufferedCallback(worker.append_event is not None)
+        self.worker = worker.spawn(self.ui, operation, option_id)
+        self.done = threading.Event()
+        self.finished = False
+
+    def run(self):
+        """Perform the option and signal completion"""
+        try:
+            for dummy in self.worker.clean_option(self.operation, self.option_id):
+                pass
+            self.finished = True
+        except:
+            self.worker.print_exception(self.operation)
+        finally:
+            self.done.set()
+
+
+class DeviceScheduler:
+
+    """Run the commands on files with a queue for each device
+
+    Each device (st_dev) has its own queue and threads, so a slow disk
+    does not hold up the commands for the other disks.  A spinning disk
+    gets hdd_depth threads, because concurrent requests make it seek,
+    and other devices, such as SSDs and tmpfs, get depth threads.
+
+    The threads only execute the commands.  The Worker which submitted
+    a command reports its outcome on its own thread, in the order of
+    submission."""
+
+    def __init__(self, depth, hdd_depth=1):
+        self.depth = depth
+        self.hdd_depth = hdd_depth
+        self.queues = {}
+        self.threads = []
+        self.lock = threading.Lock()
+
+    def get_device(self, cmd):
+        """Return (device, directory) to queue the command for
+
+        The device is None for a command which must run alone, in
+        order: a command which is not for a file, or for a missing path.
+        The directory is set if the command deletes a directory, which
+        must wait for the commands for the files in it."""
+        from bleachbit import Command
+        if not isinstance(cmd, (Command.Delete, Command.DeleteTree)):
+            return (None, None)
+        entry = getattr(cmd, 'entry', None)
+        try:
+            if entry is None:
+                st = FileUtilities.stat_cache.lstat(cmd.path)
+            else:
+                st = entry.stat(follow_symlinks=False)
+        except OSError:
+            return (None, None)
+        if stat.S_ISDIR(st.st_mode) and not isinstance(cmd, Command.DeleteTree):
+            return (st.st_dev, cmd.path)
+        return (st.st_dev, None)
+
+    def get_queue(self, st_dev):
+        """Return the queue of a device, and start its threads"""
+        with self.lock:
+            device_queue = self.queues.get(st_dev)
+            if device_queue is not None:
+                return device_queue
+            device_queue = queue.Queue()
+            self.queues[st_dev] = device_queue
+            if FileUtilities.is_rotational(st_dev):
+                depth = self.hdd_depth
+            else:
+                depth = self.depth
+            logger.debug('device %d: %d threads', st_dev, depth)
+            for dummy in range(depth):
+                thread = threading.Thread(target=self.work, args=(device_queue,))
+                thread.daemon = True
+                thread.start()
+                self.threads.append((thread, device_queue))
+            return device_queue
+
+    def submit(self, st_dev, cmd, really_delete, done):
+        """Queue the command, and pass its outcome to done()"""
+        self.get_queue(st_dev).put((cmd, really_delete, done))
+
+    def work(self, device_queue):
+        """Execute the commands of a device"""
+        while True:
+            item = device_queue.get()
+            if item is None:
+                return
+            (cmd, really_delete, done) = item
+            ret = None
+            try:
+                for ret in cmd.execute(really_delete):
+                    pass
+            except SystemExit:
+                done(None, None)
+            except Exception as e:
+                done(e, sys.exc_info())
+            else:
+                done(ret, None)
+
+    def stop(self):
+        """Stop the threads, after the queued commands"""
+        for (thread, device_queue) in self.threads:
+            device_queue.put(None)
+        for (thread, device_queue) in self.threads:
+            thread.join()
+        self.threads = []
+        self.queues = {}
+
+
+def order_by_locality(commands):
+    """Return the commands to delete files in the order of their
+    metadata on the disk
+
+    The commands are sorted by device, inode of the parent directory
+    and inode, so the deletes in one directory go together and the
+    file system updates its inode table in order instead of seeking.
+    A directory stays after the paths under it, which must be deleted
+    first."""
+    n = len(commands)
+    keys = []
+    is_dir = []
+    for cmd in commands:
+        entry = getattr(cmd, 'entry', None)
+        try:
+            if entry is None:
+                st = FileUtilities.stat_cache.lstat(cmd.path)
+            else:
+                st = entry.stat(follow_symlinks=False)
+            parent = FileUtilities.stat_cache.lstat(os.path.dirname(cmd.path))
+        except OSError:
+            # missing, so it is quick
+            keys.append((-1, -1, -1))
+            is_dir.append(False)
+            continue
+        keys.append((st.st_dev, parent.st_ino, st.st_ino))
+        is_dir.append(stat.S_ISDIR(st.st_mode))
+    position = [0] * n
+    for (rank, i) in enumerate(sorted(range(n), key=keys.__getitem__)):
+        position[i] = rank
+    # move each directory after the last path under it
+    encoded = [cmd.path.encode(FSE) if isinstance(cmd.path, unicode) else cmd.path
+               for cmd in commands]
+    by_path = sorted(range(n), key=encoded.__getitem__)
+    paths = [encoded[i] for i in by_path]
+    rank = list(position)
+    for i in range(n):
+        if not is_dir[i]:
+            continue
+        prefix = os.path.join(encoded[i], '')
+        k = bisect.bisect_left(paths, prefix)
+        while k < n and paths[k].startswith(prefix):
+            rank[i] = max(rank[i], position[by_path[k]])
+            k += 1
+    # on a tie, the files first, and then the deepest directory
+    return [commands[i] for i in sorted(
+        range(n), key=lambda i: (rank[i], is_dir[i], -encoded[i].count(os.sep)))]
+
+
 class Worker:
 
     """Perform the preview or delete operations"""
 
-    def __init__(self, ui, really_delete, operations):
+    # the most commands queued or waiting to be reported, with a
+    # DeviceScheduler
+    max_scheduled = 1000
+
+    # the commands to delete files are run in batches of this many, in
+    # the order of order_by_locality()
+    batch_size = 4096
+
+    def __init__(self, ui, really_delete, operations, jobs=1, summary=False,
+                 plan=None, plan_writer=None, journal=None, queue_depth=0,
+                 purge_manifest=None):
         """Create a Worker
 
         ui: an instance with methods
@@ -48,11 +386,28 @@ class Worker:
             update_total_size()
             update_item_size()
             worker_done()
+            and optionally append_event(), which then takes the
+            result of each command and each error as a dictionary
+            instead of a line of text
         really_delete: (boolean) preview or make real changes?
         operations: dictionary where operation-id is the key and
             operation-id are values
+        jobs: number of cleaner options to run concurrently, and of
+            threads to list directories with in deep scans
+        summary: (boolean) report totals by cleaner option and by
+            directory and the largest items instead of each file
+        plan: a Plan.Plan to run instead of scanning the cleaners
+        plan_writer: a Plan.PlanWriter to save the commands of the run
+        journal: a Journal.Journal to record the progress of the run
+            in, and to resume from if it was loaded
+        queue_depth: in headless mode, run the commands on files with
+            a queue for each device and this many threads for each
+            device which is not a spinning disk (see DeviceScheduler)
+        purge_manifest: a Purge.Manifest to move directory trees aside
+            with, and to delete them in the background (see Purge.Stager)
         """
         self.ui = ui
+        self.append_event = getattr(ui, 'append_event', None)
         self.really_delete = really_delete
         assert(isinstance(operations, dict))
         self.operations = operations
@@ -62,6 +417,27 @@ class Worker:
         self.total_errors = 0
         self.total_special = 0  # special operations
         self.yield_time = None
+        self.jobs = max(1, int(jobs))
+        self.cancel = threading.Event()
+        self.deepscans = {}
+        self.summary = Summary() if summary else None
+        self.headless = False
+        self.plan = plan
+        self.plan_writer = plan_writer
+        self.journal = journal
+        self.queue_depth = queue_depth
+        self.purge_manifest = purge_manifest
+        self.scheduler = None
+        # the commands submitted to the scheduler, by sequence number:
+        # the paths of those still running, and the outcomes which
+        # wait for the earlier ones to be reported
+        self.n_scheduled = 0
+        self.n_reported = 0
+        self.scheduled = queue.Queue()
+        self.scheduled_paths = {}
+        self.scheduled_outcomes = {}
+        # the commands which in_batches() took and did not yield yet
+        self.n_held = 0
         if 0 == len(self.operations):
             raise RuntimeError("No work to do")
 
@@ -73,8 +449,11 @@ class Worker:
         # replaced by a message such as 'Permission denied.'
         err = _("Exception while running operation '%(operation)s': '%(msg)s'") \
             % {'operation': operation, 'msg': str(sys.exc_info()[1])}
-        logger.error(err, exc_info=True)
+        self.log_error(err, exc_info=True)
         self.total_errors += 1
+        if self.append_event is not None:
+            self.append_event({'type': 'error', 'operation': operation,
+                               'message': err})
 
     def execute(self, cmd, operation_option):
         """Execute or preview the command"""
@@ -89,41 +468,163 @@ class Worker:
         except SystemExit:
             pass
         except Exception as e:
-            # 2 = does not exist
-            # 13 = permission denied
-            from errno import ENOENT, EACCES
-            if isinstance(e, OSError) and e.errno in (ENOENT, EACCES):
-                # For access denied, do not show traceback
-                exc_message = str(e).decode(FSE)
-                logger.error('%s: %s', exc_message, cmd)
-            else:
-                # For other errors, show the traceback.
-                msg = _('Error: {operation_option}: {command}')
-                data = {'command': cmd, 'operation_option': operation_option}
-                logger.error(msg.format(**data), exc_info=True)
-            self.total_errors += 1
+            self.report_error(cmd, operation_option, e)
         else:
-            if ret is None:
-                return
-            if isinstance(ret['size'], (int, long)):
-                size = FileUtilities.bytes_to_human(ret['size'])
-                self.size += ret['size']
-                self.total_bytes += ret['size']
+            self.report_result(cmd, operation_option, ret)
+
+    def execute_headless(self, cmd, operation_option):
+        """Like execute(), but without yielding to the GTK idle loop"""
+        ret = None
+        try:
+            for ret in cmd.execute(self.really_delete):
+                pass
+        except SystemExit:
+            pass
+        except Exception as e:
+            self.report_error(cmd, operation_option, e)
+        else:
+            self.report_result(cmd, operation_option, ret)
+
+    def execute_scheduled(self, cmd, operation_option):
+        """Like execute_headless(), but on the queue of the device"""
+        (st_dev, directory) = self.scheduler.get_device(cmd)
+        if st_dev is None:
+            self.wait_scheduled()
+            self.execute_headless(cmd, operation_option)
+            return
+        if directory is not None:
+            # The children come before their directory, so they are
+            # queued already.  Other commands may go on meanwhile.
+            prefix = os.path.join(directory, '')
+            while any(path.startswith(prefix) for path in self.scheduled_paths.values()):
+                self.collect_scheduled(True)
+
+        seq = self.n_scheduled
+        self.n_scheduled += 1
+        self.scheduled_paths[seq] = cmd.path
+
+        def done(ret, exc_info):
+            self.scheduled.put((seq, (cmd, operation_option, ret, exc_info)))
+        self.scheduler.submit(st_dev, cmd, self.really_delete, done)
+        # report what finished, and limit the commands in the pipeline
+        self.wait_scheduled(self.max_scheduled)
+
+    def collect_scheduled(self, block):
+        """Receive the outcome of a scheduled command
+
+        The outcomes are reported in the order of submission, so the
+        output is the same as without the scheduler.  This raises
+        queue.Empty if block is False and no command finished."""
+        (seq, item) = self.scheduled.get(block)
+        del self.scheduled_paths[seq]
+        self.scheduled_outcomes[seq] = item
+        while self.n_reported in self.scheduled_outcomes:
+            (cmd, operation_option, ret, exc_info) = \
+                self.scheduled_outcomes.pop(self.n_reported)
+            self.n_reported += 1
+            if exc_info is None:
+                self.report_result(cmd, operation_option, ret)
             else:
-                size = "?B"
+                self.report_error(cmd, operation_option, ret, exc_info)
 
+    def wait_scheduled(self, limit=0):
+        """Report the scheduled commands until at most limit are left"""
+        while self.n_scheduled - self.n_reported > limit:
+            self.collect_scheduled(True)
+        try:
+            while self.n_scheduled > self.n_reported:
+                self.collect_scheduled(False)
+        except queue.Empty:
+            pass
+
+    def log_error(self, msg, *args, **kwargs):
+        """Log an error, or queue it with the lines of an option run on
+        another thread (see BufferedCallback), so it keeps its place"""
+        log_error = getattr(self.ui, 'log_error', None)
+        if log_error is None:
+            logger.error(msg, *args, **kwargs)
+        else:
+            log_error(msg, *args, **kwargs)
+
+    def report_error(self, cmd, operation_option, e, exc_info=True):
+        """Log an exception raised by a command
+
+        exc_info is for the traceback of an exception raised on
+        another thread."""
+        # 2 = does not exist
+        # 13 = permission denied
+        from errno import ENOENT, EACCES
+        if isinstance(e, OSError) and e.errno in (ENOENT, EACCES):
+            # For access denied, do not show traceback
+            exc_message = str(e).decode(FSE)
+            self.log_error('%s: %s', exc_message, cmd)
+        else:
+            # For other errors, show the traceback.
+            msg = _('Error: {operation_option}: {command}')
+            data = {'command': cmd, 'operation_option': operation_option}
+            self.log_error(msg.format(**data), exc_info=exc_info)
+        self.total_errors += 1
+        if self.append_event is not None:
+            self.append_event({'type': 'error', 'option': operation_option,
+                               'command': u'%s' % cmd,
+                               'message': str(e).decode(FSE, 'replace')})
+
+    def report_result(self, cmd, operation_option, ret):
+        """Count the result of a command and report it to the ui"""
+        if not isinstance(ret, dict):
+            # no result, or the command ended yielding to the GTK idle loop
+            return
+        if self.plan_writer is not None:
+            self.plan_writer.add(cmd, operation_option, ret)
+        if isinstance(ret['size'], (int, long)):
+            self.size += ret['size']
+            self.total_bytes += ret['size']
+        self.total_deleted += ret['n_deleted']
+        self.total_special += ret['n_special']
+        # Command.DeleteTree logs the errors of its files itself
+        self.total_errors += ret.get('n_errors', 0)
+        if self.summary is not None and ret['label']:
+            self.summary.add(operation_option, ret['path'],
+                             ret['size'] or 0, ret['n_deleted'])
+        if self.append_event is not None:
+            event = dict(ret)
+            event['type'] = 'result'
+            event['option'] = operation_option
             if ret['path']:
-                path = ret['path']
-            else:
-                path = ''
-            path = path.decode('utf8', 'replace')  # for invalid encoding
-            line = u"%s %s %s\n" % (ret['label'], size, path)
-            self.total_deleted += ret['n_deleted']
-            self.total_special += ret['n_special']
-            if ret['label']:
-                # the label may be a hidden operation
-                # (e.g., win.shell.change.notify)
-                self.ui.append_text(line)
+                event['path'] = decode_path(ret['path'])
+            self.append_event(event)
+            return
+        if self.summary is not None:
+            # skip formatting the line
+            return
+        if isinstance(ret['size'], (int, long)):
+            size = FileUtilities.bytes_to_human(ret['size'])
+        else:
+            size = "?B"
+
+        if ret['path']:
+            path = ret['path']
+        else:
+            path = ''
+        path = decode_path(path)  # for invalid encoding
+        line = u"%s %s %s\n" % (ret['label'], size, path)
+        if ret['label']:
+            # the label may be a hidden operation
+            # (e.g., win.shell.change.notify)
+            self.ui.append_text(line)
+
+    def is_running(self, operation):
+        """Return whether the cleaner is running and so may not be cleaned
+
+        This also reports the error."""
+        if self.really_delete and backends[operation].is_running():
+            # TRANSLATORS: %s expands to a name such as 'Firefox' or 'System'.
+            err = _("%s cannot be cleaned because it is currently running.  Close it, and try again.") \
+                % backends[operation].get_name()
+            self.ui.append_text(err + "\n", 'error')
+            self.total_errors += 1
+            return True
+        return False
 
     def clean_operation(self, operation):
         """Perform a single cleaning operation"""
@@ -135,48 +636,206 @@ class Worker:
         if not operation_options:
             raise StopIteration
 
-        if self.really_delete and backends[operation].is_running():
-            # TRANSLATORS: %s expands to a name such as 'Firefox' or 'System'.
-            err = _("%s cannot be cleaned because it is currently running.  Close it, and try again.") \
-                % backends[operation].get_name()
-            self.ui.append_text(err + "\n", 'error')
-            self.total_errors += 1
+        if self.is_running(operation):
             return
         import time
         self.yield_time = time.time()
 
         total_size = 0
         for option_id in operation_options:
-            self.size = 0
-            assert(isinstance(option_id, (str, unicode)))
+            for ret in self.clean_option(operation, option_id):
+                yield ret
+            self.add_done('%s.%s' % (operation, option_id))
+            self.ui.update_item_size(operation, option_id, self.size)
+            total_size += self.size
+        self.ui.update_item_size(operation, -1, total_size)
+
+    def clean_option(self, operation, option_id):
+        """Perform a single option of a cleaning operation"""
+        import time
+        if self.yield_time is None:
+            self.yield_time = time.time()
+        self.size = 0
+        assert(isinstance(option_id, (str, unicode)))
+        # the walks are journaled only after their commands ran
+        self.n_held = 0
+        FileUtilities.walk_journal.hold()
+        try:
             # normal scan
-            for cmd in backends[operation].get_commands(option_id):
-                for ret in self.execute(cmd, '%s.%s' % (operation, option_id)):
-                    if True == ret:
-                        # Return control to PyGTK idle loop to keep
-                        # it responding allow the user to abort
-                        self.yield_time = time.time()
+            if self.scheduler is not None:
+                operation_option = '%s.%s' % (operation, option_id)
+                for cmd in self.get_commands(operation, option_id):
+                    if self.cancel.is_set():
+                        break
+                    self.execute_scheduled(cmd, operation_option)
+                    self.commit_walks()
+                self.wait_scheduled()
+            elif self.headless:
+                operation_option = '%s.%s' % (operation, option_id)
+                for cmd in self.get_commands(operation, option_id):
+                    if self.cancel.is_set():
+                        break
+                    self.execute_headless(cmd, operation_option)
+                    self.commit_walks()
+            else:
+                for cmd in self.get_commands(operation, option_id):
+                    for ret in self.execute(cmd, '%s.%s' % (operation, option_id)):
+                        if True == ret:
+                            # Return control to PyGTK idle loop to keep
+                            # it responding allow the user to abort
+                            self.yield_time = time.time()
+                            yield True
+                    self.commit_walks()
+                    if time.time() - self.yield_time > 0.25:
+                        if self.really_delete:
+                            self.ui.update_total_size(self.total_bytes)
                         yield True
-                if time.time() - self.yield_time > 0.25:
-                    if self.really_delete:
-                        self.ui.update_total_size(self.total_bytes)
-                    yield True
-                    self.yield_time = time.time()
+                        self.yield_time = time.time()
+            self.commit_walks()
+        finally:
+            FileUtilities.walk_journal.release()
 
-            self.ui.update_item_size(operation, option_id, self.size)
-            total_size += self.size
+        if self.plan is not None:
+            # the plan has the files found by the deep scan
+            return
+        self.add_deep_scans(operation, option_id)
 
-            # deep scan
-            for ds in backends[operation].get_deep_scan(option_id):
-                if '' == ds['path']:
-                    ds['path'] = expanduser('~')
-                if 'delete' != ds['command']:
-                    raise NotImplementedError(
-                        'Deep scan only supports deleting now')
-                if ds['path'] not in self.deepscans:
-                    self.deepscans[ds['path']] = []
-                self.deepscans[ds['path']].append(ds)
-        self.ui.update_item_size(operation, -1, total_size)
+    def commit_walks(self):
+        """Journal the directories which the walks finished, if all the
+        commands taken from the walks ran (see WalkJournal.hold())"""
+        if 0 == self.n_held and self.n_scheduled == self.n_reported:
+            FileUtilities.walk_journal.commit()
+
+    def add_deep_scans(self, operation, option_id):
+        """Add the deep scans of an option, to run after the options"""
+        for ds in backends[operation].get_deep_scan(option_id):
+            if '' == ds['path']:
+                ds['path'] = expanduser('~')
+            if 'delete' != ds['command']:
+                raise NotImplementedError(
+                    'Deep scan only supports deleting now')
+            if ds['path'] not in self.deepscans:
+                self.deepscans[ds['path']] = []
+            self.deepscans[ds['path']].append(ds)
+
+    def add_done(self, operation_option):
+        """Record a finished option in the journal"""
+        if self.journal is not None:
+            self.journal.add_done(operation_option)
+
+    def skip_done(self):
+        """Skip the options which finished before the run was interrupted
+
+        Their deep scans are still added, unless the deep scan finished
+        too."""
+        for (operation, option_ids) in self.operations.items():
+            for option_id in list(option_ids):
+                if self.journal.is_done('%s.%s' % (operation, option_id)):
+                    option_ids.remove(option_id)
+                    if self.plan is None and not self.journal.is_done('deepscan'):
+                        self.add_deep_scans(operation, option_id)
+
+    def get_commands(self, operation, option_id):
+        """Return the commands of a cleaner option, maybe from the plan"""
+        if self.plan is not None:
+            commands = self.plan.get_commands('%s.%s' % (operation, option_id))
+        else:
+            commands = backends[operation].get_commands(option_id)
+        if self.plan_writer is not None:
+            commands = self.list_trees(commands, '%s.%s' % (operation, option_id))
+        return self.in_batches(self.optimize(commands))
+
+    def list_trees(self, commands, operation_option):
+        """Yield the commands, with each Command.DeleteTree adding the
+        files it would delete to the plan"""
+        from bleachbit import Command
+        for cmd in commands:
+            if isinstance(cmd, Command.DeleteTree):
+                cmd.on_preview = functools.partial(self.plan_writer.add_tree_file,
+                                                   cmd, operation_option)
+            yield cmd
+
+    def optimize(self, commands):
+        """Yield the commands, without those which other commands of the
+        run cover already (see FileUtilities.Overlap)
+
+        A path in a folder which is deleted as a whole is dropped, and
+        so is a folder in such a folder.  A file which has another
+        command already is dropped, and another name of a file which
+        is shredded already is deleted without shredding."""
+        from bleachbit import Command
+        from bleachbit.Options import options
+        overlap = FileUtilities.overlap
+        if not overlap.enabled:
+            for cmd in commands:
+                yield cmd
+            return
+        for cmd in commands:
+            if isinstance(cmd, Command.DeleteTree):
+                inner_trees = overlap.add_tree(cmd.path)
+                if inner_trees is None:
+                    logger.debug('redundant: %s', cmd)
+                    overlap.add_redundant()
+                    continue
+                cmd.inner_trees = inner_trees
+            elif cmd.__class__ in (Command.Delete, Command.Shred):
+                if overlap.in_tree(cmd.path):
+                    logger.debug('redundant: %s', cmd)
+                    overlap.add_redundant()
+                    continue
+                try:
+                    if cmd.entry is None:
+                        st = FileUtilities.stat_cache.lstat(cmd.path)
+                    else:
+                        st = cmd.entry.stat(follow_symlinks=False)
+                except OSError:
+                    # the command reports it
+                    yield cmd
+                    continue
+                claimed = overlap.claim(cmd.path, st)
+                if claimed is False:
+                    logger.debug('redundant: %s', cmd)
+                    overlap.add_redundant()
+                    continue
+                if claimed is None and (cmd.shred or options.get('shred')):
+                    # another name of the same file
+                    cmd.allow_shred = False
+                    overlap.add_redundant()
+            yield cmd
+
+    def in_batches(self, commands):
+        """Yield the commands, with the commands to delete files in
+        batches ordered by order_by_locality()
+
+        Other commands run in their place, after the batch before them.
+        A preview does not change the disk, so it keeps the order.  The
+        commands taken and not yielded yet are counted in n_held."""
+        from bleachbit import Command
+        if not self.really_delete or self.batch_size < 2:
+            for cmd in commands:
+                yield cmd
+            return
+        batch = []
+        for cmd in commands:
+            self.n_held += 1
+            if cmd.__class__ in (Command.Delete, Command.Shred):
+                batch.append(cmd)
+                if len(batch) >= self.batch_size:
+                    for cmd2 in order_by_locality(batch):
+                        self.n_held -= 1
+                        yield cmd2
+                    batch = []
+                continue
+            if True != cmd and batch:
+                for cmd2 in order_by_locality(batch):
+                    self.n_held -= 1
+                    yield cmd2
+                batch = []
+            self.n_held -= 1
+            yield cmd
+        for cmd2 in order_by_locality(batch):
+            self.n_held -= 1
+            yield cmd2
 
     def run_delayed_op(self, operation, option_id):
         """Run one delayed operation"""
@@ -216,55 +875,96 @@ class Worker:
                     # it responding and allow the user to abort.
                     yield True
 
+    def run_headless(self):
+        """Perform the main cleaning process without a GTK idle loop
+
+        This is for the command line and other callers which would only
+        spin the generator of run().  Commands run in a plain loop,
+        without the yields and the timing between them."""
+        self.headless = True
+        if self.queue_depth > 0:
+            self.scheduler = DeviceScheduler(self.queue_depth)
+        try:
+            for dummy in self.run():
+                pass
+        finally:
+            if self.scheduler is not None:
+                self.scheduler.stop()
+                self.scheduler = None
+
     def run(self):
         """Perform the main cleaning process which has these phases
         1. General cleaning
         2. Deep scan
         3. Memory
         4. Free disk space"""
-        self.deepscans = {}
-        # prioritize
-        self.delayed_ops = []
-        for operation in self.operations:
-            delayables = ['free_disk_space', 'memory']
-            for delayable in delayables:
-                if operation not in ('system', '_gui'):
-                    continue
-                if delayable in self.operations[operation]:
-                    i = self.operations[operation].index(delayable)
-                    del self.operations[operation][i]
-                    priority = 99
-                    if 'free_disk_space' == delayable:
-                        priority = 100
-                    new_op = (priority, {operation: [delayable]})
-                    self.delayed_ops.append(new_op)
-
-        # standard operations
-        import warnings
-        with warnings.catch_warnings(record=True) as ws:
-            # This warning system allows general warnings. Duplicate will
-            # be removed, and the warnings will show near the end of
-            # the log.
-
-            warnings.simplefilter('once')
-            for dummy in self.run_operations(self.operations):
-                # yield to GTK+ idle loop
-                yield True
-            for w in ws:
-                logger.warning(w.message)
-
-        # run deep scan
-        if self.deepscans:
-            for dummy in self.run_deep_scan():
-                yield dummy
-
-        # delayed operations
-        for op in sorted(self.delayed_ops):
-            operation = op[1].keys()[0]
-            for option_id in op[1].values()[0]:
-                for ret in self.run_delayed_op(operation, option_id):
+        FileUtilities.stat_cache.start()
+        FileUtilities.overlap.start()
+        finished = False
+        try:
+            self.plan_traversal()
+            if 'posix' == os.name:
+                Unix.process_snapshot.start()
+            self.deepscans = {}
+            if self.journal is not None:
+                self.journal.open(self.operations)
+                FileUtilities.walk_journal.start(self.journal)
+                self.skip_done()
+            if self.purge_manifest is not None and self.really_delete:
+                Purge.stager.start(self.purge_manifest)
+            # prioritize
+            self.delayed_ops = []
+            for operation in self.operations:
+                delayables = ['free_disk_space', 'memory']
+                for delayable in delayables:
+                    if operation not in ('system', '_gui'):
+                        continue
+                    if delayable in self.operations[operation]:
+                        i = self.operations[operation].index(delayable)
+                        del self.operations[operation][i]
+                        priority = 99
+                        if 'free_disk_space' == delayable:
+                            priority = 100
+                        new_op = (priority, {operation: [delayable]})
+                        self.delayed_ops.append(new_op)
+
+            # standard operations
+            import warnings
+            with warnings.catch_warnings(record=True) as ws:
+                # This warning system allows general warnings. Duplicate will
+                # be removed, and the warnings will show near the end of
+                # the log.
+
+                warnings.simplefilter('once')
+                for dummy in self.run_operations(self.operations):
                     # yield to GTK+ idle loop
                     yield True
+                for w in ws:
+                    logger.warning(w.message)
+
+            # run deep scan
+            if self.deepscans or (self.plan is not None and self.plan.has_option('deepscan')):
+                for dummy in self.run_deep_scan():
+                    yield dummy
+                self.add_done('deepscan')
+
+            # delayed operations
+            for op in sorted(self.delayed_ops):
+                operation = op[1].keys()[0]
+                for option_id in op[1].values()[0]:
+                    for ret in self.run_delayed_op(operation, option_id):
+                        # yield to GTK+ idle loop
+                        yield True
+                    self.add_done('%s.%s' % (operation, option_id))
+            finished = True
+        finally:
+            # also if a cleaner raised or the caller stopped early, so
+            # the caches do not outlive the run
+            self.stop_run(finished)
+
+        if self.summary is not None:
+            for line in self.summary.lines():
+                self.ui.append_text(line + "\n")
 
         # print final stats
         bytes_delete = FileUtilities.bytes_to_human(self.total_bytes)
@@ -290,6 +990,12 @@ class Worker:
         if self.total_special > 0:
             line = _("Special operations: %d") % self.total_special
             self.ui.append_text("\n%s" % line)
+        if FileUtilities.overlap.n_redundant > 0:
+            line = _("Redundant operations avoided: %d") % FileUtilities.overlap.n_redundant
+            self.ui.append_text("\n%s" % line)
+        if FileUtilities.throttle.seconds > 0:
+            line = _("Waited for the I/O limits: %.1f seconds") % FileUtilities.throttle.seconds
+            self.ui.append_text("\n%s" % line)
         if self.total_errors > 0:
             line = _("Errors: %d") % self.total_errors
             self.ui.append_text("\n%s" % line, 'error')
@@ -300,6 +1006,35 @@ class Worker:
 
         yield False
 
+    def stop_run(self, finished):
+        """Stop what run() started for the length of the run
+
+        finished: (boolean) whether the run finished, so its journal
+            is not needed to resume"""
+        if Purge.stager.enabled:
+            Purge.stager.stop()
+        if self.journal is not None:
+            FileUtilities.walk_journal.stop()
+            self.journal.close(finished)
+        if 'posix' == os.name:
+            Unix.process_snapshot.stop()
+        FileUtilities.listing_cache.stop()
+        FileUtilities.overlap.stop()
+        FileUtilities.stat_cache.stop()
+
+    def plan_traversal(self):
+        """Plan the directories to list for the selected actions
+
+        Many actions look in the same directories (for example, one
+        browser profile), so each directory is listed once per run."""
+        FileUtilities.listing_cache.start()
+        for operation, option_ids in self.operations.items():
+            option_actions = backends[operation].option_actions
+            for option_id in option_ids:
+                for action in option_actions.get(option_id, ()):
+                    for dirname in action.get_directories():
+                        FileUtilities.listing_cache.add(dirname)
+
     def run_deep_scan(self):
         """Run deep scans"""
         logger.debug(' deepscans=%s' % self.deepscans)
@@ -308,11 +1043,38 @@ class Worker:
         # or all the system executables.
         self.ui.update_progress_bar(_("Please wait.  Running deep scan."))
         yield True  # allow GTK to update the screen
-        ds = DeepScan.DeepScan()
+        if self.plan is not None:
+            commands = self.plan.get_commands('deepscan')
+        else:
+            commands = self.deep_scan_commands()
+        for cmd in self.in_batches(self.optimize(commands)):
+            if True == cmd:
+                yield True
+                continue
+            if self.scheduler is not None:
+                self.execute_scheduled(cmd, 'deepscan')
+                continue
+            if self.headless:
+                self.execute_headless(cmd, 'deepscan')
+                continue
+            for ret in self.execute(cmd, 'deepscan'):
+                yield True
+        if self.scheduler is not None:
+            self.wait_scheduled()
+
+    def deep_scan_commands(self):
+        """Scan for the deep scans, and yield a command for each file"""
+        if self.jobs > 1:
+            ds = DeepScan.DeepScan(threads=self.jobs)
+        else:
+            ds = DeepScan.DeepScan()
         for (path, dsdict) in self.deepscans.items():
             logger.debug('deepscan path=%s, dict=%s' % (path, dsdict))
             for dsdict2 in dsdict:
-                ds.add_search(path, dsdict2['regex'])
+                if dsdict2.get('cache'):
+                    ds.add_search(path, dsdict2['regex'], cache=True)
+                else:
+                    ds.add_search(path, dsdict2['regex'])
 
         for path in ds.scan():
             if True == path:
@@ -320,12 +1082,37 @@ class Worker:
                 continue
             # fixme: support non-delete commands
             from bleachbit import Command
-            cmd = Command.Delete(path)
-            for ret in self.execute(cmd, 'deepscan'):
-                yield True
+            yield Command.Delete(path)
+
+    def spawn(self, ui, operation, option_id):
+        """Return a Worker for a single option, to run on another thread"""
+        worker = Worker(ui, self.really_delete, {operation: [option_id]},
+                        summary=self.summary is not None, plan=self.plan,
+                        plan_writer=self.plan_writer, journal=self.journal)
+        # The thread reports to the main thread, not to the GTK idle loop.
+        worker.headless = True
+        worker.scheduler = self.scheduler
+        # an abort stops it after the command which runs
+        worker.cancel = self.cancel
+        return worker
+
+    def merge(self, worker):
+        """Add the totals of a Worker made by spawn()"""
+        self.total_bytes += worker.total_bytes
+        self.total_deleted += worker.total_deleted
+        self.total_errors += worker.total_errors
+        self.total_special += worker.total_special
+        for (path, dsdicts) in worker.deepscans.items():
+            self.deepscans.setdefault(path, []).extend(dsdicts)
+        if self.summary is not None:
+            self.summary.merge(worker.summary)
 
     def run_operations(self, my_operations):
         """Run a set of operations (general, memory, free disk space)"""
+        if self.jobs > 1:
+            for ret in self.run_operations_parallel(my_operations):
+                yield ret
+            return
         count = 0
         for operation in my_operations:
             self.ui.update_progress_bar(1.0 * count / len(my_operations))
@@ -345,3 +1132,82 @@ class Worker:
                 self.print_exception(operation)
 
             count += 1
+
+    def run_operations_parallel(self, my_operations):
+        """Run the cleaner options of a set of operations concurrently
+
+        Each cleaner-option pair runs on a pool of self.jobs threads.
+        The main thread reports the output and totals in the same order
+        as run_operations() would."""
+        tasks = []
+        for operation in my_operations:
+            operation_options = self.operations[operation]
+            logger.debug("clean_operation('%s'), options = '%s'",
+                         operation, operation_options)
+            try:
+                if self.is_running(operation):
+                    continue
+            except:
+                self.print_exception(operation)
+                continue
+            for option_id in operation_options:
+                tasks.append(OptionTask(self, operation, option_id))
+
+        pending = queue.Queue()
+        for task in tasks:
+            pending.put(task)
+
+        def work():
+            while not self.cancel.is_set():
+                try:
+                    task = pending.get_nowait()
+                except queue.Empty:
+                    return
+                task.run()
+
+        threads = []
+        for dummy in range(min(self.jobs, len(tasks))):
+            thread = threading.Thread(target=work)
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+
+        try:
+            count = 0
+            total_size = 0
+            for (i, task) in enumerate(tasks):
+                operation = task.operation
+                if 0 == i or tasks[i - 1].operation != operation:
+                    self.ui.update_progress_bar(1.0 * count / len(my_operations))
+                    name = backends[operation].get_name()
+                    if self.really_delete:
+                        msg = _("Please wait.  Cleaning %s.") % name
+                    else:
+                        msg = _("Please wait.  Previewing %s.") % name
+                    self.ui.update_progress_bar(msg)
+                    count += 1
+                    total_size = 0
+                    yield True
+                while not task.done.wait(0.25):
+                    # stream the output of the oldest option while it runs
+                    task.ui.flush(self.ui)
+                    if self.really_delete:
+                        self.ui.update_total_size(self.total_bytes)
+                    yield True
+                task.ui.flush(self.ui)
+                self.merge(task.worker)
+                if task.finished:
+                    self.add_done('%s.%s' % (operation, task.option_id))
+                self.ui.update_item_size(operation, task.option_id, task.worker.size)
+                total_size += task.worker.size
+                if len(tasks) == i + 1 or tasks[i + 1].operation != operation:
+                    self.ui.update_item_size(operation, -1, total_size)
+            # every option is done, so the threads are returning
+            for thread in threads:
+                thread.join()
+        finally:
+            # If the caller stops early (for example, the user aborts),
+            # do not start any more options, and stop those which run
+            # after their current command.  The threads finish in the
+            # background, so the GTK loop does not wait for them.
+            self.cancel.set()
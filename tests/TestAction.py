@@ -107,7 +107,7 @@ class ActionTestCase(common.BleachbitTestCase):
                 provider = actionplugin(action_node)
         self.assertNotEqual(provider, None)
         for cmd in provider.get_commands():
-            self.assertIsInstance(cmd, (Command.Delete, Command.Ini, Command.Json, Command.Function))
+            self.assertIsInstance(cmd, (Command.Delete, Command.DeleteTree, Command.Ini, Command.Json, Command.Function))
             if 'process' != command:
                 # process does not have a filename
                 self.assertLExists(filename)
@@ -117,7 +117,9 @@ class ActionTestCase(common.BleachbitTestCase):
             self.assertNotEqual('/', result['path'])
             # delete
             ret = cmd.execute(really_delete=True).next()
-            if 'delete' == command:
+            if isinstance(cmd, Command.DeleteTree):
+                self.assertTrue(dir_is_empty(cmd.path))
+            elif 'delete' == command:
                 self.assertNotLExists(cmd.path)
             elif 'truncate' == command:
                 self.assertLExists(filename)
@@ -141,6 +141,40 @@ class CLITestCase(common.BleachbitTestCase):
         os.remove(filename)
         self.assertNotExists(filename)
 
+    def test_ndjson(self):
+        """Unit test for --format=ndjson"""
+        from bleachbit.Worker import Worker, backends
+        from tests import TestCleaner
+        import json
+        import StringIO
+        filenames = [self.write_file('bleachbit-test-ndjson%d' % x, 'foo')
+                     for x in range(0, 2)]
+        # a unicode path which is not ASCII
+        filenames.append(self.write_file(u'bleachbit-test-ndjson-\xfc', 'foo'))
+        astrs = [(u'<action command="delete" search="file" path="%s"/>' % filename).encode('utf8')
+                 for filename in filenames]
+        astrs.append('<action command="delete" search="file" path="%s"/>' % self.tempdir)
+        backends['test'] = TestCleaner.actions_to_cleaner(astrs)
+        for jobs in (1, 2):
+            stream = StringIO.StringIO()
+            worker = Worker(NdjsonCallback(stream), False,
+                            {'test': ['option1', 'option2', 'option3', 'option4']}, jobs)
+            run = worker.run()
+            while run.next():
+                pass
+            events = [json.loads(line) for line in stream.getvalue().splitlines()]
+            results = [event for event in events if 'result' == event['type']]
+            self.assertEqual([event['path'] for event in results],
+                             filenames + [self.tempdir])
+            self.assertEqual(results[0]['option'], 'test.option1')
+            self.assertEqual([event['option'] for event in events if 'option' == event['type']],
+                             ['test.option1', 'test.option2', 'test.option3', 'test.option4'])
+            self.assertEqual(events[-1]['type'], 'done')
+            self.assertEqual(events[-1]['n_deleted'], 4)
+            self.assertEqual(events[-1]['size'], sum(event['size'] for event in results))
+        for filename in filenames:
+            self.assertExists(filename)
+
     def test_shred(self):
         """Unit test for --shred"""
         suffixes = ['', '.', '.txt']
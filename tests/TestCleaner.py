@@ -89,7 +89,10 @@ class CleanerTestCase(common.BleachbitTestCase):
             count = 0
             for cmd in cleaner.get_commands('option1'):
                 for result in cmd.execute(False):
-                    self.assertEqual(result['n_deleted'], 1)
+                    if True == result:
+                        continue
+                    if not result.get('tree'):
+                        self.assertEqual(result['n_deleted'], 1)
                     pathname = result['path']
                     self.assertLExists(pathname, "Does not exist: '%s'" % pathname)
                     count += 1
@@ -63,6 +63,54 @@ class CleanerMLTestCase(common.BleachbitTestCase):
             self.assertEqual(boolstr_to_bool(arg.lower()), output)
             self.assertEqual(boolstr_to_bool(arg.upper()), output)
 
+    def test_cache(self):
+        """Unit test for CleanerMLCache and cached trees"""
+        def summarize(cleaner):
+            return (cleaner.id, cleaner.name, cleaner.description,
+                    cleaner.options, cleaner.warnings, cleaner.running,
+                    [(option_id, action.__class__, getattr(action, 'paths', None))
+                     for option_id, action in cleaner.actions])
+
+        # a cleaner made from the cached tree is the same
+        for pathname in listdir('cleaners'):
+            if not pathname.endswith('.xml'):
+                continue
+            xmlcleaner = CleanerML(pathname)
+            if xmlcleaner.tree is None:
+                self.assertIn('<localizations>', open(pathname).read())
+                continue
+            tree = marshal.loads(marshal.dumps(xmlcleaner.tree))
+            cached = CleanerML(pathname, tree=tree)
+            self.assertEqual(summarize(cached.get_cleaner()),
+                             summarize(xmlcleaner.get_cleaner()))
+
+        # save and load
+        xml_pathname = self.write_file('bleachbit-test-cache.xml',
+                                       open('doc/example_cleaner.xml').read())
+        cache_pathname = os.path.join(self.tempdir, 'cleanerml.cache')
+        cache = CleanerMLCache(cache_pathname)
+        cache.load()
+        self.assertEqual(cache.get(xml_pathname), None)
+        tree = CleanerML(xml_pathname).tree
+        cache.put(xml_pathname, tree)
+        cache.save()
+        cache = CleanerMLCache(cache_pathname)
+        cache.load()
+        self.assertEqual(cache.get(xml_pathname), tree)
+
+        # a changed file is parsed again
+        st = os.stat(xml_pathname)
+        os.utime(xml_pathname, (st.st_atime, st.st_mtime + 10))
+        self.assertEqual(cache.get(xml_pathname), None)
+
+        # a cache from another version is ignored
+        cache.key = ('0.0',) + cache.key[1:]
+        cache.put(xml_pathname, tree)
+        cache.save()
+        cache = CleanerMLCache(cache_pathname)
+        cache.load()
+        self.assertEqual(cache.files, {})
+
     def test_create_pot(self):
         """Unit test for create_pot()"""
         os.chdir('po')
@@ -26,6 +26,8 @@ from __future__ import absolute_import, print_function
 from tests import common
 from bleachbit.Command import *
 
+import errno
+
 
 class CommandTestCase(common.BleachbitTestCase):
     """Test case for Command"""
@@ -49,6 +51,52 @@ class CommandTestCase(common.BleachbitTestCase):
         self.assertEqual(ret['path'], path)
         self.assertNotExists(path)
 
+    def test_DeleteTree(self):
+        """Unit test for DeleteTree"""
+        top = self.mkdtemp(prefix='bleachbit-test-delete-tree')
+        os.mkdir(os.path.join(top, 'sub'))
+        paths = [self.write_file(os.path.join(top, 'a'), b'foo'),
+                 self.write_file(os.path.join(top, 'sub', 'b'), b'foo')]
+        cmd = DeleteTree(top)
+        str(cmd)
+
+        # preview
+        results = list(cmd.execute(really_delete=False))
+        self.assertEqual(len(results), 1)
+        common.validate_result(self, results[0])
+        self.assertEqual(results[0]['path'], top)
+        self.assertEqual(results[0]['n_deleted'], 3)
+        self.assertEqual(results[0]['size'],
+                         sum(FileUtilities.getsize(path) for path in
+                             paths + [os.path.join(top, 'sub')]))
+        for path in paths:
+            self.assertExists(path)
+
+        # delete, but not the top
+        ret = cmd.execute(really_delete=True).next()
+        common.validate_result(self, ret, True)
+        self.assertEqual(ret['n_deleted'], 3)
+        self.assertEqual(os.listdir(top), [])
+
+        # nothing to delete
+        self.assertEqual(list(cmd.execute(really_delete=True)), [])
+
+        # an error is counted, and the other files are deleted
+        paths = [self.write_file(os.path.join(top, name), b'foo') for name in ('c', 'd')]
+        getsize = FileUtilities.getsize
+
+        def broken_getsize(path):
+            if path == paths[0]:
+                raise OSError(errno.EIO, 'Input/output error', path)
+            return getsize(path)
+        FileUtilities.getsize = broken_getsize
+        try:
+            ret = [ret for ret in cmd.execute(really_delete=True) if True != ret][0]
+        finally:
+            FileUtilities.getsize = getsize
+        self.assertEqual((ret['n_deleted'], ret['n_errors']), (1, 1))
+        self.assertEqual(os.listdir(top), ['c'])
+
     def test_Function(self):
         """Unit test for Function"""
         path = self.write_file('test_Function', b'foo')
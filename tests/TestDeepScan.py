@@ -26,10 +26,49 @@ Test case for module DeepScan
 from __future__ import absolute_import, print_function
 
 from tests import common
-from bleachbit.DeepScan import DeepScan, normalized_walk
+from bleachbit.DeepScan import DeepScan, DirectoryIndex, compile_regexes, \
+    normalized_walk, parallel_walk
 from bleachbit import expanduser
 
 import os
+import re
+import sys
+import tempfile
+import time
+
+
+def benchmark_regexes(n_regexes, n_files=10000):
+    """Measure how deep scan time grows with the number of regexes
+
+    Compare matching with one pattern per regex (the old way) to
+    matching with the patterns from compile_regexes()."""
+    dirname = tempfile.mkdtemp(prefix='bleachbit-deepscan-bench')
+    for x in range(0, n_files):
+        common.touch_file(os.path.join(dirname, '%d.ext%d' % (x, x % 100)))
+    regexes = ['\\.ext%d$' % x for x in range(0, n_regexes)]
+
+    start = time.time()
+    count_each = 0
+    for (dirpath, dirnames, filenames) in normalized_walk(dirname):
+        for regex in regexes:
+            r = re.compile(regex)
+            for filename in filenames:
+                if r.search(filename):
+                    count_each += 1
+    elapsed_each = time.time() - start
+
+    start = time.time()
+    ds = DeepScan()
+    for regex in regexes:
+        ds.add_search(dirname, regex)
+    count_combined = len([ret for ret in ds.scan() if ret is not True])
+    elapsed_combined = time.time() - start
+
+    import shutil
+    shutil.rmtree(dirname)
+    assert count_each == count_combined
+    print('%d regexes, %d files: %.3fs one pattern per regex, %.3fs combined' %
+          (n_regexes, n_files, elapsed_each, elapsed_combined))
 
 
 class DeepScanTestCase(common.BleachbitTestCase):
@@ -91,6 +130,130 @@ class DeepScanTestCase(common.BleachbitTestCase):
                 continue
             self.assertLExists(ret)
 
+    def test_cache(self):
+        """Unit test for DeepScan with cache=True"""
+        top = self.mkdtemp(prefix='bleachbit-deepscan-cache')
+        subdir = os.path.join(top, 'sub')
+        os.mkdir(subdir)
+        os.mkdir(os.path.join(subdir, 'subsub'))
+        expected = set([self.write_file(os.path.join(top, 'a.bbtestbak')),
+                        self.write_file(os.path.join(subdir, 'b.bbtestbak')),
+                        self.write_file(os.path.join(subdir, 'subsub', 'c.bbtestbak'))])
+        self.write_file(os.path.join(top, 'keep.txt'))
+        # make the directories look old, so the index trusts them
+        old = time.time() - 3600
+        for dirpath in (top, subdir, os.path.join(subdir, 'subsub')):
+            os.utime(dirpath, (old, old))
+        index_pathname = os.path.join(self.tempdir, 'deepscan.index')
+
+        def scan():
+            ds = DeepScan(index_pathname)
+            ds.add_search(top, '\.bbtestbak$', cache=True)
+            return ds, set(ret for ret in ds.scan() if ret is not True)
+
+        # the first scan lists every directory
+        ds, found = scan()
+        self.assertEqual(found, expected)
+        self.assertEqual((ds.index.hits, ds.index.misses), (0, 3))
+        self.assertExists(index_pathname)
+
+        # the second scan lists none
+        ds, found = scan()
+        self.assertEqual(found, expected)
+        self.assertEqual((ds.index.hits, ds.index.misses), (3, 0))
+
+        # a new file changes the mtime of its directory
+        expected.add(self.write_file(os.path.join(subdir, 'd.bbtestbak')))
+        ds, found = scan()
+        self.assertEqual(found, expected)
+        self.assertEqual((ds.index.hits, ds.index.misses), (2, 1))
+
+        # a removed directory leaves the index
+        import shutil
+        shutil.rmtree(os.path.join(subdir, 'subsub'))
+        os.utime(subdir, (old, old))
+        ds, found = scan()
+        self.assertEqual(set(ds.index.dirs), set([top, subdir]))
+
+    def test_compile_regexes(self):
+        """Unit test for compile_regexes()"""
+        patterns = compile_regexes(['\\.bak$', '~$', '\\.bak$'])
+        self.assertEqual(len(patterns), 1)
+        for filename, match in (('a.bak', True), ('a~', True), ('a.txt', False)):
+            self.assertEqual(bool(patterns[0].search(filename)), match)
+
+        # backreferences and inline flags get their own pattern
+        patterns = compile_regexes(['^(a)\\1$', '(?i)^foo$', '^bar$'])
+        self.assertEqual(len(patterns), 3)
+        self.assertFalse(patterns[0].search('BAR'))
+        self.assertTrue(patterns[1].search('aa'))
+        self.assertTrue(patterns[2].search('FOO'))
+
+    def test_merge_roots(self):
+        """Unit test for overlapping roots"""
+        top = self.mkdtemp(prefix='bleachbit-deepscan-merge')
+        subdir = os.path.join(top, 'sub')
+        os.mkdir(subdir)
+        expected = [self.write_file(os.path.join(top, 'a.bak')),
+                    self.write_file(os.path.join(subdir, 'b.bak')),
+                    self.write_file(os.path.join(subdir, 'c.tmp'))]
+        self.write_file(os.path.join(top, 'd.tmp'))
+
+        ds = DeepScan()
+        ds.add_search(top, 'bak$')
+        ds.add_search(subdir, 'tmp$')
+        ds.add_search(subdir, 'bak$')
+        ds.add_search(subdir + os.sep, 'bak$')
+        self.assertEqual(len(ds.merge_roots()), 1)
+        found = [ret for ret in ds.scan() if ret is not True]
+        # each file once, and tmp$ only under subdir
+        self.assertEqual(sorted(found), sorted(expected))
+
+        # a root with another cache setting is walked by itself
+        ds.add_search(subdir, 'tmp$', cache=True)
+        self.assertEqual(len(ds.merge_roots()), 2)
+
+    def test_parallel_walk(self):
+        """Unit test for parallel_walk()"""
+        top = self.mkdtemp(prefix='bleachbit-deepscan-parallel')
+        for x in range(0, 5):
+            for y in range(0, 4):
+                dirpath = os.path.join(top, str(x), str(y))
+                os.makedirs(dirpath)
+                common.touch_file(os.path.join(dirpath, 'file.bbtestbak'))
+        if 'posix' == os.name:
+            # listed but not followed
+            os.symlink(os.path.join(top, '0'), os.path.join(top, '1', 'link'))
+
+        def as_set(results):
+            return set((dirpath, tuple(sorted(dirnames)), tuple(sorted(filenames)))
+                       for (dirpath, dirnames, filenames) in results if dirpath is not None)
+        expected = as_set(os.walk(top))
+        self.assertEqual(len(expected), 26)
+        for threads in (2, 4):
+            results = [result for result in parallel_walk(top, threads, queue_size=1)
+                       if result is not None]
+            self.assertEqual(len(results), len(expected))
+            self.assertEqual(as_set(results), expected)
+        index = DirectoryIndex(os.path.join(self.tempdir, 'deepscan.index'))
+        results = [result for result in index.walk(top, 3) if result is not None]
+        self.assertEqual(as_set(results), expected)
+
+        # stopping early does not leave threads behind
+        import threading
+        n_threads = threading.active_count()
+        walker = parallel_walk(top, 4, queue_size=1)
+        next(walker)
+        walker.close()
+        self.assertEqual(threading.active_count(), n_threads)
+
+        # deep scan with threads
+        ds = DeepScan(threads=4)
+        ds.add_search(top, '\\.bbtestbak$')
+        found = [ret for ret in ds.scan() if ret is not True]
+        self.assertEqual(len(found), 20)
+        self.assertEqual(len(set(found)), 20)
+
     def test_delete(self):
         """Delete files in a test environment"""
 
@@ -145,3 +308,12 @@ class DeepScanTestCase(common.BleachbitTestCase):
             ]
             mock_walk.return_value = expected
             self.assertEqual(list(normalized_walk('.')), expected)
+
+
+if __name__ == '__main__':
+    if 1 < len(sys.argv) and 'benchmark' == sys.argv[1]:
+        for n_regexes in (1, 10, 100, 1000):
+            benchmark_regexes(n_regexes)
+        sys.exit()
+    import unittest
+    unittest.main()
@@ -32,6 +32,8 @@ from bleachbit import expanduser, expandvars, logger
 
 import json
 import sys
+import threading
+import time
 import unittest
 
 
@@ -202,6 +204,53 @@ class FileUtilitiesTestCase(common.BleachbitTestCase):
 
         os.rmdir(dirname)
 
+    def test_walk_entries(self):
+        """Unit test for function walk_entries()"""
+        dirname = self.mkdtemp(prefix='bleachbit-test-walk-entries')
+        for subdir in ('a', 'a/b', 'c'):
+            os.mkdir(os.path.join(dirname, subdir))
+        for filename in ('1', 'a/2', 'a/b/3', 'c/4'):
+            self.write_file(os.path.join(dirname, filename))
+        if 'posix' == os.name:
+            # a symlink to a directory is listed but not followed
+            os.symlink(os.path.join(dirname, 'a'), os.path.join(dirname, 'c/link'))
+
+        for list_directories in (True, False):
+            expected = list(children_in_directory(dirname, list_directories))
+            # same order as os.walk(topdown=False)
+            walked = []
+            for dirpath, dirnames, filenames in os.walk(dirname, topdown=False):
+                if list_directories:
+                    walked += [os.path.join(dirpath, d) for d in dirnames]
+                walked += [os.path.join(dirpath, f) for f in filenames]
+            self.assertEqual(expected, walked)
+            entries = list(walk_entries(dirname, list_directories))
+            self.assertEqual([entry.path for entry in entries], expected)
+            for entry in entries:
+                self.assertEqual(entry.name, os.path.basename(entry.path))
+                self.assertEqual(entry.is_dir(), os.path.isdir(entry.path))
+                self.assertEqual(entry.is_file(), os.path.isfile(entry.path))
+                self.assertEqual(entry.is_symlink(), os.path.islink(entry.path))
+                self.assertEqual(entry.stat(follow_symlinks=False), os.lstat(entry.path))
+
+            # the same with file descriptors of the parent directories
+            entries = list(walk_entries(dirname, list_directories, True))
+            self.assertEqual([entry.path for entry in entries], expected)
+
+        # a missing directory yields nothing
+        self.assertEqual(list(walk_entries(os.path.join(dirname, 'missing'))), [])
+
+        # the fallback entry made from a path behaves the same
+        for entry in walk_entries(dirname, True):
+            path_entry = PathEntry(entry.path)
+            self.assertEqual(path_entry.name, entry.name)
+            self.assertEqual(path_entry.is_dir(), entry.is_dir())
+            self.assertEqual(path_entry.is_file(), entry.is_file())
+            self.assertEqual(path_entry.is_symlink(), entry.is_symlink())
+
+        import shutil
+        shutil.rmtree(dirname)
+
     def test_clean_ini(self):
         """Unit test for clean_ini()"""
         print("testing test_clean_ini() with shred = False")
@@ -595,6 +644,27 @@ class FileUtilitiesTestCase(common.BleachbitTestCase):
 
         self.assertEqual(human_to_bytes('1 MB', 'du'), 1024*1024)
 
+    @unittest.skipUnless(sys.platform.startswith('linux'), 'Linux only')
+    def test_is_rotational(self):
+        """Unit test for is_rotational()"""
+        # a fake /sys/dev/block with a disk and its partition
+        sys_dev_block = os.path.join(self.tempdir, 'dev', 'block')
+        os.makedirs(sys_dev_block)
+        disk = os.path.join(self.tempdir, 'devices', 'sda')
+        os.makedirs(os.path.join(disk, 'sda1'))
+        os.makedirs(os.path.join(disk, 'queue'))
+        self.write_file(os.path.join(disk, 'queue', 'rotational'), '1\n')
+        os.symlink(disk, os.path.join(sys_dev_block, '8:0'))
+        os.symlink(os.path.join(disk, 'sda1'), os.path.join(sys_dev_block, '8:1'))
+        self.assertTrue(is_rotational(os.makedev(8, 0), sys_dev_block))
+        self.assertTrue(is_rotational(os.makedev(8, 1), sys_dev_block))
+        self.write_file(os.path.join(disk, 'queue', 'rotational'), '0\n')
+        self.assertFalse(is_rotational(os.makedev(8, 1), sys_dev_block))
+        # such as tmpfs
+        self.assertEqual(is_rotational(os.makedev(0, 40), sys_dev_block), None)
+        # the real device
+        self.assertIn(is_rotational(os.lstat(self.tempdir).st_dev), (True, False, None))
+
     def test_listdir(self):
         """Unit test for listdir()"""
         if 'posix' == os.name:
@@ -621,6 +691,108 @@ class FileUtilitiesTestCase(common.BleachbitTestCase):
         for pathname in paths12:
             self.assertLExists(pathname)
 
+    @unittest.skipUnless(dir_fd_supported, 'dir_fd is not supported')
+    def test_delete_dir_fd(self):
+        """Unit test for delete() relative to the parent directory"""
+        dirname = self.mkdtemp(prefix='bleachbit-test-delete-dir-fd')
+        for subdir in ('a', 'a/b', 'c'):
+            os.mkdir(os.path.join(dirname, subdir))
+        for filename in ('1', 'a/2', 'a/b/3', 'c/4'):
+            self.write_file(os.path.join(dirname, filename))
+        outside = self.mkdtemp(prefix='bleachbit-test-delete-dir-fd-outside')
+        self.write_file(os.path.join(outside, '4'))
+        fds = os.listdir('/proc/self/fd')
+
+        for entry in walk_entries(dirname, True, True):
+            self.assertIsInstance(entry, DirFdEntry)
+            if entry.path == os.path.join(dirname, 'c', '4'):
+                # swap the directory for a symlink after it was opened
+                os.rename(os.path.join(dirname, 'c'), os.path.join(dirname, 'c.old'))
+                os.symlink(outside, os.path.join(dirname, 'c'))
+            delete(entry.path, allow_shred=False, dir_fd=entry.dir_fd)
+        del entry
+        # the file was removed from the directory which was listed, and
+        # the symlink (not its target) took the place of the directory
+        self.assertEqual(os.listdir(dirname), ['c.old'])
+        self.assertEqual(os.listdir(os.path.join(dirname, 'c.old')), [])
+        self.assertExists(os.path.join(outside, '4'))
+        self.assertEqual(os.listdir('/proc/self/fd'), fds)
+
+        # the entries keep their directories open after the walk, so
+        # another directory cannot take the number of the descriptor
+        import shutil
+        for max_open in (DirFd.max_open, 1):
+            for subdir in ('a', 'a/sub', 'b', 'b/sub'):
+                os.mkdir(os.path.join(dirname, subdir))
+            for filename in ('a/sub/victim.log', 'a/sub/keep', 'b/sub/victim.log'):
+                self.write_file(os.path.join(dirname, filename))
+            save_max_open = DirFd.max_open
+            DirFd.max_open = max_open
+            try:
+                entries = [entry for entry in walk_entries(dirname, True, True)
+                           if entry.name == 'victim.log']
+            finally:
+                DirFd.max_open = save_max_open
+            self.assertEqual(len(entries), 2)
+            self.assertEqual(isinstance(entries[0], DirFdEntry), max_open > 1)
+            others = [os.open(os.path.join(dirname, 'b', 'sub'), os.O_RDONLY)
+                      for dummy in range(4)]
+            entry = [entry for entry in entries if os.sep + 'a' + os.sep in entry.path][0]
+            delete(entry.path, allow_shred=False, dir_fd=getattr(entry, 'dir_fd', None))
+            for fd in others:
+                os.close(fd)
+            self.assertNotExists(os.path.join(dirname, 'a', 'sub', 'victim.log'))
+            self.assertExists(os.path.join(dirname, 'b', 'sub', 'victim.log'))
+            del entries, entry
+            for subdir in ('a', 'b'):
+                shutil.rmtree(os.path.join(dirname, subdir))
+            self.assertEqual(os.listdir('/proc/self/fd'), fds)
+
+        # stopping early closes the directories
+        os.mkdir(os.path.join(dirname, 'd'))
+        self.write_file(os.path.join(dirname, 'd', '5'))
+        walker = walk_entries(dirname, True, True)
+        next(walker)
+        walker.close()
+        self.assertEqual(os.listdir('/proc/self/fd'), fds)
+
+    def test_listing_cache(self):
+        """Unit test for ListingCache and iglob()"""
+        dirname = u'' + self.mkdtemp(prefix='bleachbit-test-listing-cache')
+        for filename in ('a.txt', 'b.log', '.hidden.txt'):
+            self.write_file(os.path.join(dirname, filename))
+        os.mkdir(os.path.join(dirname, 'sub'))
+        self.write_file(os.path.join(dirname, 'sub', 'c.txt'))
+        patterns = [os.path.join(dirname, pattern) for pattern in
+                    ('*.txt', '*', '.*', '*/*.txt', 'a.txt', 'missing', 'sub' + os.sep)]
+
+        listing_cache.start()
+        try:
+            listing_cache.add(dirname)
+            self.assertTrue(lexists(os.path.join(dirname, 'a.txt')))
+            self.assertFalse(lexists(os.path.join(dirname, 'missing')))
+            # a missing directory answers for everything below it
+            self.assertFalse(lexists(os.path.join(dirname, 'missing', 'a', 'b')))
+            # not planned, so the listings cannot tell
+            self.assertEqual(listing_cache.lookup(os.path.join(dirname, 'sub', 'c.txt')), None)
+            self.assertTrue(lexists(os.path.join(dirname, 'sub', 'c.txt')))
+            self.assertEqual(listing_cache.misses, 1)
+            for pattern in patterns:
+                self.assertEqual(sorted(iglob(pattern)), sorted(glob.glob(pattern)))
+            # deletion updates the listing without listing again
+            misses = listing_cache.misses
+            delete(os.path.join(dirname, 'a.txt'))
+            self.assertFalse(lexists(os.path.join(dirname, 'a.txt')))
+            self.assertEqual(listing_cache.misses, misses)
+            # after a change by other means, list again
+            new_filename = self.write_file(os.path.join(dirname, 'new.txt'))
+            self.assertFalse(lexists(new_filename))
+            listing_cache.invalidate(new_filename)
+            self.assertTrue(lexists(new_filename))
+        finally:
+            listing_cache.stop()
+        self.assertEqual(listing_cache.lookup(new_filename), None)
+
     def test_same_partition(self):
         """Unit test for same_partition()"""
         home = expanduser('~')
@@ -634,6 +806,128 @@ class FileUtilitiesTestCase(common.BleachbitTestCase):
                 this_drive = os.path.splitdrive(drive)[0]
                 self.assertEqual(same_partition(home, drive), home_drive == this_drive)
 
+    def test_stat_cache(self):
+        """Unit test for StatCache"""
+        cache = StatCache()
+        filename = self.write_file('bleachbit-test-stat-cache', '123')
+        # disabled: nothing is cached
+        cache.lstat(filename)
+        self.assertEqual((cache.hits, cache.misses), (0, 0))
+
+        cache.start()
+        self.assertEqual(cache.lstat(filename), os.lstat(filename))
+        self.assertEqual(cache.lstat(filename), os.lstat(filename))
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        # a missing path is cached too
+        missing = filename + '-missing'
+        for _i in range(2):
+            self.assertRaises(OSError, cache.lstat, missing)
+        self.assertEqual((cache.hits, cache.misses), (2, 2))
+        # invalidation
+        cache.invalidate(filename)
+        cache.lstat(filename)
+        self.assertEqual(cache.misses, 3)
+        cache.stop()
+        self.assertFalse(cache.enabled)
+        self.assertEqual(cache.stats, {})
+
+        # options which run in parallel share the cache
+        cache.start()
+
+        def hammer():
+            for _i in range(1000):
+                cache.lstat(filename)
+                cache.invalidate(filename)
+                cache.prime(missing, None)
+        threads = [threading.Thread(target=hammer) for _i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(cache.hits + cache.misses, 4000)
+        cache.stop()
+
+        # the module-level cache is invalidated by delete()
+        stat_cache.start()
+        try:
+            self.assertTrue(lexists(filename))
+            self.assertTrue(isfile(filename))
+            self.assertFalse(isdir(filename))
+            self.assertFalse(islink(filename))
+            if 'posix' == os.name:
+                self.assertEqual(getsize(filename), os.lstat(filename).st_blocks * 512)
+            delete(filename)
+            self.assertFalse(lexists(filename))
+        finally:
+            stat_cache.stop()
+        self.assertNotExists(filename)
+
+    def test_TokenBucket(self):
+        """Unit test for class TokenBucket"""
+        now = [100.0]
+        sleeps = []
+
+        def sleep(seconds):
+            sleeps.append(seconds)
+            now[0] += seconds
+        bucket = TokenBucket(10, clock=lambda: now[0], sleep=sleep)
+        # the burst does not wait
+        for dummy in range(10):
+            self.assertEqual(bucket.take(), 0)
+        self.assertEqual(sleeps, [])
+        # then one token every 0.1 seconds
+        self.assertAlmostEqual(bucket.take(), 0.1)
+        now[0] += 1
+        self.assertEqual(bucket.take(5), 0)
+        # a large request goes into debt
+        self.assertAlmostEqual(bucket.take(20), 1.5)
+        self.assertAlmostEqual(sum(sleeps), 1.6)
+
+    def test_Overlap(self):
+        """Unit test for class Overlap"""
+        overlap = Overlap()
+        overlap.start()
+        top = os.path.join(self.tempdir, 'overlap')
+        self.assertEqual(overlap.add_tree(os.path.join(top, 'a', 'b')), [])
+        self.assertEqual(overlap.add_tree(top), [os.path.join(top, 'a', 'b')])
+        self.assertIsNone(overlap.add_tree(os.path.join(top, 'a')))
+        self.assertIsNone(overlap.add_tree(top + os.sep))
+        self.assertTrue(overlap.in_tree(os.path.join(top, 'a', 'file')))
+        self.assertFalse(overlap.in_tree(top))
+        self.assertFalse(overlap.in_tree(top + '2'))
+
+        filename = self.write_file('bleachbit-test-overlap')
+        st = os.lstat(filename)
+        self.assertTrue(overlap.claim(filename, st))
+        self.assertFalse(overlap.claim(filename, st))
+        self.assertTrue(overlap.is_claimed(st))
+        # a new file, which may get the same inode number
+        os.remove(filename)
+        self.write_file(filename)
+        os.utime(filename, (0, 0))
+        self.assertFalse(overlap.is_claimed(os.lstat(filename)))
+        overlap.stop()
+
+    def test_throttle(self):
+        """Unit test for throttling delete() and wipe_contents()"""
+        filenames = [self.write_file('bleachbit-test-throttle%d' % x)
+                     for x in range(0, 25)]
+        try:
+            throttle.configure(unlinks_per_second=20)
+            start = time.time()
+            for filename in filenames:
+                delete(filename)
+            self.assertGreater(time.time() - start, 0.2)
+            self.assertGreater(throttle.seconds, 0.2)
+
+            filename = self.write_file('bleachbit-test-throttle', '0' * 12 * 4096)
+            throttle.configure(bytes_per_second=10 * 4096)
+            wipe_contents(filename)
+            self.assertGreater(throttle.seconds, 0.1)
+        finally:
+            throttle.configure()
+        self.assertEqual(throttle.seconds, 0)
+
     def test_uris_to_paths(self):
         """Unit test for uris_to_paths()"""
         self.assertEqual(uris_to_paths(['']), [])
@@ -655,6 +949,47 @@ class FileUtilitiesTestCase(common.BleachbitTestCase):
         uri_s = ['foo://bar']
         self.assertEqual(uris_to_paths(uri_u + uri_w + uri_s), path_u + path_w)
 
+    def test_Whitelist(self):
+        """Unit test for class Whitelist"""
+        whitelist = Whitelist([('file', '/home/foo'), ('folder', '/home/folder'),
+                               ('file', '/home/folder/a/b'), ('folder', '/opt/'),
+                               ('folder', '/srv/x'), ('file', '/srv/x')], sep='/')
+        tests = (('', False), ('/', False), ('/home', False),
+                 ('/home/foo', True), ('/home/foo/', False), ('/home/foo2', False),
+                 ('/home/folder', True), ('/home/folder/', True),
+                 ('/home/folder/a/b/c', True), ('/home/fold', False),
+                 ('/opt', False), ('/opt/', True), ('/opt/x', False), ('/opt//x', True),
+                 ('/srv/x', True), ('/srv/x/y', True), ('/HOME/FOO', False))
+        for (path, expected) in tests:
+            self.assertEqual(whitelist.match(path), expected, path)
+        # anything under the path
+        tests = (('', True), ('/', True), ('/home', True), ('/home/', True),
+                 ('/home/folder/a', True), ('/home/foo/x', False), ('/opt', True),
+                 ('/usr', False), ('/srv/x/y', True), ('/HOME', False))
+        for (path, expected) in tests:
+            self.assertEqual(whitelist.match_under(path), expected, path)
+
+        # like Windows
+        whitelist = Whitelist([('folder', 'D:\\'), ('file', 'c:\\windows\\foo.log'),
+                               ('folder', 'E:\\Users')], case_sensitive=False, sep='\\')
+        tests = (('d:\\', True), ('D:\\USERS', True), ('C:\\WINDOWS\\FOO.LOG', True),
+                 ('c:\\windows\\foo.log2', False), ('e:\\users', True),
+                 ('e:\\users\\foo.log', True), ('e:\\users2', False))
+        for (path, expected) in tests:
+            self.assertEqual(whitelist.match(path), expected, path)
+        self.assertTrue(whitelist.match_under('C:\\WINDOWS'))
+        self.assertFalse(whitelist.match_under('c:\\users'))
+
+        # Options compiles it again when the whitelist changes
+        old_whitelist = options.get_whitelist_paths()
+        options.set_whitelist_paths([('file', '/home/foo')])
+        compiled = options.get_whitelist()
+        self.assertIs(options.get_whitelist(), compiled)
+        options.set_whitelist_paths([('file', '/home/bar')])
+        self.assertIsNot(options.get_whitelist(), compiled)
+        self.assertTrue(options.get_whitelist().match('/home/bar'))
+        options.set_whitelist_paths(old_whitelist)
+
     def test_whitelisted(self):
         """Unit test for whitelisted()"""
         # setup
@@ -901,5 +1236,36 @@ class FileUtilitiesTestCase(common.BleachbitTestCase):
         openfiles.scan()
         self.assertFalse(openfiles.is_open(filename))
 
+        # bulk check
+        filenames = [self.write_file('bleachbit-test-open-files%d' % x)
+                     for x in range(0, 3)]
+        f = open(filenames[1])
+        openfiles.scan()
+        self.assertEqual(list(openfiles.filter_open(filenames)),
+                         [filenames[0], filenames[2]])
+        f.close()
+
+    @unittest.skipUnless(sys.platform.startswith('linux'), 'skipping on non-Linux')
+    def test_OpenFiles_rescan(self):
+        """Unit test for incremental rescans of OpenFiles"""
+        openfiles = OpenFiles()
+        openfiles.scan()
+        mypid = str(os.getpid())
+        self.assertIn(mypid, openfiles.pids)
+
+        # a rescan reads only the processes it has not seen
+        filename = self.write_file('bleachbit-test-open-files')
+        f = open(filename)
+        openfiles.rescan()
+        self.assertFalse(openfiles.is_open(filename))
+        del openfiles.pids[mypid]
+        openfiles.rescan()
+        self.assertTrue(openfiles.is_open(filename))
+        f.close()
+
+        # an old cache is scanned again by is_open()
+        openfiles.last_full_scan_time -= openfiles.full_scan_interval + 1
+        self.assertFalse(openfiles.is_open(filename))
+
     def test_open_files_lsof(self):
         self.assertEqual(list(open_files_lsof(lambda: 'n/bar/foo\nn/foo/bar\nnoise')), ['/bar/foo', '/foo/bar'])
@@ -0,0 +1,242 @@
+# vim: ts=4:sw=4:expandtab
+
+# BleachBit
+# Copyright (C) 2008-2018 Andrew Ziem
+# https://www.bleachbit.org
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""
+Test case for module Journal
+"""
+
+from __future__ import absolute_import, print_function
+
+from tests import TestCleaner, TestWorker, common
+from bleachbit import FileUtilities
+from bleachbit.Journal import Journal
+from bleachbit.Options import options
+from bleachbit.Worker import Worker, backends
+
+import os
+
+
+class JournalTestCase(common.BleachbitTestCase):
+    """Test case for module Journal"""
+
+    def test_resume(self):
+        """Unit test for resuming an interrupted clean"""
+        files = [self.write_file('bleachbit-test-journal%d' % x, '123')
+                 for x in range(0, 3)]
+        tree = self.mkdtemp(prefix='bleachbit-test-journal-tree')
+        sub_a = os.path.join(tree, 'a')
+        sub_b = os.path.join(tree, 'b')
+        os.mkdir(sub_a)
+        os.mkdir(sub_b)
+        log_a = self.write_file(os.path.join(sub_a, '1.log'))
+        log_b = self.write_file(os.path.join(sub_b, '1.log'))
+        txt_b = self.write_file(os.path.join(sub_b, '2.txt'))
+        astrs = ['<action command="delete" search="file" path="%s"/>' % filename
+                 for filename in files]
+        astrs.append('<action command="delete" search="walk.files" regex="\\.log$" path="%s"/>' % tree)
+        # deleted as a whole
+        tree2 = self.mkdtemp(prefix='bleachbit-test-journal-tree2')
+        sub_c = os.path.join(tree2, 'c')
+        os.mkdir(sub_c)
+        file_c = self.write_file(os.path.join(sub_c, '1'))
+        file_2 = self.write_file(os.path.join(tree2, '2'))
+        astrs.append('<action command="delete" search="walk.all" path="%s"/>' % tree2)
+        backends['test'] = TestCleaner.actions_to_cleaner(astrs)
+        operations = {'test': ['option1', 'option2', 'option3', 'option4', 'option5']}
+        pathname = os.path.join(self.tempdir, 'clean.journal')
+
+        # a clean interrupted after option1 and during the walk of
+        # option4, which finished directory a
+        journal = Journal(pathname)
+        journal.open(operations)
+        journal.add_done('test.option1')
+        action = backends['test'].option_actions['option4'][0]
+        journal.add_finished_walk(action.get_walk_key(), sub_a, os.lstat(sub_a).st_mtime)
+        action = backends['test'].option_actions['option5'][0]
+        journal.add_finished_walk(action.get_walk_key(), sub_c, os.lstat(sub_c).st_mtime)
+        journal.write({'type': 'done', 'option': 'test.option2'})
+        journal.f.close()
+        # the interruption cut the last line short
+        with open(pathname, 'r+') as f:
+            f.truncate(os.path.getsize(pathname) - 10)
+
+        journal = Journal(pathname)
+        journal.load()
+        self.assertEqual(journal.operations, operations)
+        self.assertEqual(journal.done, set(['test.option1']))
+
+        worker = Worker(TestWorker.RecordingCallback(), True, journal.operations,
+                        journal=journal)
+        # shredding would rename directory c, which is not empty
+        old_shred = options.get('shred')
+        options.set('shred', False, commit=False)
+        try:
+            worker.run_headless()
+        finally:
+            options.set('shred', old_shred, commit=False)
+        self.assertExists(files[0])
+        self.assertNotExists(files[1])
+        self.assertNotExists(files[2])
+        self.assertExists(log_a)
+        self.assertNotExists(log_b)
+        self.assertExists(txt_b)
+        self.assertExists(file_c)
+        self.assertNotExists(file_2)
+        # a finished run removes its journal
+        self.assertNotExists(pathname)
+
+        # a walk records the directories it finished
+        journal = Journal(pathname)
+        journal.open(operations)
+        FileUtilities.walk_journal.start(journal)
+        try:
+            paths = [entry.path for entry in FileUtilities.walk_entries(tree, key='k')]
+        finally:
+            FileUtilities.walk_journal.stop()
+        self.assertEqual(sorted(paths), sorted([log_a, txt_b]))
+        journal.f.close()
+        journal = Journal(pathname)
+        journal.load()
+        self.assertEqual(sorted(journal.walks['k']), sorted([tree, sub_a, sub_b]))
+
+        # and it skips them when resuming, unless they changed
+        del journal.walks['k'][tree]
+        journal.open(operations)
+        FileUtilities.walk_journal.start(journal)
+        try:
+            self.assertEqual(list(FileUtilities.walk_entries(tree, key='k')), [])
+            self.write_file(os.path.join(sub_b, '3.txt'))
+            paths = [entry.path for entry in FileUtilities.walk_entries(tree, key='k')]
+            self.assertEqual(sorted(paths), sorted([txt_b, os.path.join(sub_b, '3.txt')]))
+            # another walk does not skip them
+            self.assertEqual(len(list(FileUtilities.walk_entries(tree, key='other'))), 3)
+        finally:
+            FileUtilities.walk_journal.stop()
+        journal.close()
+        self.assertNotExists(pathname)
+
+        # a unicode path which is not ASCII
+        utree = os.path.join(tree, u'\xfc')
+        os.mkdir(utree)
+        self.write_file(os.path.join(utree, u'1.log'))
+        journal = Journal(pathname)
+        journal.open(operations)
+        FileUtilities.walk_journal.start(journal)
+        try:
+            self.assertEqual(len(list(FileUtilities.walk_entries(utree, key='u'))), 1)
+        finally:
+            FileUtilities.walk_journal.stop()
+        journal.f.close()
+        journal = Journal(pathname)
+        journal.load()
+        journal.open(operations)
+        FileUtilities.walk_journal.start(journal)
+        try:
+            self.assertEqual(list(FileUtilities.walk_entries(utree, key='u')), [])
+        finally:
+            FileUtilities.walk_journal.stop()
+        journal.close()
+
+        # not a journal
+        with self.assertRaises(ValueError):
+            Journal(txt_b).load()
+
+
+    def test_resume_batch(self):
+        """Unit test for resuming a clean interrupted in the middle of a batch"""
+        tree = self.mkdtemp(prefix='bleachbit-test-journal-batch')
+        logs = []
+        for name in ('a', 'b'):
+            os.mkdir(os.path.join(tree, name))
+            logs.append(self.write_file(os.path.join(tree, name, '1.log')))
+        astr = '<action command="delete" search="walk.files" regex="\\.log$" path="%s"/>' % tree
+        backends['test'] = TestCleaner.action_to_cleaner(astr)
+        operations = {'test': ['option1']}
+        key = backends['test'].option_actions['option1'][0].get_walk_key()
+        pathname = os.path.join(self.tempdir, 'clean.journal')
+
+        # the walk finished every directory while the commands waited
+        # in the batch, and the run stopped after the first command
+        journal = Journal(pathname)
+        journal.open(operations)
+        worker = Worker(TestWorker.RecordingCallback(), True, operations, journal=journal)
+        worker.headless = True
+        execute_headless = worker.execute_headless
+
+        def interrupt(cmd, operation_option):
+            execute_headless(cmd, operation_option)
+            raise KeyboardInterrupt
+        worker.execute_headless = interrupt
+        FileUtilities.walk_journal.start(journal)
+        try:
+            with self.assertRaises(KeyboardInterrupt):
+                for dummy in worker.clean_option('test', 'option1'):
+                    pass
+        finally:
+            FileUtilities.walk_journal.stop()
+        journal.f.close()
+        self.assertEqual(len([path for path in logs if os.path.exists(path)]), 1)
+
+        # so no directory is journaled, and the resumed clean deletes
+        # the other file
+        journal = Journal(pathname)
+        journal.load()
+        self.assertEqual(journal.walks.get(key, {}), {})
+        worker = Worker(TestWorker.RecordingCallback(), True, journal.operations,
+                        journal=journal)
+        worker.run_headless()
+        for path in logs:
+            self.assertNotExists(path)
+        self.assertNotExists(pathname)
+
+        # after the commands ran, the directories are journaled
+        os.mkdir(os.path.join(tree, 'c'))
+        journal = Journal(pathname)
+        journal.open(operations)
+        worker = Worker(TestWorker.RecordingCallback(), True, operations, journal=journal)
+        worker.headless = True
+        FileUtilities.walk_journal.start(journal)
+        try:
+            for dummy in worker.clean_option('test', 'option1'):
+                pass
+        finally:
+            FileUtilities.walk_journal.stop()
+        journal.f.close()
+        journal = Journal(pathname)
+        journal.load()
+        self.assertEqual(sorted(journal.walks[key]),
+                         sorted([tree] + [os.path.join(tree, name) for name in 'abc']))
+        journal.close()
+
+        # the options which run in parallel journal their walks too
+        journal = Journal(pathname)
+        walks = []
+        add_finished_walk = journal.add_finished_walk
+
+        def record_walk(key, path, mtime):
+            walks.append(path)
+            add_finished_walk(key, path, mtime)
+        journal.add_finished_walk = record_walk
+        worker = Worker(TestWorker.RecordingCallback(), True, {'test': ['option1']}, 2,
+                        journal=journal)
+        worker.run_headless()
+        self.assertEqual(sorted(walks),
+                         sorted([tree] + [os.path.join(tree, name) for name in 'abc']))
+        self.assertNotExists(pathname)
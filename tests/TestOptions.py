@@ -78,6 +78,8 @@ class OptionsTestCase(common.BleachbitTestCase):
         # these should always be set
         for bkey in bleachbit.Options.boolean_keys:
             self.assertIsInstance(o.get(bkey), bool)
+        for ikey in bleachbit.Options.int_keys:
+            self.assertIsInstance(o.get(ikey), int)
 
         # language
         value = o.get_language('en')
@@ -0,0 +1,117 @@
+# vim: ts=4:sw=4:expandtab
+# -*- coding: UTF-8 -*-
+
+# BleachBit
+# Copyright (C) 2008-2018 Andrew Ziem
+# https://www.bleachbit.org
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""
+Test case for module PathStore
+"""
+
+from __future__ import absolute_import, print_function
+
+from tests import common
+from bleachbit.PathStore import PathStore
+
+import os
+import sys
+import time
+
+
+def make_paths(n_paths, n_dirs=100):
+    """Return paths like those of a browser cache"""
+    top = os.path.join(os.path.expanduser('~'), '.cache', 'chromium', 'Default', 'Cache')
+    return [os.path.join(top, 'dir%d' % (x % n_dirs), 'f_%06x' % x) for x in range(0, n_paths)]
+
+
+def benchmark_memory(n_paths=1000000):
+    """Compare the memory of a list of paths to a PathStore"""
+    paths = make_paths(n_paths)
+    list_size = sys.getsizeof(paths) + sum(sys.getsizeof(path) for path in paths)
+    start = time.time()
+    store = PathStore()
+    for path in paths:
+        store.add(path)
+    elapsed_add = time.time() - start
+    start = time.time()
+    for path in store:
+        pass
+    elapsed_iter = time.time() - start
+    print('%d paths: list %.1f MB, PathStore %.1f MB, add %.2fus, iterate %.2fus per path' %
+          (n_paths, list_size / 1e6, store.sizeof() / 1e6,
+           1e6 * elapsed_add / n_paths, 1e6 * elapsed_iter / n_paths))
+
+
+class PathStoreTestCase(common.BleachbitTestCase):
+    """Test case for module PathStore"""
+
+    def test_PathStore(self):
+        """Unit test for class PathStore"""
+        paths = [os.path.join(os.sep, 'home', 'user', 'b', 'file'),
+                 os.path.join(os.sep, 'home', 'user', 'a', 'z'),
+                 os.path.join(os.sep, 'home', 'user', 'a', 'y'),
+                 os.path.join(os.sep, 'home', 'user', 'b', 'file'),
+                 os.path.join(os.sep, 'home', 'user', 'a', 'b', 'x'),
+                 os.path.join(os.sep, 'home', 'user', u'ɡælɪk'),
+                 os.path.join(os.sep, 'home', 'user', 'a', ''),
+                 os.path.join(os.sep, 'top'),
+                 os.sep,
+                 'relative',
+                 os.path.join('relative', 'file')]
+        store = PathStore()
+        self.assertEqual(len(store), 0)
+        for (i, path) in enumerate(paths):
+            self.assertEqual(store.add(path), i)
+        self.assertEqual(len(store), len(paths))
+        self.assertEqual(list(store), paths)
+        for (i, path) in enumerate(paths):
+            self.assertEqual(store[i], path)
+            self.assertEqual(type(store[i]), type(path))
+        # each folder once
+        self.assertEqual(store.dir_names.count('user'), 1)
+
+        # by folder, and then by name
+        self.assertEqual(list(store.iter_sorted()), [
+            'relative',
+            os.path.join('relative', 'file'),
+            os.sep,
+            os.path.join(os.sep, 'top'),
+            os.path.join(os.sep, 'home', 'user', u'ɡælɪk'),
+            os.path.join(os.sep, 'home', 'user', 'a', ''),
+            os.path.join(os.sep, 'home', 'user', 'a', 'y'),
+            os.path.join(os.sep, 'home', 'user', 'a', 'z'),
+            os.path.join(os.sep, 'home', 'user', 'a', 'b', 'x'),
+            os.path.join(os.sep, 'home', 'user', 'b', 'file'),
+            os.path.join(os.sep, 'home', 'user', 'b', 'file')])
+
+        # smaller than a list of strings
+        paths = make_paths(10000)
+        store = PathStore()
+        for path in paths:
+            store.add(path)
+        self.assertEqual(list(store), paths)
+        list_size = sys.getsizeof(paths) + sum(sys.getsizeof(path) for path in paths)
+        self.assertLess(store.sizeof(), list_size / 3)
+
+
+if __name__ == '__main__':
+    if 1 < len(sys.argv) and 'benchmark' == sys.argv[1]:
+        benchmark_memory()
+        sys.exit()
+    import unittest
+    unittest.main()
@@ -0,0 +1,123 @@
+# vim: ts=4:sw=4:expandtab
+
+# BleachBit
+# Copyright (C) 2008-2018 Andrew Ziem
+# https://www.bleachbit.org
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""
+Test case for module Plan
+"""
+
+from __future__ import absolute_import, print_function
+
+from tests import TestCleaner, TestWorker, common
+from bleachbit import Command, FSE
+from bleachbit.Options import options
+from bleachbit.Plan import Plan, PlanWriter
+from bleachbit.Worker import Worker, backends
+
+import os
+
+
+class PlanTestCase(common.BleachbitTestCase):
+    """Test case for module Plan"""
+
+    def test_plan(self):
+        """Unit test for saving a plan and running it"""
+        files = [self.write_file('bleachbit-test-plan%d' % x, '123')
+                 for x in range(0, 5)]
+        tree = self.mkdtemp(prefix='bleachbit-test-plan-tree')
+        tree_file = self.write_file(os.path.join(tree, 'file'), '123')
+        tree_sub = os.path.join(tree, 'sub')
+        os.mkdir(tree_sub)
+        tree_sub_file = self.write_file(os.path.join(tree_sub, 'file'), '123')
+        astrs = ['<action command="delete" search="file" path="%s"/>' % files[0],
+                 '<action command="delete" search="file" path="%s"/>' % files[1],
+                 '<action command="delete" search="file" path="%s"/>' % files[2],
+                 '<action command="truncate" search="file" path="%s"/>' % files[3],
+                 '<action command="delete" search="walk.all" path="%s"/>' % tree,
+                 '<action command="access.denied" path="%s"/>' % files[4]]
+        backends['test'] = TestCleaner.actions_to_cleaner(astrs)
+        operations = {'test': ['option%d' % x for x in range(1, 7)]}
+        pathname = os.path.join(self.tempdir, 'plan.json')
+
+        # preview
+        for jobs in (1, 2):
+            plan_writer = PlanWriter(pathname, operations)
+            worker = Worker(TestWorker.RecordingCallback(), False,
+                            {'test': list(operations['test'])}, jobs,
+                            plan_writer=plan_writer)
+            worker.run_headless()
+            plan_writer.close()
+            plan = Plan(pathname)
+            self.assertEqual(plan.operations, operations)
+            self.assertEqual(sorted(plan.options), ['test.option%d' % x for x in range(1, 7)])
+            self.assertEqual(plan.rescan, set(['test.option6']))
+            # the files of a tree, the children before their folder
+            records = list(plan.get_records('test.option5'))
+            self.assertEqual(set(record['command'] for record in records), set(['delete']))
+            paths = [record['path'] for record in records]
+            self.assertEqual(sorted(paths), sorted([tree_file, tree_sub, tree_sub_file]))
+            self.assertLess(paths.index(tree_sub_file), paths.index(tree_sub))
+            self.assertEqual([record['path'] for record in plan.get_records('test.option1')],
+                             [files[0]])
+        for filename in files:
+            self.assertExists(filename)
+
+        # change the files after the preview
+        os.remove(files[1])
+        self.write_file(files[2], '12345')
+        new_file = self.write_file(os.path.join(tree, 'new'), '123')
+        new_sub_file = self.write_file(os.path.join(tree_sub, 'new'), '123')
+
+        # clean without scanning
+        for x in range(1, 6):
+            del backends['test'].option_actions['option%d' % x]
+        worker = Worker(TestWorker.RecordingCallback(), True, plan.operations,
+                        plan=plan)
+        # shredding would rename directory sub, which is not empty
+        old_shred = options.get('shred')
+        options.set('shred', False, commit=False)
+        try:
+            worker.run_headless()
+        finally:
+            options.set('shred', old_shred, commit=False)
+        self.assertNotExists(files[0])
+        self.assertExists(files[2])
+        self.assertNotExists(files[4])
+        self.assertEqual(os.path.getsize(files[3]), 0)
+        self.assertNotExists(tree_file)
+        self.assertNotExists(tree_sub_file)
+        # not in the preview
+        self.assertExists(new_file)
+        self.assertExists(new_sub_file)
+        self.assertEqual(plan.n_changed, 2)
+        # the access denied function was scanned again
+        self.assertEqual(worker.total_errors, 1)
+
+        # a unicode path which is not ASCII
+        filename = self.write_file(u'bleachbit-test-plan-\xfcnicode', '123')
+        plan_writer = PlanWriter(pathname, operations)
+        plan_writer.add(Command.Delete(filename), 'test.option1',
+                        {'n_deleted': 1, 'n_special': 0})
+        plan_writer.close()
+        self.assertEqual([record['path'] for record in Plan(pathname).get_records('test.option1')],
+                         [filename.encode(FSE)])
+
+        # not a plan
+        with self.assertRaises(ValueError):
+            Plan(files[2])
@@ -0,0 +1,173 @@
+# vim: ts=4:sw=4:expandtab
+
+# BleachBit
+# Copyright (C) 2008-2018 Andrew Ziem
+# https://www.bleachbit.org
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""
+Test case for module Purge
+"""
+
+from __future__ import absolute_import, print_function
+
+from tests import TestCleaner, TestWorker, common
+from bleachbit import Purge
+from bleachbit.Options import options
+from bleachbit.Worker import Worker, backends
+
+import os
+import unittest
+
+
+@unittest.skipUnless('posix' == os.name, 'not applicable to Windows')
+class PurgeTestCase(common.BleachbitTestCase):
+    """Test case for module Purge"""
+
+    def setUp(self):
+        """Record the purgers instead of starting them, and stage in a
+        temporary configuration directory"""
+        common.BleachbitTestCase.setUp(self)
+        self.purgers = []
+        self.save_start_purger = Purge.start_purger
+        Purge.start_purger = self.purgers.append
+        self.save_options_dir = Purge.options_dir
+        Purge.options_dir = self.mkdtemp(prefix='bleachbit-test-options')
+
+    def tearDown(self):
+        Purge.start_purger = self.save_start_purger
+        Purge.options_dir = self.save_options_dir
+        common.BleachbitTestCase.tearDown(self)
+
+    def make_tree(self):
+        """Make a directory tree, and return its path"""
+        top = self.mkdtemp(prefix='bleachbit-test-purge')
+        os.makedirs(os.path.join(top, 'a', 'b'))
+        self.write_file(os.path.join(top, 'file'), '123')
+        self.write_file(os.path.join(top, 'a', 'file'), '123')
+        self.write_file(os.path.join(top, 'a', 'b', 'file'), '123')
+        return top
+
+    def test_stage(self):
+        """Unit test for staging a tree and purging it"""
+        top = self.make_tree()
+        manifest = Purge.Manifest(os.path.join(self.tempdir, 'purge.manifest'))
+        stager = Purge.Stager()
+        stager.start(manifest)
+        self.assertTrue(stager.enabled)
+        self.assertEqual(stager.stage(top, False), 2)
+        stager.stop()
+        self.assertEqual(self.purgers, [manifest.pathname])
+        self.assertFalse(stager.enabled)
+        self.assertEqual(os.listdir(top), [])
+        pending = manifest.pending()
+        self.assertEqual(len(pending), 1)
+        (staged, shred) = pending[0]
+        self.assertFalse(shred)
+        self.assertEqual(os.lstat(staged).st_dev, os.lstat(top).st_dev)
+        self.assertEqual(os.path.dirname(staged), os.path.join(Purge.options_dir, 'staging'))
+        self.assertExists(os.path.join(staged, 'a', 'b', 'file'))
+
+        # nothing to stage in an empty directory
+        self.assertEqual(stager.stage(top, False), 0)
+        self.assertEqual(len(manifest.pending()), 1)
+
+        # an earlier run left a staged directory
+        stager.start(manifest)
+        stager.stop()
+        self.assertEqual(self.purgers, [manifest.pathname] * 2)
+
+        # a directory which is not deleted stays in the manifest
+        save_purge_directory = Purge.purge_directory
+        Purge.purge_directory = lambda path, shred: None
+        try:
+            self.assertEqual(Purge.purge(manifest), 0)
+        finally:
+            Purge.purge_directory = save_purge_directory
+        self.assertEqual(manifest.pending(), pending)
+
+        self.assertEqual(Purge.purge(manifest), 1)
+        self.assertNotExists(staged)
+        self.assertEqual(manifest.pending(), [])
+        self.assertEqual(os.path.getsize(manifest.pathname), 0)
+        self.assertEqual(Purge.purge(manifest), 0)
+
+        # only a private directory in the configuration directory is
+        # a staging area, and elsewhere the files stay in place
+        top = self.make_tree()
+        st_dev = os.lstat(top).st_dev
+        area = os.path.join(Purge.options_dir, 'staging')
+        os.chmod(area, 0o755)
+        stager.start(manifest)
+        self.assertIsNone(stager.get_area(top, st_dev))
+        self.assertEqual(stager.stage(top, False), 0)
+        stager.stop()
+        os.rmdir(area)
+        os.symlink(self.mkdtemp(prefix='bleachbit-test-purge-link'), area)
+        stager.start(manifest)
+        self.assertIsNone(stager.get_area(top, st_dev))
+        self.assertIsNone(stager.get_area(top, st_dev + 1))
+        stager.stop()
+        Purge.options_dir = os.path.join(self.tempdir, 'missing')
+        stager.start(manifest)
+        self.assertEqual(stager.stage(top, False), 0)
+        stager.stop()
+        self.assertEqual(len(os.listdir(top)), 2)
+        self.assertEqual(manifest.pending(), [])
+
+        # the purger does not follow a symlink
+        link = os.path.join(self.tempdir, 'purge-link')
+        os.symlink(top, link)
+        self.assertTrue(Purge.purge_directory(link, False))
+        self.assertExists(link)
+        self.assertExists(os.path.join(top, 'a', 'b', 'file'))
+
+    def test_worker(self):
+        """Unit test for the background purge in Worker"""
+        manifest = Purge.Manifest(os.path.join(self.tempdir, 'purge.manifest'))
+        for whitelist in (False, True):
+            top = self.make_tree()
+            keep = os.path.join(top, 'a', 'b', 'file')
+            old_whitelist = options.get_whitelist_paths()
+            if whitelist:
+                options.set_whitelist_paths([('folder', os.path.join(top, 'a'))])
+            astr = '<action command="delete" search="walk.all" path="%s"/>' % top
+            backends['test'] = TestCleaner.action_to_cleaner(astr)
+            workers = [Worker(TestWorker.RecordingCallback(), really_delete, {'test': ['option1']},
+                              purge_manifest=manifest) for really_delete in (False, True)]
+            try:
+                for worker in workers:
+                    worker.run_headless()
+            finally:
+                options.set_whitelist_paths(old_whitelist)
+            self.assertFalse(Purge.stager.enabled)
+            (preview, worker) = workers
+            self.assertEqual(worker.total_errors, 0)
+            if whitelist:
+                # deleted here, except the whitelisted folder
+                self.assertEqual(worker.total_deleted, 1)
+                self.assertEqual(worker.total_bytes, preview.total_bytes)
+                self.assertExists(keep)
+                self.assertEqual(manifest.pending(), [])
+            else:
+                # moved aside without counting the files: the preview
+                # has the size
+                self.assertEqual(preview.total_deleted, 5)
+                self.assertEqual(worker.total_deleted, 0)
+                self.assertEqual(worker.total_bytes, 0)
+                self.assertEqual(os.listdir(top), [])
+                self.assertEqual(len(manifest.pending()), 1)
+                self.assertEqual(Purge.purge(manifest), 1)
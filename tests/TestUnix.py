@@ -104,6 +104,42 @@ root               531   0.0  0.0  2501712    588   ??  Ss   20May16   0:02.40 s
         self.assertTrue(is_running(exe))
         self.assertFalse(is_running('does-not-exist'))
 
+    def test_process_snapshot(self):
+        """Unit test for class ProcessSnapshot"""
+        calls = []
+
+        def list_processes():
+            calls.append(1)
+            return {'foo': set([1, 2]), 'bar': set([3])}
+        snapshot = ProcessSnapshot(list_processes)
+
+        # disabled, each check lists the processes
+        self.assertTrue(snapshot.is_running('foo'))
+        self.assertFalse(snapshot.is_running('baz'))
+        self.assertEqual(len(calls), 2)
+
+        # enabled, the processes are listed once
+        snapshot.start()
+        for exename in ('foo', 'bar', 'baz', 'foo'):
+            snapshot.is_running(exename)
+        lock = self.write_file('lock')
+        pattern = os.path.join(self.tempdir, 'lo*')
+        self.assertEqual(snapshot.glob(pattern), [lock])
+        os.remove(lock)
+        self.assertEqual(snapshot.glob(pattern), [lock])
+        self.assertEqual(len(calls), 3)
+
+        # an expired snapshot is taken again
+        snapshot.taken -= snapshot.ttl
+        self.assertTrue(snapshot.is_running('bar'))
+        self.assertEqual(snapshot.glob(pattern), [])
+        self.assertEqual(len(calls), 4)
+        snapshot.stop()
+
+        # the real process table
+        exe = os.path.basename(os.path.realpath(sys.executable))
+        self.assertIn(os.getpid(), running_processes()[exe])
+
     def test_journald_clean(self):
         if not FileUtilities.exe_exists('journalctl'):
             self.assertRaises(RuntimeError, journald_clean)
@@ -194,6 +230,19 @@ root               531   0.0  0.0  2501712    588   ??  Ss   20May16   0:02.40 s
         for path in rotated_logs():
             self.assertLExists(path, "Rotated log path '%s' does not exist" % path)
 
+    def test_set_low_priority(self):
+        """Unit test for set_low_priority()"""
+        # in another process, because the priority cannot be raised again
+        from bleachbit.General import run_external
+        code = ('from __future__ import print_function; from bleachbit import Unix; import os; '
+                'print(Unix.set_low_priority(), os.nice(0))')
+        (rc, stdout, stderr) = run_external([sys.executable, '-c', code])
+        self.assertEqual(rc, 0, stderr)
+        (ioprio_set, niceness) = stdout.split()
+        self.assertEqual(niceness, '19')
+        if sys.platform.startswith('linux'):
+            self.assertEqual(ioprio_set, 'True')
+
     def test_run_cleaner_cmd(self):
         from subprocess import CalledProcessError
         self.assertRaises(RuntimeError, run_cleaner_cmd, '/hopethisdoesntexist', [])
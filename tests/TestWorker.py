@@ -26,16 +26,37 @@ Test case for module Worker
 from __future__ import absolute_import, print_function
 
 from tests import TestCleaner, common
-from bleachbit import CLI, Command
+from bleachbit import CLI, Command, FileUtilities
 from bleachbit.Action import ActionProvider
+from bleachbit.Journal import Journal
+from bleachbit.Options import options
 from bleachbit.Worker import *
 from bleachbit import expanduser
 
+import logging
 import os
+import sys
 import tempfile
+import threading
+import time
 import unittest
 
 
+class RecordingCallback(CLI.CliCallback):
+    """Remember the text and item sizes passed by Worker"""
+
+    def __init__(self):
+        CLI.CliCallback.__init__(self)
+        self.lines = []
+        self.item_sizes = {}
+
+    def append_text(self, msg, tag=None):
+        self.lines.append(msg)
+
+    def update_item_size(self, op, opid, size):
+        self.item_sizes[(op, opid)] = size
+
+
 class AccessDeniedActionAction(ActionProvider):
     action_key = 'access.denied'
 
@@ -174,6 +195,28 @@ class RuntimeErrorAction(ActionProvider):
         yield Command.Delete(self.pathname)
 
 
+class BrokenDelete(Command.Delete):
+
+    def execute(self, really_delete):
+        raise RuntimeError('This is a test exception')
+        yield
+
+
+class BrokenDeleteAction(ActionProvider):
+
+    action_key = 'broken.delete'
+
+    def __init__(self, action_element):
+        self.pathname = action_element.getAttribute('path')
+
+    def get_commands(self):
+        # runtime exception on the thread of the device
+        yield BrokenDelete(self.pathname)
+
+        # real file, should succeed
+        yield Command.Delete(self.pathname)
+
+
 class TruncateTestAction(ActionProvider):
 
     action_key = 'truncate.test'
@@ -189,6 +232,96 @@ class TruncateTestAction(ActionProvider):
         yield Command.Delete(self.pathname)
 
 
+class NullCommand:
+
+    """A command which does nothing, to measure the overhead of Worker"""
+
+    def execute(self, really_delete):
+        yield {'label': '', 'n_deleted': 1, 'n_special': 0, 'path': None, 'size': None}
+
+
+class NullAction(ActionProvider):
+    action_key = 'null.benchmark'
+
+    def __init__(self, action_element):
+        self.count = int(action_element.getAttribute('path'))
+
+    def get_commands(self):
+        for dummy in range(self.count):
+            yield NullCommand()
+
+
+def benchmark_headless(n_commands=100000):
+    """Measure the overhead per command of run() and of run_headless()
+
+    The commands do nothing, so the time is spent in Worker: the
+    generators which yield to the GTK idle loop and the timing between
+    commands, which run_headless() skips."""
+    astr = '<action command="null.benchmark" path="%d"/>' % n_commands
+    backends['test'] = TestCleaner.actions_to_cleaner([astr])
+
+    worker = Worker(CLI.CliCallback(), False, {'test': ['option1']})
+    start = time.time()
+    run = worker.run()
+    while run.next():
+        pass
+    elapsed_run = time.time() - start
+    assert worker.total_deleted == n_commands
+
+    worker = Worker(CLI.CliCallback(), False, {'test': ['option1']})
+    start = time.time()
+    worker.run_headless()
+    elapsed_headless = time.time() - start
+    assert worker.total_deleted == n_commands
+
+    print('%d commands: run() %.2fus per command, run_headless() %.2fus per command' %
+          (n_commands, 1e6 * elapsed_run / n_commands, 1e6 * elapsed_headless / n_commands))
+
+
+def benchmark_locality(n_dirs=20, n_files=2000, image_size='1G'):
+    """Measure deleting files in batches ordered by order_by_locality()
+
+    This needs root, to mount an ext4 image on a loop device.  The
+    glob lists each directory in the hash order of ext4, which is not
+    the order of the inodes, so each delete may update another part of
+    the inode table.  The time includes the sync, and the caches are
+    dropped before each run."""
+    import subprocess
+    tempdir = tempfile.mkdtemp(prefix='bleachbit-locality-bench')
+    image = os.path.join(tempdir, 'ext4.img')
+    mnt = os.path.join(tempdir, 'mnt')
+    os.mkdir(mnt)
+    subprocess.check_call(['truncate', '-s', image_size, image])
+    subprocess.check_call(['mkfs.ext4', '-q', '-F', image])
+    subprocess.check_call(['mount', '-o', 'loop', image, mnt])
+    astr = '<action command="delete" search="glob" path="%s"/>' % os.path.join(mnt, 'd*', '*')
+    backends['test'] = TestCleaner.actions_to_cleaner([astr])
+    try:
+        for batch_size in (1, Worker.batch_size):
+            for x in range(0, n_dirs):
+                dirname = os.path.join(mnt, 'd%d' % x)
+                os.mkdir(dirname)
+                for y in range(0, n_files):
+                    common.touch_file(os.path.join(dirname, 'file%d' % y))
+            subprocess.check_call(['sync'])
+            with open('/proc/sys/vm/drop_caches', 'w') as f:
+                f.write('3\n')
+            worker = Worker(CLI.CliCallback(), True, {'test': ['option1']})
+            worker.batch_size = batch_size
+            start = time.time()
+            worker.run_headless()
+            subprocess.check_call(['sync'])
+            elapsed = time.time() - start
+            assert worker.total_deleted == n_dirs * n_files
+            for x in range(0, n_dirs):
+                os.rmdir(os.path.join(mnt, 'd%d' % x))
+            print('%d files, batches of %d: %.2fs' % (n_dirs * n_files, batch_size, elapsed))
+    finally:
+        subprocess.check_call(['umount', mnt])
+        import shutil
+        shutil.rmtree(tempdir)
+
+
 class WorkerTestCase(common.BleachbitTestCase):
 
     """Test case for module Worker"""
@@ -329,3 +462,418 @@ class WorkerTestCase(common.BleachbitTestCase):
         self.assertEqual(worker.total_special, 0)
         self.assertEqual(worker.total_errors, 0)
         self.assertEqual(worker.total_deleted, 2)
+
+    def test_jobs(self):
+        """Test running cleaner options in parallel"""
+        astrs = []
+        filenames = []
+        for i in range(6):
+            dirname = self.mkdtemp(prefix='bleachbit-test-worker-jobs')
+            for j in range(5):
+                filenames.append(self.write_file(
+                    os.path.join(dirname, 'file%d' % j), '123'))
+            astrs.append('<action command="delete" search="walk.files" path="%s"/>' % dirname)
+        cleaner = TestCleaner.actions_to_cleaner(astrs)
+        backends['test'] = cleaner
+        option_ids = ['option%d' % (i + 1) for i in range(6)]
+
+        def run_worker(really_delete, jobs):
+            ui = RecordingCallback()
+            worker = Worker(ui, really_delete, {'test': list(option_ids)}, jobs)
+            run = worker.run()
+            while run.next():
+                pass
+            return (worker, ui)
+
+        (worker1, ui1) = run_worker(False, 1)
+        (worker4, ui4) = run_worker(False, 4)
+        # the preview gives the same output in the same order
+        self.assertEqual(ui1.lines, ui4.lines)
+        self.assertEqual(ui1.item_sizes, ui4.item_sizes)
+        self.assertEqual(worker1.total_bytes, worker4.total_bytes)
+        self.assertEqual(worker4.total_deleted, 30)
+
+        (worker, ui) = run_worker(True, 4)
+        self.assertEqual(worker.total_deleted, 30)
+        self.assertEqual(worker.total_errors, 0)
+        self.assertEqual(worker.total_bytes, worker1.total_bytes)
+        for filename in filenames:
+            self.assertNotExists(filename)
+
+        # the errors of the options keep their place in the output
+        astrs = []
+        for i in range(4):
+            astrs.append('<action command="delete" search="file" path="%s"/>' %
+                         self.write_file('bleachbit-test-worker-jobs%d' % i))
+            astrs.append('<action command="access.denied" path="%s"/>' %
+                         os.path.join(self.tempdir, 'missing%d' % i))
+        backends['test'] = TestCleaner.actions_to_cleaner(astrs)
+        option_ids = ['option%d' % (i + 1) for i in range(8)]
+
+        class LinesHandler(logging.Handler):
+
+            def emit(self, record):
+                ui.lines.append('error: ' + record.getMessage())
+        handler = LinesHandler(logging.ERROR)
+        logging.getLogger('bleachbit').addHandler(handler)
+        try:
+            ui = RecordingCallback()
+            worker = Worker(ui, False, {'test': list(option_ids)}, 1)
+            worker.run_headless()
+            ui1 = ui
+            ui = RecordingCallback()
+            worker = Worker(ui, False, {'test': list(option_ids)}, 4)
+            worker.run_headless()
+        finally:
+            logging.getLogger('bleachbit').removeHandler(handler)
+        self.assertEqual(worker.total_errors, 4)
+        self.assertEqual(len([line for line in ui.lines if line.startswith('error: ')]), 4)
+        self.assertEqual(ui.lines, ui1.lines)
+
+        # an abort does not wait for the command which runs
+        release = threading.Event()
+        started = threading.Event()
+        execute_headless = Worker.execute_headless
+
+        def blocked(self, cmd, operation_option):
+            started.set()
+            release.wait(30)
+        n_threads = threading.active_count()
+        Worker.execute_headless = blocked
+        try:
+            worker = Worker(RecordingCallback(), False, {'test': list(option_ids)}, 2)
+            run = worker.run()
+            while not started.is_set():
+                run.next()
+            start = time.time()
+            run.close()
+            self.assertLess(time.time() - start, 5)
+            self.assertTrue(worker.cancel.is_set())
+        finally:
+            release.set()
+            Worker.execute_headless = execute_headless
+        # the threads stop after the command
+        for dummy in range(100):
+            if threading.active_count() == n_threads:
+                break
+            time.sleep(0.05)
+        self.assertEqual(threading.active_count(), n_threads)
+
+    def test_queue_depth(self):
+        """Test running the commands with a queue for each device"""
+        import threading
+        dirnames = [self.mkdtemp(prefix='bleachbit-test-worker-queue')]
+        if os.path.isdir('/dev/shm'):
+            # usually another device
+            dirnames.append(tempfile.mkdtemp(prefix='bleachbit-test-worker-queue', dir='/dev/shm'))
+        astrs = []
+        filenames = []
+        for dirname in dirnames:
+            os.mkdir(os.path.join(dirname, 'sub'))
+            for name in ('a.log', 'b.log', os.path.join('sub', 'c.log')):
+                filenames.append(self.write_file(os.path.join(dirname, name), '123'))
+            astrs.append('<action command="delete" search="walk.all" regex="." path="%s"/>' % dirname)
+        astrs.append('<action command="broken.delete" path="%s"/>' %
+                     self.write_file('bleachbit-test-worker-queue-broken', '123'))
+        backends['test'] = TestCleaner.actions_to_cleaner(astrs)
+        option_ids = ['option%d' % (i + 1) for i in range(len(astrs))]
+
+        def run_worker(really_delete, jobs, queue_depth):
+            ui = RecordingCallback()
+            worker = Worker(ui, really_delete, {'test': list(option_ids)}, jobs,
+                            queue_depth=queue_depth)
+            worker.run_headless()
+            return (worker, ui)
+
+        n_threads = threading.active_count()
+        (worker0, ui0) = run_worker(False, 1, 0)
+        for (jobs, queue_depth) in ((1, 2), (2, 4)):
+            (worker, ui) = run_worker(False, jobs, queue_depth)
+            # the same output in the same order
+            self.assertEqual(ui.lines, ui0.lines)
+            self.assertEqual(ui.item_sizes, ui0.item_sizes)
+            self.assertEqual(worker.total_deleted, worker0.total_deleted)
+            self.assertEqual(worker.total_errors, 1)
+            self.assertEqual(threading.active_count(), n_threads)
+
+        # the directories are deleted after the files in them
+        (worker, ui) = run_worker(True, 1, 2)
+        self.assertEqual(worker.total_errors, 1)
+        for filename in filenames:
+            self.assertNotExists(filename)
+        for dirname in dirnames:
+            self.assertEqual(os.listdir(dirname), [])
+        if 1 < len(dirnames):
+            os.rmdir(dirnames[1])
+
+    def test_pipeline(self):
+        """Test deleting a tree with a short pipeline of commands"""
+        top = self.mkdtemp(prefix='bleachbit-test-worker-pipeline')
+        for dirname in ('a', 'b', os.path.join('b', 'c'), os.path.join('b', 'c', 'd')):
+            os.mkdir(os.path.join(top, dirname))
+            for x in range(0, 5):
+                self.write_file(os.path.join(top, dirname, 'file%d' % x), '123')
+        backends['test'] = TestCleaner.action_to_cleaner(
+            '<action command="delete" search="walk.all" regex="." path="%s"/>' % top)
+
+        def run_worker(really_delete, queue_depth):
+            ui = RecordingCallback()
+            worker = Worker(ui, really_delete, {'test': ['option1']}, queue_depth=queue_depth)
+            worker.max_scheduled = 3
+            # in the order of the walk, like the preview
+            worker.batch_size = 1
+            worker.run_headless()
+            return (worker, ui)
+
+        (worker0, ui0) = run_worker(False, 0)
+        # four threads even if the test directory is on a spinning disk
+        from bleachbit import FileUtilities
+        save_is_rotational = FileUtilities.is_rotational
+        FileUtilities.is_rotational = lambda st_dev: False
+        try:
+            (worker, ui) = run_worker(False, 4)
+            self.assertEqual(ui.lines, ui0.lines)
+            self.assertEqual(worker.total_deleted, 24)
+            # the directories are removed after their files, and the
+            # results are in the order of the commands
+            (worker, ui) = run_worker(True, 4)
+        finally:
+            FileUtilities.is_rotational = save_is_rotational
+        self.assertEqual(worker.total_errors, 0)
+        self.assertEqual(os.listdir(top), [])
+        self.assertEqual([line.split()[-1] for line in ui.lines[:24]],
+                         [line.split()[-1] for line in ui0.lines[:24]])
+
+    def test_summary(self):
+        """Test the summary mode"""
+        astrs = []
+        filenames = []
+        for i in range(2):
+            dirname = self.mkdtemp(prefix='bleachbit-test-worker-summary')
+            for j in range(6):
+                filenames.append(self.write_file(
+                    os.path.join(dirname, 'file%d' % j), 'x' * 5000 * (j + 1)))
+            astrs.append('<action command="delete" search="walk.files" path="%s"/>' % dirname)
+        cleaner = TestCleaner.actions_to_cleaner(astrs)
+        backends['test'] = cleaner
+
+        def run_worker(jobs):
+            ui = RecordingCallback()
+            worker = Worker(ui, False, {'test': ['option1', 'option2']}, jobs, summary=True)
+            run = worker.run()
+            while run.next():
+                pass
+            return (worker, ui)
+
+        (worker, ui) = run_worker(1)
+        self.assertEqual(worker.total_deleted, 12)
+        summary = worker.summary
+        self.assertEqual(summary.options['test.option1'][0], 6)
+        self.assertEqual(sum(size for (count, size) in summary.options.values()),
+                         worker.total_bytes)
+        self.assertEqual(sum(count for (count, size) in summary.directories.values()), 12)
+        # the largest items are kept, and not every file is listed
+        self.assertEqual(len(summary.largest), 10)
+        self.assertEqual(min(summary.largest)[0],
+                         sorted(FileUtilities.getsize(f) for f in filenames)[2])
+        smallest = sorted(filenames, key=FileUtilities.getsize)[:2]
+        for filename in filenames:
+            listed = any(line.endswith(filename + '\n') for line in ui.lines)
+            self.assertEqual(listed, filename not in smallest)
+
+        # the same with jobs
+        (worker4, ui4) = run_worker(4)
+        self.assertEqual(worker4.summary.options, summary.options)
+        self.assertEqual(worker4.summary.directories, summary.directories)
+        self.assertEqual(sorted((size, path) for (size, dummy, path) in worker4.summary.largest),
+                         sorted((size, path) for (size, dummy, path) in summary.largest))
+        self.assertEqual(ui4.lines, ui.lines)
+
+        # top-level directory
+        self.assertEqual(summary.top_directory('/home/user/.cache/foo/bar'),
+                         '/home/user/.cache')
+        self.assertEqual(summary.top_directory('/tmp/foo'), '/tmp')
+
+        # unicode and UTF-8 paths which are not ASCII, of the same size
+        summary = Summary(top_n=2)
+        summary.add('test.option1', u'/home/u/caf\xe9/file', 10, 1)
+        summary.add('test.option1', '/home/u/caf\xc3\xa9/other', 10, 1)
+        summary.add('test.option1', '/home/u/caf\xc3\xa9/small', 5, 1)
+        lines = summary.lines()
+        self.assertIn(u'10B /home/u/caf\xe9/file', lines)
+        self.assertIn(u'10B /home/u/caf\xe9/other', lines)
+        self.assertEqual(summary.directories[u'/home/u/caf\xe9'][0], 3)
+
+    def test_run_headless(self):
+        """Test run_headless() gives the same output as run()"""
+        filenames = [self.write_file('bleachbit-test-worker-headless%d' % x, '123')
+                     for x in range(0, 3)]
+        astrs = ['<action command="delete" search="file" path="%s"/>' % filename
+                 for filename in filenames]
+        astrs.append('<action command="access.denied" path="%s"/>' % filenames[2])
+        backends['test'] = TestCleaner.actions_to_cleaner(astrs)
+        operations = ['option1', 'option2', 'option3', 'option4']
+
+        ui = RecordingCallback()
+        worker = Worker(ui, False, {'test': list(operations)})
+        run = worker.run()
+        while run.next():
+            pass
+        ui_headless = RecordingCallback()
+        worker_headless = Worker(ui_headless, False, {'test': list(operations)})
+        worker_headless.run_headless()
+        self.assertEqual(ui.lines, ui_headless.lines)
+        self.assertEqual(ui.item_sizes, ui_headless.item_sizes)
+        self.assertEqual((worker.total_deleted, worker.total_bytes),
+                         (worker_headless.total_deleted, worker_headless.total_bytes))
+
+        backends['test'] = TestCleaner.actions_to_cleaner(
+            ['<action command="null.benchmark" path="10"/>'])
+        worker = Worker(ui, True, {'test': ['option1']})
+        worker.run_headless()
+        self.assertEqual(worker.total_deleted, 10)
+
+    def test_run_stops(self):
+        """Test run() stops the run-scoped caches if it does not finish"""
+        filename = self.write_file('bleachbit-test-worker-stops', '123')
+        backends['test'] = TestCleaner.action_to_cleaner(
+            '<action command="delete" search="file" path="%s"/>' % filename)
+        caches = (FileUtilities.stat_cache, FileUtilities.listing_cache,
+                  FileUtilities.overlap)
+
+        # the user aborts
+        worker = Worker(RecordingCallback(), False, {'test': ['option1']})
+        run = worker.run()
+        run.next()
+        self.assertTrue(all(cache.enabled for cache in caches))
+        run.close()
+        self.assertFalse(any(cache.enabled for cache in caches))
+
+        # an exception
+        def run_operations(operations):
+            raise RuntimeError('test')
+            yield True
+        pathname = os.path.join(self.tempdir, 'clean.journal')
+        worker = Worker(RecordingCallback(), True, {'test': ['option1']},
+                        journal=Journal(pathname))
+        worker.run_operations = run_operations
+        self.assertRaises(RuntimeError, worker.run_headless)
+        self.assertFalse(any(cache.enabled for cache in caches))
+        self.assertIsNone(FileUtilities.walk_journal.journal)
+        # the journal is kept to resume
+        self.assertExists(pathname)
+        self.assertExists(filename)
+
+
+    def test_order_by_locality(self):
+        """Unit test for order_by_locality()"""
+        top = self.mkdtemp(prefix='bleachbit-test-locality')
+        paths = []
+        for dirname in ('a', 'b', os.path.join('a', 'c'), os.path.join('a', 'c', 'd')):
+            dirname = os.path.join(top, dirname)
+            os.mkdir(dirname)
+            paths.append(dirname)
+            paths += [self.write_file(os.path.join(dirname, 'file%d' % x)) for x in range(0, 5)]
+        import random
+        random.seed(1)
+        for dummy in range(0, 10):
+            random.shuffle(paths)
+            ordered = [cmd.path for cmd in order_by_locality([Command.Delete(path) for path in paths])]
+            self.assertEqual(sorted(ordered), sorted(paths))
+            # each directory after the paths under it
+            for (i, path) in enumerate(ordered):
+                for path2 in ordered[i + 1:]:
+                    self.assertFalse(path2.startswith(path + os.sep), (path2, path))
+            # the files by parent directory and inode
+            keys = [(os.lstat(os.path.dirname(path)).st_ino, os.lstat(path).st_ino)
+                    for path in ordered if os.path.isfile(path)]
+            self.assertEqual(keys, sorted(keys))
+
+        # other commands stay in their place, and a preview keeps the order
+        files = [self.write_file('bleachbit-test-locality%d' % x) for x in range(0, 5)]
+        function = Command.Function(None, lambda: 0, 'function')
+        commands = [Command.Delete(files[x]) for x in (4, 3, 2)] + [function] + \
+            [Command.Delete(files[x]) for x in (1, 0)]
+        for really_delete in (False, True):
+            worker = Worker(RecordingCallback(), really_delete, {'test': ['option1']})
+            worker.batch_size = 2
+            batches = list(worker.in_batches(iter(commands)))
+            self.assertEqual(len(batches), len(commands))
+            if not really_delete:
+                self.assertEqual(batches, commands)
+                continue
+            self.assertIs(batches[3], function)
+            self.assertEqual(set(batches[0:2]), set(commands[0:2]))
+            self.assertIs(batches[2], commands[2])
+            self.assertEqual(set(batches[4:]), set(commands[4:]))
+
+    @unittest.skipUnless('posix' == os.name, 'not applicable to Windows')
+    def test_optimize(self):
+        """Test dropping the commands which other commands cover"""
+        base = self.mkdtemp(prefix='bleachbit-test-worker-optimize')
+        top = os.path.join(base, 'top')
+        for dirname in ('a', 'b'):
+            os.makedirs(os.path.join(top, dirname))
+        other = os.path.join(base, 'other')
+        os.mkdir(other)
+        os.symlink(other, os.path.join(base, 'link'))
+        hard = [os.path.join(base, 'hard%d' % x) for x in (1, 2)]
+
+        def make_files():
+            for path in (os.path.join(top, 'a', 'file1'), os.path.join(top, 'a', 'file2'),
+                         os.path.join(top, 'b', 'file3'), os.path.join(other, 'file4'),
+                         hard[0]):
+                self.write_file(path, '123')
+            os.link(hard[0], hard[1])
+        make_files()
+        astrs = ['<action command="delete" search="file" path="%s"/>' % os.path.join(top, 'a', 'file1'),
+                 '<action command="delete" search="walk.all" path="%s"/>' % top,
+                 # in the folder
+                 '<action command="delete" search="file" path="%s"/>' % os.path.join(top, 'a', 'file2'),
+                 '<action command="delete" search="walk.all" path="%s"/>' % os.path.join(top, 'a'),
+                 '<action command="delete" search="file" path="%s"/>' % os.path.join(other, 'file4'),
+                 # the same file through a symlink
+                 '<action command="delete" search="file" path="%s"/>' % os.path.join(base, 'link', 'file4'),
+                 # hard links
+                 '<action command="shred" search="file" path="%s"/>' % hard[0],
+                 '<action command="shred" search="file" path="%s"/>' % hard[1]]
+        backends['test'] = TestCleaner.actions_to_cleaner(astrs)
+        operations = ['option%d' % x for x in range(1, 9)]
+
+        ui = RecordingCallback()
+        worker = Worker(ui, False, {'test': list(operations)})
+        worker.run_headless()
+        # each file once
+        self.assertEqual(worker.total_deleted, 8)
+        self.assertEqual(FileUtilities.overlap.n_redundant, 5)
+        self.assertIn('Redundant operations avoided: 5', ''.join(ui.lines))
+
+        worker = Worker(RecordingCallback(), True, {'test': list(operations)})
+        # shredding could rename directory b to the name of the empty
+        # directory a, which it replaces
+        old_shred = options.get('shred')
+        options.set('shred', False, commit=False)
+        try:
+            worker.run_headless()
+        finally:
+            options.set('shred', old_shred, commit=False)
+        self.assertEqual(worker.total_errors, 0)
+        self.assertEqual(worker.total_deleted, 8)
+        # the cleaners find the files when their option runs, so the
+        # files which another option deleted already have no commands,
+        # but the other name of the shredded file is not shredded again
+        self.assertEqual(FileUtilities.overlap.n_redundant, 1)
+        self.assertEqual(os.listdir(top), [])
+        self.assertEqual(os.listdir(other), [])
+        for path in hard:
+            self.assertNotExists(path)
+
+
+if __name__ == '__main__':
+    if 1 < len(sys.argv) and 'benchmark' == sys.argv[1]:
+        benchmark_headless()
+        sys.exit()
+    if 1 < len(sys.argv) and 'benchmark_locality' == sys.argv[1]:
+        benchmark_locality()
+        sys.exit()
+    unittest.main()
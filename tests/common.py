@@ -152,8 +152,14 @@ def validate_result(self, result, really_delete=False):
     # n_*
     self.assertIsInteger(result['n_deleted'])
     self.assertGreaterEqual(result['n_deleted'], 0)
-    self.assertLessEqual(result['n_deleted'], 1)
-    self.assertEqual(result['n_special'] + result['n_deleted'], 1)
+    if result.get('tree'):
+        # Command.DeleteTree reports the files under a directory it
+        # keeps
+        self.assertEqual(result['n_special'], 0)
+        really_delete = False
+    else:
+        self.assertLessEqual(result['n_deleted'], 1)
+        self.assertEqual(result['n_special'] + result['n_deleted'], 1)
     # size
     self.assertIsInstance(result['size'], (int, long, type(None),), "size is %s" % str(result['size']))
     # path